@@ -0,0 +1,177 @@
+"""
+An incrementally refreshed, in-memory index of a cluster's alerts.
+
+The first refresh pulls the alerts collection once, projected with
+fields= to the keys below. After that, each refresh asks only for alerts
+whose Alert/latest_timestamp is newer than the newest one seen. Ambari
+updates that timestamp every time an alert runs. To fetch only the
+alerts whose state changed, index on original_timestamp instead; Ambari
+sets it when the state changes. The index keeps the alerts by id and
+answers lookups by definition, host and state without going back to
+Ambari. Each refresh returns the alerts that changed:
+
+    index = amc.alert_index
+    amc.poll_alerts()                          # loads everything once
+    for change in amc.poll_alerts():           # only alerts updated since
+        print(change.definition_name, change.host_name, change.old, "->", change.new)
+    index.alerts(state="CRITICAL")
+"""
+import threading
+from collections import namedtuple
+
+# fields= projection of the alerts collection kept in the index
+ALERT_FIELDS = ("Alert/id,Alert/definition_id,Alert/definition_name,Alert/service_name,"
+                "Alert/component_name,Alert/host_name,Alert/label,Alert/state,Alert/text,"
+                "Alert/maintenance_state,Alert/latest_timestamp,Alert/original_timestamp")
+
+# fields= projection of the alert_definitions collection
+ALERT_DEFINITION_FIELDS = ("AlertDefinition/id,AlertDefinition/name,AlertDefinition/label,"
+                           "AlertDefinition/service_name,AlertDefinition/component_name,"
+                           "AlertDefinition/scope,AlertDefinition/interval,"
+                           "AlertDefinition/enabled")
+
+# A change to one alert seen by a refresh. `old` is None for a new alert and
+# `new` is None for one that disappeared (noticed by full refreshes only).
+AlertChange = namedtuple("AlertChange", ["alert_id", "definition_name", "host_name",
+                                         "old", "new", "timestamp"])
+
+
+class AlertIndex(object):
+    """ Alerts by id, with lookups by definition, host and state.
+
+        Attributes:
+            alerts_by_id: dict of alert id to its Alert dict.
+            timestamp_field: The Alert timestamp refreshes filter on,
+                latest_timestamp (every run) or original_timestamp (state changes).
+            latest_timestamp: Newest timestamp_field seen (ms), or None
+                before the first refresh.
+            overlap: Milliseconds re-read before latest_timestamp on each
+                refresh, so alerts the agents report late are not missed.
+            refreshes: Log of what each refresh fetched, newest last.
+    """
+
+    def __init__(self, overlap=10000, timestamp_field="latest_timestamp"):
+        super(AlertIndex, self).__init__()
+        self.alerts_by_id = {}
+        self.timestamp_field = timestamp_field
+        self.latest_timestamp = None
+        self.overlap = overlap
+        self.refreshes = []
+        # key -> set of alert ids, for each of the three lookups
+        self._by = {"definition_name": {}, "host_name": {}, "state": {}}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return(len(self.alerts_by_id))
+
+    def _drop(self, alert_id):
+        alert = self.alerts_by_id.pop(alert_id, None)
+        if alert is None:
+            return
+        for key, index in self._by.items():
+            ids = index.get(alert.get(key))
+            if ids is not None:
+                ids.discard(alert_id)
+                if not ids:
+                    del index[alert.get(key)]
+
+    def _add(self, alert):
+        self.alerts_by_id[alert["id"]] = alert
+        for key, index in self._by.items():
+            index.setdefault(alert.get(key), set()).add(alert["id"])
+
+    def load(self, items, full=False):
+        """
+        Merge the `items` of an alerts response into the index and return
+        the AlertChange of every alert that is new or changed state. With
+        `full`, `items` is the whole collection and alerts missing from it
+        are dropped.
+        """
+        changes = []
+        with self._lock:
+            seen = set()
+            for item in items:
+                alert = item["Alert"]
+                seen.add(alert["id"])
+                old = self.alerts_by_id.get(alert["id"])
+                if old is None or old.get("state") != alert.get("state"):
+                    changes.append(AlertChange(alert["id"], alert.get("definition_name"),
+                                               alert.get("host_name"),
+                                               None if old is None else old.get("state"),
+                                               alert.get("state"),
+                                               alert.get("latest_timestamp")))
+                self._drop(alert["id"])
+                self._add(alert)
+                if alert.get(self.timestamp_field) is not None:
+                    self.latest_timestamp = max(self.latest_timestamp or 0,
+                                                alert[self.timestamp_field])
+            if full:
+                for alert_id in set(self.alerts_by_id) - seen:
+                    old = self.alerts_by_id[alert_id]
+                    changes.append(AlertChange(alert_id, old.get("definition_name"),
+                                               old.get("host_name"), old.get("state"), None,
+                                               None))
+                    self._drop(alert_id)
+        return(sorted(changes, key=lambda c: c.alert_id))
+
+    def refresh(self, client, full=False):
+        """
+        Bring the index up to date from `client` and return the AlertChanges.
+
+        Parameters
+        ----------
+        client : AmbariClient
+        full : bool,
+            Fetch the whole collection, also dropping alerts that no longer
+            exist. The first refresh is always full and returns no changes.
+
+        Returns
+        -------
+        changes : list,
+            AlertChange of each alert that is new, changed state or (full
+            refreshes only) disappeared, ordered by alert id.
+        """
+        first = self.latest_timestamp is None
+        full = full or first
+        path = "alerts"
+        if not full:
+            path += "?Alert/{}>{}".format(self.timestamp_field,
+                                          self.latest_timestamp - self.overlap)
+        items = list(client.iter_collection(path, {"fields": ALERT_FIELDS}))
+        changes = self.load(items, full)
+        if self.latest_timestamp is None:
+            # No alerts yet; later refreshes are still incremental
+            self.latest_timestamp = 0
+        self.refreshes.append({"full": full, "fetched": len(items), "changed": len(changes)})
+        return([] if first else changes)
+
+    def alerts(self, definition=None, host=None, state=None):
+        """
+        Return the Alert dicts matching all of `definition` (name), `host`
+        and `state` that are given, ordered by alert id.
+        """
+        with self._lock:
+            ids = None
+            for key, value in (("definition_name", definition), ("host_name", host),
+                               ("state", state)):
+                if value is None:
+                    continue
+                matched = self._by[key].get(value, set())
+                ids = set(matched) if ids is None else ids & matched
+            if ids is None:
+                ids = set(self.alerts_by_id)
+            return([self.alerts_by_id[i] for i in sorted(ids)])
+
+    def definitions(self):
+        return(sorted(k for k in self._by["definition_name"] if k is not None))
+
+    def hosts(self):
+        """Return the hosts with alerts; cluster or service level alerts have no host."""
+        return(sorted(k for k in self._by["host_name"] if k is not None))
+
+    def counts(self, definition=None, host=None):
+        """Return a dict of state to the number of alerts in it."""
+        counts = {}
+        for alert in self.alerts(definition, host):
+            counts[alert.get("state")] = counts.get(alert.get("state"), 0) + 1
+        return(counts)
@@ -0,0 +1,434 @@
+'''
+Description:
+An asyncio counterpart to AmbariClient built on aiohttp.
+
+Every call goes through one pooled aiohttp session, and a semaphore bounds
+how many requests are in flight at once, so per-host and per-service
+operations can be fanned out with asyncio.gather without flooding the
+Ambari server.
+
+    async with AsyncAmbariClient(nnode, 8080, clr_name, cred, hdrs) as amc:
+        on_host = await amc.components_on_hosts("DATANODE", hosts)
+
+Requires python 3.5+ and aiohttp.
+'''
+import time
+import asyncio
+
+import aiohttp
+
+from ambari_client import AmbariClient
+from config_cache import ConfigCache
+from config_diff import ConfigDiff
+from json_codec import get_codec, DEFAULT_CODEC
+
+
+class AsyncResponse(object):
+    """
+    The parts of a requests.Response the client's callers rely on,
+    read eagerly from an aiohttp response.
+    """
+
+    def __init__(self, url, status_code, content, codec=DEFAULT_CODEC):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.codec = codec
+
+    @property
+    def text(self):
+        return(self.content.decode("utf-8"))
+
+    @property
+    def ok(self):
+        return(self.status_code < 400)
+
+    def json(self):
+        return(self.codec.loads(self.content))
+
+    def raise_for_status(self):
+        if not self.ok:
+            msg = "{} Error for url: {}".format(self.status_code, self.url)
+            raise(aiohttp.ClientError(msg))
+
+
+class AsyncAmbariClient(object):
+    """ An asyncio version of AmbariClient.
+
+        Attributes:
+            namenode: The namenode name in a string.
+            port: An integer with the port to ambari listens on .
+            cluster_name: The name of the cluster as a sting.
+            auth: A tuple containing two strings, the username and password.
+            hdrs: A dictionary containing the http headers.
+            timeout: Total timeout in seconds for each request. None waits forever.
+            endpoint: The base url that requests are submitted to.
+            max_concurrency: Maximum number of requests in flight at once.
+            config_cache: ConfigCache of configuration bodies keyed by (endpoint, type, tag).
+            codec: The json_codec codec bodies are encoded and decoded with.
+            topology_ttl: Seconds the cached services/components lists stay
+                valid before being fetched again. None never expires them.
+    """
+
+    def __init__(self, namenode, port, cluster_name, auth=None, headers=None,
+                 max_concurrency=20, pool_maxsize=None, timeout=None, topology_ttl=300,
+                 config_cache=None, codec=None):
+        super(AsyncAmbariClient, self).__init__()
+        self.namenode = namenode
+        self.port = port
+        self.cluster_name = cluster_name
+        self.auth = auth
+        self.hdrs = headers
+        self.timeout = timeout
+        self.endpoint = "http://{}:{}/api/v1/clusters/{}/".format(self.namenode,
+                                                                  self.port,
+                                                                  self.cluster_name)
+        self.max_concurrency = max_concurrency
+        self.pool_maxsize = pool_maxsize or max_concurrency
+        self.topology_ttl = topology_ttl
+        self._topology = {}
+        self.config_cache = config_cache if config_cache is not None else ConfigCache()
+        self.codec = codec if codec is not None and not isinstance(codec, str) \
+            else get_codec(codec)
+        self._session = None
+        self._semaphore = None
+
+    @property
+    def session(self):
+        """The shared aiohttp session, created on first use inside the running loop."""
+        if self._session is None or self._session.closed:
+            auth = aiohttp.BasicAuth(*self.auth) if self.auth else None
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize)
+            self._session = aiohttp.ClientSession(
+                auth=auth,
+                headers=self.hdrs,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return(self._session)
+
+    async def close(self):
+        """Close the session and release its pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return(self)
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def request(self, method, url, params=None, payload=None):
+        payload = self.codec.dumps(payload) if isinstance(payload, (dict, list)) else payload
+        session = self.session
+        async with self._semaphore:
+            async with session.request(method, url, params=params, data=payload) as res:
+                content = await res.read()
+        return(AsyncResponse(url, res.status, content, self.codec))
+
+    async def get(self, url, params=None):
+        return(await self.request("GET", url, params=params))
+
+    async def put(self, url, payload):
+        return(await self.request("PUT", url, payload=payload))
+
+    async def post(self, url, payload=None):
+        return(await self.request("POST", url, payload=payload))
+
+    async def delete(self, url):
+        return(await self.request("DELETE", url))
+
+    # Topology
+
+    async def get_services(self):
+        """Return a list of available services."""
+        response = await self.get(self.endpoint + "services/")
+        return([i["ServiceInfo"]["service_name"] for i in response.json()["items"]])
+
+    async def get_components(self, service=""):
+        """Return a list of available components."""
+        if service:
+            # Security Check
+            await self._has_service(service)
+
+        response = await self.get(self.endpoint + "components/")
+        return([i["ServiceComponentInfo"]["component_name"]
+                for i in response.json()["items"]
+                if not service or i["ServiceComponentInfo"]["service_name"] == service])
+
+    async def _cached_topology(self, name, fetch, refresh=False):
+        cached = self._topology.get(name)
+        if cached is not None and not refresh:
+            value, fetched_at = cached
+            if self.topology_ttl is None or time.time() - fetched_at < self.topology_ttl:
+                return(value)
+
+        value = await fetch()
+        self._topology[name] = (value, time.time())
+        return(value)
+
+    async def services(self, refresh=False):
+        """Return the cached list of services, fetching it if missing or expired."""
+        return(await self._cached_topology("services", self.get_services, refresh))
+
+    async def components(self, refresh=False):
+        """Return the cached list of components, fetching it if missing or expired."""
+        return(await self._cached_topology("components", self.get_components, refresh))
+
+    def invalidate_topology(self, name=None):
+        """
+        Drop the cached `name` list ("services" or "components"), or both if
+        `name` is None, so it is fetched again on next access.
+        """
+        if name is None:
+            self._topology.clear()
+        else:
+            self._topology.pop(name, None)
+
+    async def _has_service(self, service):
+        """
+        Checks `service` is in the services cache, refreshing it once
+        on a miss. If still not found raises a ValueError
+        """
+        if service in await self.services():
+            return
+        if service not in await self.services(refresh=True):
+            raise(ValueError("{} is not found in services.".format(service)))
+
+    async def _has_component(self, component):
+        """
+        Checks `component` is in the components cache, refreshing it once
+        on a miss. If still not found raises a ValueError
+        """
+        if component in await self.components():
+            return
+        if component not in await self.components(refresh=True):
+            raise(ValueError("{} is not found in components.".format(component)))
+
+    # State queries
+
+    async def get_service_info(self, service):
+        """Return the all the info for a service"""
+        await self._has_service(service)
+        response = await self.get(self.endpoint + "services/{}".format(service))
+        return(response.json())
+
+    async def get_service_state(self, service):
+        """Return the current state of a service as a string."""
+        return((await self.get_service_info(service))["ServiceInfo"]["state"])
+
+    async def get_all_service_states(self):
+        """
+        Return a dict mapping each service on the cluster to its state.
+        Uses a single request, asking Ambari for the state field only.
+        """
+        response = await self.get(self.endpoint + "services/",
+                                  params={"fields": "ServiceInfo/state"})
+        return(dict((i["ServiceInfo"]["service_name"], i["ServiceInfo"]["state"])
+                    for i in response.json()["items"]))
+
+    async def get_services_states(self):
+        """
+        Return a list of states for all the services installed on the cluster
+        """
+        states = await self.get_all_service_states()
+        return([states[s] for s in sorted(states)])
+
+    async def get_services_info(self, services=None):
+        """
+        Return a dict of service name to the full service info for `services`
+        (default all), fetched concurrently.
+        """
+        services = services if services is not None else await self.services()
+        infos = await asyncio.gather(*[self.get_service_info(s) for s in services])
+        return(dict(zip(services, infos)))
+
+    async def get_component_info(self, component):
+        """Return the all the info for a component"""
+        await self._has_component(component)
+        response = await self.get(self.endpoint + "components/{}".format(component))
+        return(response.json())
+
+    async def get_component_state(self, component):
+        """Return the current state of a component as a string."""
+        return((await self.get_component_info(component))["ServiceComponentInfo"]["state"])
+
+    async def get_all_component_states(self, service=""):
+        """
+        List the states of each component on the cluster, or of a given
+        service if `service` is passed, in a single request.
+        List contains tuples of component name, and state.
+        """
+        if service:
+            await self._has_service(service)
+
+        fields = "ServiceComponentInfo/state,ServiceComponentInfo/service_name"
+        response = await self.get(self.endpoint + "components/", params={"fields": fields})
+        return([(i["ServiceComponentInfo"]["component_name"], i["ServiceComponentInfo"]["state"])
+                for i in response.json()["items"]
+                if not service or i["ServiceComponentInfo"]["service_name"] == service])
+
+    async def component_on_host(self, component_name, host):
+        """Check is the component `component_name` on a given host."""
+        url = self.endpoint + "hosts/{}/host_components/".format(host)
+        res = await self.get(url)
+        host_components = [i["HostRoles"]["component_name"] for i in res.json()["items"]]
+        return(component_name in host_components)
+
+    async def components_on_hosts(self, component_name, hosts):
+        """
+        Check `component_name` against every host in `hosts` concurrently.
+        Returns a dict of host to bool.
+        """
+        found = await asyncio.gather(*[self.component_on_host(component_name, h)
+                                       for h in hosts])
+        return(dict(zip(hosts, found)))
+
+    # State changes
+
+    async def delete_component(self, component, host):
+        url = self.endpoint + "hosts/{}/host_components/{}".format(host, component)
+        return(await self.delete(url))
+
+    async def add_component(self, component, host):
+        url = self.endpoint + "hosts/{}/host_components/{}".format(host, component)
+        return(await self.post(url))
+
+    async def change_component_state(self, component, host, new_state):
+        url = self.endpoint + "hosts/{}/host_components/{}".format(host, component)
+        data = {"RequestInfo": {"context": "Change {} state".format(component)},
+                "HostRoles": {"state": new_state}}
+        return(await self.put(url, data))
+
+    async def start_component(self, component, host):
+        return(await self.change_component_state(component, host, "STARTED"))
+
+    async def stop_component(self, component, host):
+        return(await self.change_component_state(component, host, "INSTALLED"))
+
+    async def change_component_states(self, component, hosts, new_state):
+        """Change the state of `component` on every host in `hosts` concurrently."""
+        return(await asyncio.gather(*[self.change_component_state(component, h, new_state)
+                                      for h in hosts]))
+
+    async def _set_service_state(self, service, state, context):
+        payload = {"RequestInfo": {"context": context},
+                   "Body": {"ServiceInfo": {"state": state}}}
+        url = self.endpoint + "services/{}".format(service) if service else self.endpoint + "services/"
+        return(await self.put(url, payload))
+
+    async def stop_service(self, service):
+        """Stop a service. The service name must be capital letters."""
+        await self._has_service(service)
+        return(await self._set_service_state(service, "INSTALLED", "Stopping {}".format(service)))
+
+    async def start_service(self, service):
+        """Start a service. The service name must be capital letters."""
+        await self._has_service(service)
+        return(await self._set_service_state(service, "STARTED", "Starting {}".format(service)))
+
+    async def stop_all_services(self):
+        """Stops all services not currently in the INSTALLED state"""
+        return(await self._set_service_state(None, "INSTALLED", "Stopping all services"))
+
+    async def start_all_services(self):
+        """Starts all services not currently in the STARTED state"""
+        return(await self._set_service_state(None, "STARTED", "Starting all services"))
+
+    # Configurations
+
+    async def get_current_tag(self, conf_name):
+        """Return the tag for current configurations of `conf_name`."""
+        payload = {"fields": "Clusters/desired_configs/{}".format(conf_name)}
+        response = await self.get(self.endpoint, params=payload)
+        return(response.json()["Clusters"]["desired_configs"][conf_name]["tag"])
+
+    async def get_configurations(self, conf_name, tag):
+        """Get the `conf_name` configurations identified by tag."""
+        confs = self.config_cache.get(self.endpoint, conf_name, tag)
+        if confs is not None:
+            return(confs)
+
+        payload = {"type": conf_name, "tag": tag}
+        response = await self.get(self.endpoint + "configurations", params=payload)
+        confs = response.json()["items"][0]
+        self.config_cache.put(self.endpoint, conf_name, tag, confs)
+        return(confs)
+
+    async def get_current_tags(self):
+        """Return the current tag of every configuration group in one request."""
+        response = await self.get(self.endpoint, params={"fields": "Clusters/desired_configs"})
+        desired = response.json()["Clusters"]["desired_configs"]
+        return(dict((conf_name, desired[conf_name]["tag"]) for conf_name in desired))
+
+    async def modify_configurations(self, conf_name, **kwargs):
+        """
+        Returns the properties of `conf_name` with the values in kwargs applied.
+        Keys not already in the configuration group are skipped.
+        """
+        tag = await self.get_current_tag(conf_name)
+        properties = (await self.get_configurations(conf_name, tag))["properties"]
+        for k in kwargs:
+            if k in properties:
+                properties[k] = kwargs[k]
+            else:
+                print("WARNING: Key, {}, not found in {}. Skipping.".format(k, conf_name))
+        return(properties)
+
+    async def diff_conf(self, conf_name, **kwargs):
+        """
+        Compare the current `conf_name` configurations with the values in
+        kwargs applied. Returns (ConfigDiff, proposed properties).
+        """
+        tag = await self.get_current_tag(conf_name)
+        current = (await self.get_configurations(conf_name, tag))["properties"]
+        properties, _ = AmbariClient.apply_changes(conf_name, dict(current), kwargs)
+        return(ConfigDiff.between(conf_name, current, properties), properties)
+
+    async def put_new_conf(self, conf_name, **kwargs):
+        """
+        Make a put request to the ambari server
+        to update a configuration group with new values.
+        Nothing is sent, and the response is None, if no value would change.
+        """
+        config_note = AmbariClient.make_conf_note(**kwargs)
+        tag = "version{}".format(int(time.time()))
+        diff, properties = await self.diff_conf(conf_name, **kwargs)
+        if not diff:
+            return(config_note, None)
+        payload = [{"Clusters": {
+            "desired_config": [{
+                "tag": tag,
+                "type": conf_name,
+                "properties": properties,
+                "service_config_version_note": config_note}]}}]
+        response = await self.put(self.endpoint, payload)
+        if response.ok:
+            self.config_cache.put(self.endpoint, conf_name, tag,
+                                  {"type": conf_name, "tag": tag, "properties": properties})
+        return(config_note, response)
+
+    # Blueprint and metrics
+
+    async def get_blueprint(self):
+        """Return the Hadoop Blueprint as a json object."""
+        response = await self.get(self.endpoint, params={"format": "blueprint"})
+        return(response.json())
+
+    async def get_jmx(self, host=None, port=8080, params=None):
+        """Query the JMX endpoint of `host`."""
+        host = host if host else self.namenode
+        payload = {"qry": params} if params else None
+        return(await self.get("http://{}:{}/jmx".format(host, port), params=payload))
+
+    async def get_live_nodes(self, port=50070):
+        """
+        Get the list of live Nodes from the cluster.
+        Requires port 50070 to be open.
+        """
+        payload = "Hadoop:service=NameNode,name=NameNodeInfo"
+        response = await self.get_jmx(port=port, params=payload)
+        live_nodes = response.json()["beans"][0]["LiveNodes"]
+        # LiveNodes is keyed by "host:port" (50010, or 9866 on Hadoop 3)
+        return([nodename.rsplit(":", 1)[0] for nodename in self.codec.loads(live_nodes)])
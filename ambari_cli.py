@@ -0,0 +1,357 @@
+"""
+Command-line runner for batches of AmbariClient operations.
+
+Connection settings come from an INI file (~/.ambari/ambari.cfg, or
+$AMBARI_CONFIG, or --config) with one section per cluster:
+
+    [DEFAULT]
+    port = 8080
+    user = admin
+
+    [dokcl3]
+    host = dok31.northeurope.cloudapp.azure.com
+    # cluster defaults to the section name; password to $AMBARI_PASSWORD or a prompt
+    snapshot = ~/.ambari/dokcl3.db
+
+A pipeline file is a JSON list of steps run in one process through one
+client, so the session and the topology caches stay warm from step to
+step. A step is {"op": <AmbariClient method>, "args": [...], "kwargs": {...}}
+with an optional "name" and "ignore_errors". A nested list is a stage of
+independent steps that run concurrently; stages run in order:
+
+    [[{"op": "get_all_service_states"}, {"op": "get_current_tags"}],
+     {"op": "put_new_confs", "args": [{"hive-site": {"hive.execution.engine": "tez"}}]},
+     {"op": "restart_stale", "kwargs": {"batch_size": 10}}]
+
+Each finished step is written to stdout as a JSON line; whatever the
+client prints goes to stderr.
+
+    python ambari_cli.py run pipeline.json
+    python ambari_cli.py --cluster dokcl3 call get_service_state HDFS
+    python ambari_cli.py experiment trials.jsonl 3 17 42
+
+Startup is kept short: operation names are checked against the source
+of ambari_client without importing it, and requests, the client and its
+feature modules are only imported, and the password only asked for,
+when the first step runs. Nothing is sent to Ambari before then.
+"""
+import os
+import sys
+import json
+import time
+import ast
+import getpass
+import types
+import argparse
+
+try:
+    from configparser import ConfigParser
+except ImportError:
+    from ConfigParser import SafeConfigParser as ConfigParser
+
+DEFAULT_CONFIG = "~/.ambari/ambari.cfg"
+
+# Settings converted to numbers, and their defaults
+INT_SETTINGS = {"port": 8080, "page_size": 500, "pool_maxsize": 10}
+FLOAT_SETTINGS = {"timeout": None, "topology_ttl": 300}
+
+# Public AmbariClient method names, read once by client_operations
+_OPERATIONS = None
+
+
+def read_config(path=None, cluster=None):
+    """
+    Return the settings of `cluster` (the only section when there is
+    just one) from the config file at `path` as a dict.
+
+    Keys: host, port, cluster, user, password, timeout, topology_ttl,
+    page_size, pool_maxsize, snapshot, codec (json or orjson) and
+    compress (yes or no). Only host is required.
+    """
+    path = os.path.expanduser(path or os.environ.get("AMBARI_CONFIG") or DEFAULT_CONFIG)
+    parser = ConfigParser()
+    if not parser.read(path):
+        raise(ValueError("Cannot read config file {}".format(path)))
+    sections = parser.sections()
+    if cluster is None:
+        if len(sections) != 1:
+            raise(ValueError("Choose a cluster with --cluster, one of: {}".format(
+                ", ".join(sections))))
+        cluster = sections[0]
+    if not parser.has_section(cluster):
+        raise(ValueError("No section [{}] in {}".format(cluster, path)))
+
+    settings = dict(parser.items(cluster))
+    if "host" not in settings:
+        raise(ValueError("Section [{}] of {} has no host".format(cluster, path)))
+    settings.setdefault("cluster", cluster)
+    settings.setdefault("user", "admin")
+    for key, default in INT_SETTINGS.items():
+        settings[key] = int(settings[key]) if key in settings else default
+    for key, default in FLOAT_SETTINGS.items():
+        settings[key] = float(settings[key]) if key in settings else default
+    settings["compress"] = parser.getboolean(cluster, "compress") \
+        if "compress" in settings else True
+    return(settings)
+
+
+def load_pipeline(path):
+    """
+    Read a pipeline file and return its stages: a list of lists of step
+    dicts, where the steps of a stage are independent of each other.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data["steps"]
+    stages = []
+    for entry in data:
+        steps = entry if isinstance(entry, list) else [entry]
+        for step in steps:
+            if not isinstance(step, dict) or "op" not in step:
+                raise(ValueError("Every step needs an op: {!r}".format(step)))
+        stages.append(steps)
+    return(stages)
+
+
+def client_operations():
+    """
+    Return the set of public AmbariClient method names. They are read from
+    the source of ambari_client.py, next to this file, so that checking a
+    pipeline imports neither the client nor requests.
+    """
+    global _OPERATIONS
+    if _OPERATIONS is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ambari_client.py")
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        names = set()
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef) or node.name != "AmbariClient":
+                continue
+            for item in node.body:
+                if not isinstance(item, ast.FunctionDef) or item.name.startswith("_"):
+                    continue
+                # Properties and their setters are not operations
+                if any(isinstance(d, ast.Name) and d.id == "property" or
+                       isinstance(d, ast.Attribute) and d.attr == "setter"
+                       for d in item.decorator_list):
+                    continue
+                names.add(item.name)
+        _OPERATIONS = names
+    return(_OPERATIONS)
+
+
+def to_json(value, client):
+    """json.dumps default for what `client`'s methods return."""
+    if hasattr(value, "status_code"):
+        # A requests.Response: keep the status and the Ambari request it started
+        return({"status": value.status_code, "request_id": client.get_request_id(value)})
+    if hasattr(value, "to_dict"):
+        return(value.to_dict())
+    if isinstance(value, (set, frozenset)):
+        return(sorted(value, key=str))
+    return(str(value))
+
+
+class BatchRunner(object):
+    """ Runs pipeline steps against one lazily built AmbariClient.
+
+        Attributes:
+            settings: Connection settings, as returned by read_config.
+            jobs: Most steps of a stage run at once.
+            out: File each step's JSON line is written to.
+            keep_going: Carry on with later stages after a step fails.
+            records: One dict per finished step, in completion order.
+            failed: True once a step without "ignore_errors" has failed.
+    """
+
+    def __init__(self, settings, jobs=4, out=None, keep_going=False):
+        super(BatchRunner, self).__init__()
+        self.settings = settings
+        self.jobs = jobs
+        self.out = out if out is not None else sys.stdout
+        self.keep_going = keep_going
+        self.records = []
+        self.failed = False
+        self._client = None
+        self._pool = None
+
+    @property
+    def client(self):
+        """The AmbariClient, built (and its snapshot loaded) on first use."""
+        if self._client is None:
+            from ambari_client import AmbariClient
+            s = self.settings
+            password = s.get("password") or os.environ.get("AMBARI_PASSWORD") or \
+                getpass.getpass("Ambari password for {}@{}: ".format(s["user"], s["host"]))
+            self._client = AmbariClient(s["host"], s["port"], s["cluster"],
+                                        (s["user"], password), {"X-Requested-By": "ambari"},
+                                        timeout=s["timeout"], topology_ttl=s["topology_ttl"],
+                                        page_size=s["page_size"],
+                                        pool_maxsize=s["pool_maxsize"],
+                                        codec=s.get("codec"), compress=s["compress"])
+            if s.get("snapshot"):
+                from cluster_snapshot import ClusterSnapshot
+                snap = ClusterSnapshot(s["snapshot"])
+                snap.refresh(self._client)
+                snap.load_into(self._client)
+                snap.close()
+        return(self._client)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._client is not None:
+            self._client.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def check(stages):
+        """Raise a ValueError naming any step whose op is not a public AmbariClient method."""
+        operations = client_operations()
+        for steps in stages:
+            for step in steps:
+                if step["op"] not in operations:
+                    raise(ValueError("Unknown operation {}".format(step["op"])))
+
+    def run_step(self, step):
+        """Run one step and return its record; errors are caught into the record."""
+        record = {"step": step.get("name", step["op"]), "op": step["op"]}
+        start = time.time()
+        try:
+            method = getattr(self.client, step["op"])
+            result = method(*step.get("args", []), **step.get("kwargs", {}))
+            record["result"] = list(result) if isinstance(result, types.GeneratorType) else result
+            record["error"] = None
+        except Exception as e:
+            record["error"] = "{}: {}".format(type(e).__name__, e)
+        record["seconds"] = round(time.time() - start, 3)
+        return(record)
+
+    def _write(self, record):
+        self.records.append(record)
+        try:
+            line = json.dumps(record, default=lambda v: to_json(v, self._client),
+                              sort_keys=True)
+        except TypeError:
+            # e.g. a dict keyed by tuples
+            line = json.dumps(dict(record, result=repr(record.get("result"))), sort_keys=True)
+        self.out.write(line + "\n")
+        self.out.flush()
+
+    def run(self, stages):
+        """
+        Run the stages in order, the steps of each stage concurrently, and
+        return the records. Stops after a stage with a failed step unless
+        the step has "ignore_errors" or keep_going is set.
+        """
+        self.check(stages)
+
+        def run_step(step):
+            return(step, self.run_step(step))
+
+        for steps in stages:
+            if len(steps) == 1 or self.jobs <= 1:
+                results = (run_step(step) for step in steps)
+            else:
+                if self._pool is None:
+                    from multiprocessing.pool import ThreadPool
+                    self._pool = ThreadPool(self.jobs)
+                # The client is built once, before the workers share it
+                self.client
+                results = self._pool.imap_unordered(run_step, steps)
+            stage_failed = False
+            for step, record in results:
+                self._write(record)
+                if record["error"] is not None and not step.get("ignore_errors"):
+                    stage_failed = True
+            self.failed = self.failed or stage_failed
+            if stage_failed and not self.keep_going:
+                break
+        return(self.records)
+
+
+def parse_arg(value):
+    """A command-line argument as JSON if it parses (numbers, lists, dicts), else as a string."""
+    try:
+        return(json.loads(value))
+    except ValueError:
+        return(value)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Run Ambari operations from the command line.")
+    parser.add_argument("-c", "--config", help="settings file (default $AMBARI_CONFIG or {})"
+                        .format(DEFAULT_CONFIG))
+    parser.add_argument("--cluster", help="section of the settings file to use")
+    parser.add_argument("-j", "--jobs", type=int, default=4,
+                        help="steps of a stage run at once (default 4)")
+    parser.add_argument("-k", "--keep-going", action="store_true",
+                        help="run later stages even after a step fails")
+    commands = parser.add_subparsers(dest="command")
+
+    run = commands.add_parser("run", help="run one or more pipeline files")
+    run.add_argument("pipelines", nargs="+", metavar="PIPELINE")
+    run.add_argument("--check", action="store_true",
+                     help="only validate the pipelines, without connecting")
+
+    call = commands.add_parser("call", help="run a single client method")
+    call.add_argument("op")
+    call.add_argument("args", nargs="*", type=parse_arg,
+                      help="positional arguments, parsed as JSON where possible")
+
+    experiment = commands.add_parser("experiment", help="run blueprint configuration trials")
+    experiment.add_argument("log", help="file the trials are logged to, one JSON line each")
+    experiment.add_argument("indices", nargs="*", type=int,
+                            help="blueprint indices to try (default: one at random)")
+    return(parser)
+
+
+def main(argv=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("a command is required")
+
+    try:
+        if args.command == "run":
+            stages = [stage for path in args.pipelines for stage in load_pipeline(path)]
+        elif args.command == "call":
+            stages = [[{"op": args.op, "args": args.args}]]
+        if args.command != "experiment":
+            BatchRunner.check(stages)
+        if args.command == "run" and args.check:
+            print("{} stages, {} steps OK".format(len(stages), sum(len(s) for s in stages)))
+            return(0)
+        settings = read_config(args.config, args.cluster)
+    except (ValueError, IOError) as e:
+        parser.error(str(e))
+
+    # Records go to stdout; anything the client prints goes to stderr
+    out, sys.stdout = sys.stdout, sys.stderr
+    try:
+        with BatchRunner(settings, args.jobs, out, args.keep_going) as runner:
+            if args.command == "experiment":
+                from experiment import ExperimentRunner
+                indices = args.indices or [runner.client.blueprint_changes()[0]]
+                trials = ExperimentRunner(runner.client, log=args.log)
+                trials.run(indices)
+                summary = trials.summary()
+                out.write(json.dumps(summary, sort_keys=True) + "\n")
+                return(1 if summary["failed"] else 0)
+            runner.run(stages)
+            return(1 if runner.failed else 0)
+    finally:
+        sys.stdout = out
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,18 +10,16 @@ between you and the Ambari API.
 
 TODO:
 
-1. Add curl -u admin:admin -H "X-Requested-By: ambari" \
-     http://dok31.northeurope.cloudapp.azure.com:8080/api/v1/clusters/dokcl3/alert_definitions/
-    Add method to add alert definition
+1. DONE: `create_alert_definition(s)`, `update_alert_definition` and
+    `get_alert_definitions` wrap alert_definitions/, and `poll_alerts`
+    keeps an AlertIndex of the alerts up to date.
 
-2. Add `def query([get|post|delete]):`
+2. DONE: `def query(rtype, url, ...)` is the shared request path.
 
-3. Add ConfigParser (py2.6+) / configparser (py3.+) functionality to the programme
-    # Import ConfigParser
-    # from configparser import ConfigParser
+3. DONE: ambari_cli.py reads connection settings with ConfigParser.
 
-4. Add a proper command-line option parser like argparse
-    # import argparse
+4. DONE: ambari_cli.py parses its command line with argparse and runs
+    pipeline files of operations.
 
 5. Consider separating the more basic functionality from the complex stuff
     Two objects or a sub object
@@ -37,17 +35,48 @@ TODO:
 import sys
 import time
 import random
-import json
 import itertools
+import functools
 
 import requests
-
+from requests.adapters import HTTPAdapter
+
+# Optional: parse collection pages item by item instead of all at once
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from alerts import AlertIndex, ALERT_DEFINITION_FIELDS
+from config_cache import ConfigCache
+from json_codec import get_codec
+from config_diff import ConfigDiff, diff_versions, diff_history
+from topology_index import TopologyIndex
+from instrumentation import instrument_operations
+from resilience import RetryPolicy
+from watch import Watch
+from jmx_collector import collect_jmx
+from make_blueprint_index import BLUEPRINT_SPACE
+
+
+# Projection used to build the TopologyIndex
+HOST_INDEX_FIELDS = ("Hosts/host_name,"
+                     "host_components/HostRoles/component_name,"
+                     "host_components/HostRoles/state")
+
+# Final request states other than COMPLETED
+FAILED_REQUEST_STATES = ("FAILED", "TIMEDOUT", "ABORTED", "SKIPPED_FAILED")
+
+# Hosts named in one bulk host component request, keeping the predicate
+# in the url well under Ambari's header size limit
+BULK_CHUNK_SIZE = 100
 
 # Handle python 2 and python 3 versions
 if sys.version_info.major == 2:
     input = raw_input
 
 
+@instrument_operations
 class AmbariClient(object):
     """ A class containing some simple functions that simplify the interaction
         between you and the Ambari API.
@@ -58,71 +87,378 @@ class AmbariClient(object):
             cluster_name: The name of the cluster as a sting.
             auth: A tuple containing two strings, the username and password.
             hdrs: A dictionary containing the http headers.
+            timeout: Default timeout in seconds (or a (connect, read) tuple)
+                applied to every request. None waits forever.
             endpoint: The base url that requests are submitted to.
-            services: A list of services on the hadoop cluster
-            components: A list of components on the hadoop cluster
+            session: The pooled requests.Session every call is sent through.
+                It asks for gzip-compressed responses unless compress is False.
+                A session given to the constructor (e.g. by a Fleet) is shared
+                and is not closed by close().
+            config_cache: ConfigCache of configuration bodies keyed by (endpoint, type, tag).
+            page_size: Number of items requested per page when walking collections.
+            instrumentation: Optional Instrumentation recording every call made.
+            codec: The json_codec codec bodies are encoded and decoded with,
+                orjson if installed unless another is given (e.g. codec="json").
+            retry: RetryPolicy for transient failures of Ambari API requests.
+                Defaults to RetryPolicy(); RetryPolicy(max_attempts=1) turns
+                retrying off.
+            limiter: Optional AdaptiveLimiter capping concurrent Ambari requests.
+            topology_ttl: Seconds the cached services/components lists stay
+                valid before being fetched again. None never expires them.
+            services: A list of services on the hadoop cluster,
+                fetched on first access and cached for topology_ttl seconds.
+            components: A list of components on the hadoop cluster,
+                fetched on first access and cached for topology_ttl seconds.
+            topology_index: A TopologyIndex of host <-> component placement,
+                fetched on first access and cached for topology_ttl seconds.
+            alert_index: AlertIndex of the cluster's alerts, filled and kept
+                up to date by poll_alerts.
     """
 
-    def __init__(self, namenode, port, cluster_name, auth=None, headers=None):
+    def __init__(self, namenode, port, cluster_name, auth=None, headers=None,
+                 pool_connections=10, pool_maxsize=10, timeout=None, keep_alive=True,
+                 topology_ttl=300, config_cache=None, page_size=500, instrumentation=None,
+                 retry=None, limiter=None, session=None, codec=None, compress=True):
         super(AmbariClient, self).__init__()
         self.namenode = namenode
         self.port = port
         self.cluster_name = cluster_name
         self.auth = auth
         self.hdrs = headers
+        self.timeout = timeout
         self.endpoint = "http://{}:{}/api/v1/clusters/{}/".format(self.namenode,
                                                                   self.port,
                                                                   self.cluster_name)
-        self.services = self.get_services()
-        self.components = self.get_components()
+        # A session passed in is shared with other clients, so auth and
+        # headers go with each request rather than on the session, and the
+        # pool, keep_alive and compress settings are those it was built with
+        if session is not None and (not keep_alive or not compress):
+            raise(ValueError("keep_alive and compress apply to the client's own session; "
+                             "pass them to make_session for a shared one"))
+        self._shared_session = session is not None
+        self.session = session if session is not None else \
+            self.make_session(auth, headers, pool_connections, pool_maxsize, keep_alive,
+                              compress)
+        self.topology_ttl = topology_ttl
+        # name -> (value, time fetched); filled lazily by the properties below
+        self._topology = {}
+        self.config_cache = config_cache if config_cache is not None else ConfigCache()
+        self.page_size = page_size
+        self.instrumentation = instrumentation
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.limiter = limiter
+        self.alert_index = AlertIndex()
+        self.codec = codec if codec is not None and not isinstance(codec, str) \
+            else get_codec(codec)
+
+    def _cached_topology(self, name, fetch):
+        """
+        Return the cached `name` list, calling `fetch` to (re)load it
+        when it is missing or older than self.topology_ttl.
+        """
+        cached = self._topology.get(name)
+        if cached is not None:
+            value, fetched_at = cached
+            if self.topology_ttl is None or time.time() - fetched_at < self.topology_ttl:
+                return(value)
+
+        value = fetch()
+        self._topology[name] = (value, time.time())
+        return(value)
+
+    @property
+    def services(self):
+        return(self._cached_topology("services", self.get_services))
+
+    @services.setter
+    def services(self, value):
+        self.seed_topology("services", value)
+
+    @property
+    def components(self):
+        return(self._cached_topology("components", self.get_components))
+
+    @components.setter
+    def components(self, value):
+        self.seed_topology("components", value)
+
+    @property
+    def topology_index(self):
+        index = self._cached_topology("topology_index", self.get_topology_index)
+        if index.dirty:
+            self.refresh_topology_index(index.dirty)
+        return(index)
+
+    @topology_index.setter
+    def topology_index(self, value):
+        self.seed_topology("topology_index", value)
+
+    def get_topology_index(self):
+        """
+        Return a TopologyIndex of every host's components and their states,
+        built from a single request.
+        """
+        return(TopologyIndex(self.iter_hosts(HOST_INDEX_FIELDS)))
+
+    def refresh_topology_index(self, hosts):
+        """
+        Fetch the entries of `hosts` again and update the topology index in
+        place, BULK_CHUNK_SIZE hosts per request. When more than half the
+        indexed hosts are to be fetched, the whole hosts collection is
+        reloaded instead, which takes fewer and shorter requests.
+        """
+        hosts = sorted(hosts)
+        cached = self._topology.get("topology_index")
+        if cached is None or not hosts:
+            return
+        index = cached[0]
+        if 2 * len(hosts) > len(index):
+            index.load(self.iter_hosts(HOST_INDEX_FIELDS), sorted(set(index.hosts) | set(hosts)))
+            return
+        for i in range(0, len(hosts), BULK_CHUNK_SIZE):
+            chunk = hosts[i:i + BULK_CHUNK_SIZE]
+            path = "hosts?Hosts/host_name.in({})".format(",".join(chunk))
+            index.load(self.iter_collection(path, {"fields": HOST_INDEX_FIELDS}), chunk)
+
+    def _host_changed(self, response, host):
+        """Mark `host` dirty in the topology index if `response` changed it."""
+        cached = self._topology.get("topology_index")
+        if cached is not None and response.ok:
+            cached[0].mark_dirty(host)
+
+    def seed_topology(self, name, value, fetched_at=None):
+        """
+        Cache `value` as the `name` list ("services", "components" or
+        "topology_index"), as if fetched at `fetched_at` (a time.time()
+        value, default now). Older data expires sooner, after
+        self.topology_ttl seconds from `fetched_at`.
+        """
+        self._topology[name] = (value, fetched_at if fetched_at is not None else time.time())
+
+    def invalidate_topology(self, name=None):
+        """
+        Drop the cached `name` ("services", "components" or "topology_index"),
+        or all of them if `name` is None, so it is fetched again on next access.
+        """
+        if name is None:
+            self._topology.clear()
+        else:
+            self._topology.pop(name, None)
+
+    def iter_collection(self, path, params=None, page_size=None):
+        """
+        Yield the items of the collection at self.endpoint + `path`,
+        walking Ambari's page_size/from pagination so only one page is
+        held at a time. If ijson is installed each page is also parsed
+        item by item as it streams in.
+
+        Parameters
+        ----------
+        path : string
+            The collection, relative to the endpoint (e.g. "hosts", "alerts").
+            May include a predicate query string.
+        params : dict
+            Extra query parameters, e.g. fields= projections.
+        page_size : int
+            Items per request, defaults to self.page_size.
+
+        Yields
+        ------
+        item : dict
+            One entry of the collection's "items" list.
+        """
+        page_size = page_size or self.page_size
+        url = self.endpoint + path
+        start = 0
+        while True:
+            page = dict(params or {})
+            page.update({"page_size": page_size, "from": start})
+            count = 0
+            for item in self._iter_page(url, page):
+                count += 1
+                yield item
+            if count < page_size:
+                return
+            start += count
+
+    def _iter_page(self, url, params):
+        """Yield the items of a single page of a collection."""
+        if ijson is None:
+            response = self.get(url, params=params)
+            response.raise_for_status()
+            for item in self.decode(response)["items"]:
+                yield item
+            return
+
+        response = self.get(url, params=params, stream=True)
+        try:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            for item in ijson.items(response.raw, "items.item"):
+                yield item
+        finally:
+            response.close()
+
+    def iter_hosts(self, fields=None):
+        """Yield the items of the hosts collection, optionally projected to `fields`."""
+        params = {"fields": fields} if fields else None
+        return(self.iter_collection("hosts", params))
+
+    def iter_host_components(self, fields=None, **predicates):
+        """
+        Yield the items of the cluster-wide host_components collection.
+        Keyword arguments are HostRoles predicates, e.g. stale_configs="true".
+        """
+        params = dict(("HostRoles/{}".format(k), predicates[k]) for k in predicates)
+        if fields:
+            params["fields"] = fields
+        return(self.iter_collection("host_components", params))
+
+    def iter_alerts(self, fields=None):
+        """Yield the items of the alerts collection."""
+        params = {"fields": fields} if fields else None
+        return(self.iter_collection("alerts", params))
+
+    def iter_alert_definitions(self, fields=None):
+        """Yield the items of the alert_definitions collection."""
+        params = {"fields": fields} if fields else None
+        return(self.iter_collection("alert_definitions", params))
+
+    def poll_alerts(self, full=False):
+        """
+        Update self.alert_index with the alerts changed since the last poll
+        (everything on the first) and return their AlertChanges.
+        See AlertIndex.refresh.
+        """
+        return(self.alert_index.refresh(self, full))
+
+    def iter_requests(self, fields=None):
+        """Yield the items of the requests collection."""
+        params = {"fields": fields} if fields else None
+        return(self.iter_collection("requests", params))
 
     def get_services(self):
         """Return a list of available services."""
-        url = self.endpoint + "services/"
-        response = requests.get(url, headers=self.hdrs, auth=self.auth)
-        services = [i["ServiceInfo"]["service_name"] for i in response.json()["items"]]
+        services = [i["ServiceInfo"]["service_name"] for i in self.iter_collection("services/")]
 
         return(services)
 
     def get_components(self, service=""):
         """Return a list of available components."""
-        if service is not "":
+        if service:
             # Security Check
             self._has_service(service)
 
-        url = self.endpoint + "components/"
-
-        response = requests.get(url, headers=self.hdrs, auth=self.auth)
+        params = {"fields": "ServiceComponentInfo/service_name"} if service else None
         # If a service is specified, filter for relevant components
-        if service:
-            components = []
-            for i in response.json()["items"]:
-                if i["ServiceComponentInfo"]["service_name"] == service:
-                    components.append(i["ServiceComponentInfo"]["component_name"])
-            return(components)
-
-        components = [i["ServiceComponentInfo"]["component_name"] for i in response.json()["items"]]
+        components = [i["ServiceComponentInfo"]["component_name"]
+                      for i in self.iter_collection("components/", params)
+                      if not service or i["ServiceComponentInfo"]["service_name"] == service]
         return(components)
 
-    def query(self, rtype):
-        pass
+    @staticmethod
+    def make_session(auth=None, headers=None, pool_connections=10,
+                     pool_maxsize=10, keep_alive=True, compress=True):
+        """
+        Build the pooled session shared by every call the client makes.
+
+        Auth and default headers are set once on the session, and the
+        connection pool keeps sockets to the Ambari server open between
+        calls so each request skips the TCP handshake.
+
+        Parameters
+        ----------
+        auth : tuple
+            (username, password) used for basic auth.
+        headers : dict
+            Headers sent with every request (e.g. X-Requested-By).
+        pool_connections : int
+            Number of host pools to cache.
+        pool_maxsize : int
+            Maximum number of connections kept open per host.
+        keep_alive : bool
+            If False, ask the server to close the connection after each call.
+        compress : bool
+            Ask for gzip-compressed responses (the default), or plain ones.
 
-    def get(self, url):
-        response = requests.get(url, auth=self.auth, headers=self.hdrs)
+        Returns
+        -------
+        session : requests.Session
+        """
+        session = requests.Session()
+        session.auth = auth
+        if headers:
+            session.headers.update(headers)
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        # Ambari gzips responses over 10 KiB when asked; on a fast network
+        # the compression can cost more than it saves
+        session.headers["Accept-Encoding"] = "gzip, deflate" if compress else "identity"
+
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return(session)
+
+    def close(self):
+        """Close the session and release its pooled connections."""
+        if not self._shared_session:
+            self.session.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def query(self, rtype, url, params=None, payload=None, stream=False, timeout=None,
+              idempotent=None):
+        """
+        Send a `rtype` (GET, PUT, POST, DELETE) request through the session.
+        Every call the client makes goes through here, and is recorded
+        by self.instrumentation if set. `timeout` overrides self.timeout.
+
+        Failed requests to the Ambari API are retried by self.retry;
+        `idempotent` overrides whether the method is safe to repeat (see
+        RetryPolicy.call). Requests to the Ambari API also wait for a slot
+        of self.limiter if set. Other urls, such as /jmx scrapes, are sent
+        once and keep their own timeout.
+        """
+        payload = self.codec.dumps(payload) if isinstance(payload, (dict, list)) else payload
+        timeout = timeout if timeout is not None else self.timeout
+        kwargs = {"params": params, "data": payload, "timeout": timeout, "stream": stream}
+        if self._shared_session:
+            kwargs.update(auth=self.auth, headers=self.hdrs)
+
+        send = self.session.request
+        if self.instrumentation is not None:
+            send = functools.partial(self.instrumentation.call, send)
+        ambari = url.startswith(self.endpoint)
+        if self.limiter is not None and ambari:
+            send = self.limiter.wrap(send)
+        if self.retry is None or not ambari:
+            return(send(rtype, url, **kwargs))
+        return(self.retry.call(send, rtype, url, idempotent=idempotent, **kwargs))
+
+    def decode(self, response):
+        """Parse the JSON body of `response` with self.codec."""
+        return(self.codec.loads(response.content))
+
+    def get(self, url, params=None, stream=False, timeout=None):
+        response = self.query("GET", url, params=params, stream=stream, timeout=timeout)
         return(response)
 
-    def put(self, url, payload):
-        payload = json.dumps(payload) if isinstance(payload, dict) else payload
-        response = requests.put(url, auth=self.auth, headers=self.hdrs, data=payload)
+    def put(self, url, payload, idempotent=None):
+        response = self.query("PUT", url, payload=payload, idempotent=idempotent)
         return(response)
 
-    def post(self, url, payload=None):
-        payload = json.dumps(payload) if isinstance(payload, dict) else payload
-        response = requests.post(url, auth=self.auth, headers=self.hdrs, data=payload)
+    def post(self, url, payload=None, idempotent=None):
+        response = self.query("POST", url, payload=payload, idempotent=idempotent)
         return(response)
 
     def delete(self, url):
-        response = requests.delete(url, auth=self.auth, headers=self.hdrs)
+        response = self.query("DELETE", url)
         return(response)
 
     def update_components(self):
@@ -133,24 +469,152 @@ class AmbariClient(object):
         """Update the list of currently installed services."""
         self.services = self.get_services()
 
+    @staticmethod
+    def _as_list(values):
+        """Return `values` as a sorted list without duplicates; a single string becomes [values]."""
+        return(sorted(set([values] if isinstance(values, str) else values)))
+
+    @staticmethod
+    def _predicate(key, values):
+        """Return the Ambari predicate matching `key` against any of `values`."""
+        if len(values) == 1:
+            return("{}={}".format(key, values[0]))
+        return("{}.in({})".format(key, ",".join(values)))
+
+    def _host_component_calls(self, send, components, hosts, chunk_size=None):
+        """
+        Call send(components, chunk) for each chunk of at most `chunk_size`
+        `hosts` and return the responses, marking the hosts of every
+        successful call dirty in the topology index.
+        """
+        components = self._as_list(components)
+        hosts = self._as_list(hosts)
+        chunk_size = chunk_size or BULK_CHUNK_SIZE
+        responses = []
+        for i in range(0, len(hosts), chunk_size):
+            chunk = hosts[i:i + chunk_size]
+            response = send(components, chunk)
+            for host in chunk:
+                self._host_changed(response, host)
+            responses.append(response)
+        return(responses)
+
+    def _host_components_url(self, components, hosts):
+        return(self.endpoint + "host_components?{}&{}".format(
+            self._predicate("HostRoles/component_name", components),
+            self._predicate("HostRoles/host_name", hosts)))
+
+    def _add_components(self, components, hosts, chunk_size=None):
+        def send(components, chunk):
+            payload = {"RequestInfo": {"query": self._predicate("Hosts/host_name", chunk)},
+                       "Body": {"host_components": [{"HostRoles": {"component_name": c}}
+                                                    for c in components]}}
+            return(self.post(self.endpoint + "hosts", payload))
+        return(self._host_component_calls(send, components, hosts, chunk_size))
+
+    def _delete_components(self, components, hosts, chunk_size=None):
+        def send(components, chunk):
+            return(self.delete(self._host_components_url(components, chunk)))
+        return(self._host_component_calls(send, components, hosts, chunk_size))
+
+    def _change_components_state(self, components, hosts, new_state, context=None,
+                                 chunk_size=None):
+        def send(components, chunk):
+            data = {"RequestInfo": {"context": context or "Change {} state".format(
+                        ", ".join(components))},
+                    "Body": {"HostRoles": {"state": new_state}}}
+            return(self.put(self._host_components_url(components, chunk), data))
+        return(self._host_component_calls(send, components, hosts, chunk_size))
+
+    @staticmethod
+    def _raise_for_status(responses):
+        for response in responses:
+            response.raise_for_status()
+        return(responses)
+
+    def add_components(self, components, hosts, chunk_size=None):
+        """
+        Add every one of `components` to every one of `hosts`, with one
+        multi-item POST per `chunk_size` hosts (BULK_CHUNK_SIZE by default).
+        Ambari adds host components synchronously, in the INIT state, so
+        there is no request to wait for; install them with
+        change_components_state(..., "INSTALLED").
+
+        Parameters
+        ----------
+        components : string or list,
+            Component name(s), e.g. "DATANODE".
+        hosts : string or list,
+            Hostname(s).
+
+        Returns
+        -------
+        responses : list,
+            One response per chunk. Raises for HTTP errors.
+        """
+        return(self._raise_for_status(self._add_components(components, hosts, chunk_size)))
+
+    def delete_components(self, components, hosts, chunk_size=None):
+        """
+        Delete `components` from `hosts` with one predicate DELETE per
+        `chunk_size` hosts. Pairs that do not exist are skipped by Ambari.
+        The components must be stopped first. Returns one response per
+        chunk and raises for HTTP errors.
+        """
+        return(self._raise_for_status(self._delete_components(components, hosts, chunk_size)))
+
+    def change_components_state(self, components, hosts, new_state, context=None,
+                                chunk_size=None):
+        """
+        Set the state of `components` on `hosts` with one predicate PUT
+        (host_components?HostRoles/component_name.in(..)&HostRoles/host_name.in(..))
+        per `chunk_size` hosts, so Ambari has a few requests to track
+        rather than one per host component.
+
+        Parameters
+        ----------
+        components : string or list,
+            Component name(s), e.g. "DATANODE".
+        hosts : string or list,
+            Hostname(s). Host components that do not exist are skipped.
+        new_state : string,
+            e.g. STARTED or INSTALLED.
+        context : string,
+            The request context shown in Ambari.
+        chunk_size : int,
+            Hosts per request, BULK_CHUNK_SIZE by default.
+
+        Returns
+        -------
+        request_ids : list,
+            The Ambari request of each chunk that had something to do; pass
+            them to wait_for_requests. Raises for HTTP errors.
+        """
+        responses = self._raise_for_status(self._change_components_state(
+            components, hosts, new_state, context, chunk_size))
+        return([i for i in map(self.get_request_id, responses) if i is not None])
+
+    def start_components(self, components, hosts, **kwargs):
+        """Start `components` on `hosts` in bulk and return the request ids."""
+        return(self.change_components_state(components, hosts, "STARTED", **kwargs))
+
+    def stop_components(self, components, hosts, **kwargs):
+        """Stop `components` on `hosts` in bulk and return the request ids."""
+        return(self.change_components_state(components, hosts, "INSTALLED", **kwargs))
+
     def delete_component(self, component, host):
-        url = self.endpoint + "hosts/{}/host_components/{}".format(host, component)
-        res = self.delete(url)
+        res = self._delete_components([component], [host])[0]
         return(res)
 
     def add_component(self, component, host):
-        url = self.endpoint + "hosts/{}/host_components/{}".format(host, component)
-        res = self.post(url)
+        res = self._add_components([component], [host])[0]
         return(res)
 
     def delete_service(self, service):
         pass
 
     def change_component_state(self, component, host, new_state):
-        url = self.endpoint + "hosts/{}/host_components/{}".format(host, component)
-        data = {"RequestInfo": {"context": "Change {} state".format(component)},
-                "HostRoles": {"state": new_state}}
-        res = self.put(url, data)
+        res = self._change_components_state([component], [host], new_state)[0]
         return(res)
 
     def start_component(self, component, host):
@@ -163,8 +627,8 @@ class AmbariClient(object):
 
     def component_on_host(self, component_name, host):
         """
-        NOTE: Temporary method
         Check is the component `component_name` on a given host.
+        Answered from the topology index.
 
         Parameters
         ----------
@@ -179,14 +643,22 @@ class AmbariClient(object):
         on_host : bool
             bool indicating if the component is on the given host
         """
-        on_host = True
-        url = self.endpoint + "hosts/{}/host_components/".format(host)
-        res = self.get(url)
-        host_components = [i["HostRoles"]["component_name"] for i in res.json()["items"]]
-        on_host = component_name in host_components
+        on_host = self.topology_index.has(component_name, host)
         return(on_host)
 
-    def move_component(self, component_name, old_host, new_host):
+    def get_component_hosts(self, component_name, state=None):
+        """
+        Return the hosts `component_name` is installed on, answered from the
+        topology index. If `state` is given (e.g. STARTED), only hosts where
+        the component is in that state are returned.
+        """
+        return(self.topology_index.hosts_for(component_name, state))
+
+    def get_host_components(self, host):
+        """Return the components installed on `host`, from the topology index."""
+        return(self.topology_index.components_on(host))
+
+    def move_component(self, component_name, old_host, new_host, **kwargs):
         """
         Given a Hadoop Component, `component_name`, move that component from `old_host` to
         `new_host`.
@@ -200,6 +672,8 @@ class AmbariClient(object):
             Hostname or ip address of the current host the component is installed on.
         new_host : str
             Hostname or ip address of the new host the component is to be installed on.
+        kwargs :
+            Passed to wait_for_request for each step (e.g. timeout, callback).
 
         Returns
         -------
@@ -208,17 +682,13 @@ class AmbariClient(object):
 
         TODO
         ----
-        * Drop the input commands for something more elegant and more automated.
         * Handle errors elsewhere
         * Method should check what tasks have already been completed
            (such as adding the component to new server).
 
         """
         # Check is the component on the cluster
-        if component_name not in self.components:
-            msg = "Component {} not found.\n"
-            msg += "Please run the `update_components method` or check the spelling."
-            raise(ValueError(msg.format(component_name)))
+        self._has_component(component_name)
         # Check is the component on the old_host
         if not self.component_on_host(component_name, old_host):
             msg = "Component {} not found on host {}"
@@ -229,39 +699,43 @@ class AmbariClient(object):
         if not res.ok:
             print("Failed to stop component")
             return(False)
-        input("Component stopped?")
+        self.wait_for_response(res, **kwargs)
 
         #  Add the component
         install = self.add_component(component_name, new_host)
-        input("Finished Adding component?")
+        install.raise_for_status()
 
         state_change = self.change_component_state(component_name, new_host, "INSTALLED")
-        state_change.raise_for_status()
-        input("Component installed?")
+        self.wait_for_response(state_change, **kwargs)
 
         #  Delete the component
         delete = self.delete_component(component_name, old_host)
-        input("Finished Deleting component?")
+        delete.raise_for_status()
 
         state_change = self.start_component(component_name, new_host)
-        state_change.raise_for_status()
-        input("Component started")
+        self.wait_for_response(state_change, **kwargs)
         return(delete.ok and install.ok)
 
     def _has_component(self, component):
         """
-        Checks `component` is in self.components,
-        if not found raises a ValueError
+        Checks `component` is in self.components, refreshing the cache once
+        on a miss. If still not found raises a ValueError
         """
+        if component in self.components:
+            return
+        self.update_components()
         if component not in self.components:
             error_msg = "{} is not found in components.".format(component)
             raise(ValueError(error_msg))
 
     def _has_service(self, service):
         """
-        Checks `service` is in self.services,
-        if not found raises a ValueError
+        Checks `service` is in self.services, refreshing the cache once
+        on a miss. If still not found raises a ValueError
         """
+        if service in self.services:
+            return
+        self.update_services()
         if service not in self.services:
             error_msg = "{} is not found in services.".format(service)
             raise(ValueError(error_msg))
@@ -272,9 +746,9 @@ class AmbariClient(object):
         self._has_service(service)
 
         url = self.endpoint + "services/{}".format(service)
-        response = requests.get(url, headers=self.hdrs, auth=self.auth)
+        response = self.get(url)
 
-        return(response.json())
+        return(self.decode(response))
 
     def get_service_state(self, service):
         """Return the current state of a service as a string."""
@@ -282,11 +756,22 @@ class AmbariClient(object):
 
         return(state)
 
+    def get_all_service_states(self):
+        """
+        Return a dict mapping each service on the cluster to its state.
+        Uses a single request, asking Ambari for the state field only.
+        """
+        states = {}
+        for i in self.iter_collection("services/", {"fields": "ServiceInfo/state"}):
+            states[i["ServiceInfo"]["service_name"]] = i["ServiceInfo"]["state"]
+        return(states)
+
     def get_services_states(self):
         """
         Return a list of states for all the services installed on the cluster
         """
-        return([self.get_service_state(s) for s in self.services])
+        states = self.get_all_service_states()
+        return([states[s] for s in sorted(states)])
 
     def get_component_info(self, component):
         """Return the all the info for a component"""
@@ -294,9 +779,9 @@ class AmbariClient(object):
         self._has_component(component)
 
         url = self.endpoint + "components/{}".format(component)
-        response = requests.get(url, headers=self.hdrs, auth=self.auth)
+        response = self.get(url)
 
-        return(response.json())
+        return(self.decode(response))
 
     def get_component_state(self, component):
         """Return the current state of a component as a string."""
@@ -304,94 +789,303 @@ class AmbariClient(object):
 
         return(state)
 
-    def stop_service(self, service):
+    def get_all_component_states(self, service=""):
+        """
+        List the states of each component on the cluster, or of a given
+        service if `service` is passed, in a single request.
+        List contains tuples of component name, and state.
+        """
+        if service:
+            # Security Check
+            self._has_service(service)
+
+        fields = "ServiceComponentInfo/state,ServiceComponentInfo/service_name"
+
+        states = []
+        for i in self.iter_collection("components/", {"fields": fields}):
+            info = i["ServiceComponentInfo"]
+            if service and info["service_name"] != service:
+                continue
+            states.append((info["component_name"], info["state"]))
+        return(states)
+
+    def get_request_id(self, response):
+        """
+        Return the Ambari request id (Requests/id) from the response to an
+        asynchronous operation, or None if Ambari had nothing to do.
+        """
+        if not response.content:
+            return(None)
+        try:
+            return(self.decode(response)["Requests"]["id"])
+        except (ValueError, KeyError, TypeError):
+            return(None)
+
+    def get_request_status(self, request_id):
+        """
+        Return the status and progress of an Ambari request.
+
+        Parameters
+        ----------
+        request_id : int
+            The id returned by Ambari for an asynchronous operation.
+
+        Returns
+        -------
+        status : string
+            The request status (PENDING, IN_PROGRESS, COMPLETED, FAILED...).
+        progress : float
+            The percentage of the request completed.
+        """
+        url = self.endpoint + "requests/{}".format(request_id)
+        fields = "Requests/request_status,Requests/progress_percent"
+        response = self.get(url, params={"fields": fields})
+        response.raise_for_status()
+        info = self.decode(response)["Requests"]
+        return(info["request_status"], info["progress_percent"])
+
+    def wait_for_request(self, request_id, timeout=None, poll_interval=1,
+                         max_interval=30, backoff=1.5, callback=None):
+        """
+        Block until the Ambari request `request_id` finishes, polling its
+        status with exponential backoff.
+
+        Parameters
+        ----------
+        request_id : int
+            The id returned by Ambari for an asynchronous operation.
+        timeout : float
+            Seconds to wait before giving up. None waits forever.
+        poll_interval : float
+            Seconds to wait before the second poll.
+        max_interval : float
+            Upper bound on the seconds between two polls.
+        backoff : float
+            Factor the interval grows by after each poll.
+        callback : callable
+            Called as callback(request_id, status, progress) after each poll.
+
+        Returns
+        -------
+        status : string
+            COMPLETED. Any other final status raises a RuntimeError, as does
+            running out of time.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        interval = poll_interval
+        while True:
+            status, progress = self.get_request_status(request_id)
+            if callback is not None:
+                callback(request_id, status, progress)
+            if status == "COMPLETED":
+                return(status)
+            if status in FAILED_REQUEST_STATES:
+                msg = "Request {} finished with status {}."
+                raise(RuntimeError(msg.format(request_id, status)))
+
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    msg = "Timed out waiting for request {} ({}, {}%)."
+                    raise(RuntimeError(msg.format(request_id, status, progress)))
+                interval = min(interval, remaining)
+            time.sleep(interval)
+            interval = min(interval * backoff, max_interval)
+
+    def wait_for_requests(self, request_ids, **kwargs):
+        """
+        Wait for every request in `request_ids`, e.g. from the bulk
+        host component methods. kwargs are passed to wait_for_request.
+        """
+        for request_id in request_ids:
+            self.wait_for_request(request_id, **kwargs)
+
+    def wait_for_response(self, response, **kwargs):
+        """
+        Wait for the request started by `response`, if any.
+        Raises for HTTP errors; kwargs are passed to wait_for_request.
+        """
+        response.raise_for_status()
+        request_id = self.get_request_id(response)
+        if request_id is not None:
+            self.wait_for_request(request_id, **kwargs)
+        return(response)
+
+    def stop_service(self, service, wait=True, **kwargs):
         """
         Stop a service. The service name must be capital letters.
         Use get_Services if in doubt.
+        If `wait`, return once Ambari reports the request finished;
+        kwargs are passed to wait_for_request.
         """
         # Security Check
         self._has_service(service)
 
-        payload = json.dumps({"RequestInfo": {
-                              "context": "Stopping {}".format(service)},
-                              "Body": {"ServiceInfo": {"state": "INSTALLED"}}})
+        payload = {"RequestInfo": {
+                   "context": "Stopping {}".format(service)},
+                   "Body": {"ServiceInfo": {"state": "INSTALLED"}}}
         url = self.endpoint + "services/{}".format(service)
-        response = requests.put(url,
-                                data=payload,
-                                headers=self.hdrs,
-                                auth=self.auth)
+        response = self.put(url, payload)
 
         print("Stopping {}...".format(service))
+        if wait:
+            self.wait_for_response(response, **kwargs)
 
         return(response)
 
-    def start_service(self, service):
+    def start_service(self, service, wait=True, **kwargs):
         """
         Start a service. The service name must be capital letters.
         Use get_Services if in doubt.
+        If `wait`, return once Ambari reports the request finished;
+        kwargs are passed to wait_for_request.
         """
         # Security Check
         self._has_service(service)
 
-        payload = json.dumps({"RequestInfo": {
-                              "context": "Starting {}".format(service)},
-                              "Body": {"ServiceInfo": {"state": "STARTED"}}})
+        payload = {"RequestInfo": {
+                   "context": "Starting {}".format(service)},
+                   "Body": {"ServiceInfo": {"state": "STARTED"}}}
         url = self.endpoint + "services/{}".format(service)
-        response = requests.put(url,
-                                data=payload,
-                                headers=self.hdrs,
-                                auth=self.auth)
+        response = self.put(url, payload)
 
         print("Starting {}...".format(service))
+        if wait:
+            self.wait_for_response(response, **kwargs)
         return(response)
 
     def stop_all_services(self):
         """Stops all services not currently in the INSTALLED state"""
         msg = "Stopping all services"
-        payload = json.dumps({"RequestInfo": {"context": msg},
-                              "Body": {"ServiceInfo": {"state": "INSTALLED"}}})
+        payload = {"RequestInfo": {"context": msg},
+                   "Body": {"ServiceInfo": {"state": "INSTALLED"}}}
         url = self.endpoint + "services/"
 
-        response = requests.put(url,
-                                auth=self.auth,
-                                headers=self.hdrs,
-                                data=payload)
+        response = self.put(url, payload)
         print(msg)
         return(response)
 
     def start_all_services(self):
         """Starts all services not currently in the STARTED state"""
         msg = "Starting all services"
-        payload = json.dumps({"RequestInfo": {"context": msg},
-                              "Body": {"ServiceInfo": {"state": "STARTED"}}})
+        payload = {"RequestInfo": {"context": msg},
+                   "Body": {"ServiceInfo": {"state": "STARTED"}}}
         url = self.endpoint + "services/"
 
-        response = requests.put(url,
-                                auth=self.auth,
-                                headers=self.hdrs,
-                                data=payload)
+        response = self.put(url, payload)
         print(msg)
         return(response)
 
-    def restart_all_services(self):
+    def restart_all_services(self, wait=True, **kwargs):
         """
         A function to stop all the services,
-        and once they are all stopped it will
+        and once the stop request has finished it will
         start them again.
+        If `wait`, also wait for the start request to finish.
+        kwargs are passed to wait_for_request.
         """
         res = self.stop_all_services()
+        self.wait_for_response(res, **kwargs)
 
-        states = self.get_services_states()
-
-        while not all([state == "INSTALLED" for state in states]):
-            time.sleep(10)
-            states = self.get_services_states()
-
-        time.sleep(120)  # Wait two minutes
         res = self.start_all_services()
-        print("Services are now being started. Please be patient...")
+        if wait:
+            self.wait_for_response(res, **kwargs)
+            print("Services are now started.")
+        else:
+            print("Services are now being started. Please be patient...")
         return(res)
 
+    def get_stale_host_components(self):
+        """
+        Return the host components running with out of date configurations,
+        found with a single request.
+
+        Returns
+        -------
+        stale : list,
+            Tuples of service name, component name and host name.
+        """
+        fields = "HostRoles/service_name,HostRoles/component_name,HostRoles/host_name"
+
+        stale = []
+        for i in self.iter_host_components(fields, stale_configs="true"):
+            roles = i["HostRoles"]
+            stale.append((roles["service_name"], roles["component_name"], roles["host_name"]))
+        return(stale)
+
+    def restart_host_components(self, host_components, context=None):
+        """
+        Restart the given host components with one RESTART request.
+
+        Parameters
+        ----------
+        host_components : list,
+            Tuples of service name, component name and host name.
+        context : string,
+            The request context shown in Ambari.
+
+        Returns
+        -------
+        response : requests.Response
+        """
+        hosts = {}
+        for service, component, host in host_components:
+            hosts.setdefault((service, component), []).append(host)
+
+        filters = [{"service_name": service,
+                    "component_name": component,
+                    "hosts": ",".join(sorted(hosts[(service, component)]))}
+                   for service, component in sorted(hosts)]
+        context = context or "Restart {}".format(", ".join(sorted(set(c for _, c in hosts))))
+        payload = {"RequestInfo": {"command": "RESTART", "context": context},
+                   "Requests/resource_filters": filters}
+        response = self.post(self.endpoint + "requests", payload)
+        return(response)
+
+    def restart_stale(self, batch_size=None, wait=True, **kwargs):
+        """
+        Restart only the host components Ambari flags with stale configs.
+
+        Parameters
+        ----------
+        batch_size : int,
+            If given, do a rolling restart of at most `batch_size` hosts per
+            request, waiting for each batch to finish before the next.
+            Otherwise everything stale is restarted in one request.
+        wait : bool,
+            Wait for the last request to finish before returning.
+        kwargs :
+            Passed to wait_for_request (e.g. timeout, callback).
+
+        Returns
+        -------
+        responses : list,
+            The response of each restart request, empty if nothing was stale.
+        """
+        stale = self.get_stale_host_components()
+        if not stale:
+            print("No stale host components to restart")
+            return([])
+
+        if batch_size is None:
+            batches = [stale]
+        else:
+            hosts = sorted(set(host for _, _, host in stale))
+            batches = []
+            for i in range(0, len(hosts), batch_size):
+                batch_hosts = set(hosts[i:i + batch_size])
+                batches.append([hc for hc in stale if hc[2] in batch_hosts])
+
+        responses = []
+        for n, batch in enumerate(batches):
+            print("Restarting {} stale host components (batch {} of {})".format(
+                len(batch), n + 1, len(batches)))
+            response = self.restart_host_components(batch)
+            responses.append(response)
+            if wait or n + 1 < len(batches):
+                self.wait_for_response(response, **kwargs)
+        return(responses)
+
     @staticmethod
     def make_conf_note(**kwargs):
 
@@ -419,14 +1113,31 @@ class AmbariClient(object):
         tag = self.get_current_tag(conf_name)
         conf = self.get_configurations(conf_name, tag)
 
-        properties = conf["properties"]
-        for k in kwargs:
+        properties, _ = self.apply_changes(conf_name, conf["properties"], kwargs)
+        return(properties)
+
+    @staticmethod
+    def apply_changes(conf_name, properties, changes):
+        """
+        Set the values in `changes` on the `properties` of `conf_name`.
+        Keys not already in `properties` are skipped with a warning.
+
+        Returns
+        -------
+        properties : dict,
+            The updated properties.
+        changed : bool,
+            Whether any value differs from what was there before.
+        """
+        changed = False
+        for k in changes:
             if k in properties:
-                properties[k] = kwargs[k]
+                changed = changed or str(properties[k]) != str(changes[k])
+                properties[k] = changes[k]
             else:
                 print("WARNING: Key, {}, not found in {}. Skipping.".format(k, conf_name))
 
-        return(properties)
+        return(properties, changed)
 
     def get_current_tag(self, conf_name):
         """
@@ -445,13 +1156,25 @@ class AmbariClient(object):
         """
         payload = {"fields": "Clusters/desired_configs/{}".format(conf_name)}
 
-        response = requests.get(self.endpoint,
-                                auth=self.auth,
-                                headers=self.hdrs,
-                                params=payload)
-        tag = response.json()["Clusters"]["desired_configs"][conf_name]["tag"]
+        response = self.get(self.endpoint, params=payload)
+        tag = self.decode(response)["Clusters"]["desired_configs"][conf_name]["tag"]
         return(tag)
 
+    def get_current_tags(self):
+        """
+        Return the current tag of every configuration group in one request.
+
+        Returns
+        -------
+        tags : dict
+            A dictionary of configuration group name to current tag.
+        """
+        payload = {"fields": "Clusters/desired_configs"}
+
+        response = self.get(self.endpoint, params=payload)
+        desired = self.decode(response)["Clusters"]["desired_configs"]
+        return(dict((conf_name, desired[conf_name]["tag"]) for conf_name in desired))
+
     def get_configurations(self, conf_name, tag):
         """
         Get the `conf_name` configurations identified by tag.
@@ -468,77 +1191,302 @@ class AmbariClient(object):
         -------
         confs : dict
             A json object with the configurations for `conf_name` `tag`.
+            A (type, tag) never changes, so it is served from self.config_cache
+            after the first download.
         """
+        confs = self.config_cache.get(self.endpoint, conf_name, tag)
+        if confs is not None:
+            return(confs)
+
         payload = {"type": conf_name, "tag": tag}
-        response = requests.get(self.endpoint + "configurations",
-                                auth=self.auth,
-                                headers=self.hdrs,
-                                params=payload)
-        confs = response.json()["items"][0]
+        response = self.get(self.endpoint + "configurations", params=payload)
+        confs = self.decode(response)["items"][0]
+        self.config_cache.put(self.endpoint, conf_name, tag, confs)
         return(confs)
 
+    def iter_service_config_versions(self, service=None, versions=None):
+        """
+        Yield service config versions, with the properties of each of their
+        configurations, walking the collection page by page. Every
+        configuration seen is added to the config cache.
+
+        Parameters
+        ----------
+        service : string,
+            Only versions of this service (e.g. HDFS). All services if None.
+        versions : list,
+            Only these service_config_version numbers.
+
+        Yields
+        ------
+        version : dict
+            One service_config_versions item.
+        """
+        predicates = []
+        if service:
+            predicates.append("service_name={}".format(service))
+        if versions:
+            predicates.append("service_config_version.in({})".format(
+                ",".join(str(v) for v in versions)))
+        path = "configurations/service_config_versions"
+        if predicates:
+            path += "?" + "&".join(predicates)
+
+        for version in self.iter_collection(path, {"fields": "*"}):
+            for conf in version.get("configurations", []):
+                if "properties" in conf:
+                    self.config_cache.put(self.endpoint, conf["type"], conf["tag"],
+                                          {"type": conf["type"], "tag": conf["tag"],
+                                           "properties": conf["properties"]})
+            yield version
+
+    def diff_service_config_versions(self, service, old, new):
+        """
+        Compare two service config versions of `service`, fetched together
+        in one request and diffed locally.
+
+        Returns
+        -------
+        diffs : dict
+            Configuration group name to ConfigDiff, for the groups that differ.
+        """
+        found = dict((v["service_config_version"], v)
+                     for v in self.iter_service_config_versions(service, [old, new]))
+        for version in (old, new):
+            if version not in found:
+                raise(ValueError("{} has no service config version {}".format(service, version)))
+        return(diff_versions(found[old], found[new]))
+
+    def get_config_history(self, service=None):
+        """
+        Diff every service config version against the one before it,
+        for `service` or all services, from a single paged walk of
+        service_config_versions.
+
+        Returns
+        -------
+        history : dict,
+            Service name to a list of (version, note, {conf_name: ConfigDiff}).
+        """
+        by_service = {}
+        for version in self.iter_service_config_versions(service):
+            by_service.setdefault(version["service_name"], []).append(version)
+        return(dict((name, diff_history(versions)) for name, versions in by_service.items()))
+
+    def diff_conf(self, conf_name, properties=None, **kwargs):
+        """
+        Compare the current `conf_name` configurations with proposed ones,
+        without changing anything. The current body comes from the config
+        cache when its tag has been seen before.
+
+        Parameters
+        ----------
+        conf_name : string,
+            A configuration group name (hdfs-site, zoo.cfg).
+        properties : dict,
+            A complete new property set. If not given, the kwargs are set
+            on the current properties as put_new_conf would.
+
+        Returns
+        -------
+        diff : ConfigDiff,
+            The keys added, changed and removed. False when nothing differs.
+        properties : dict,
+            The proposed property set.
+        """
+        tag = self.get_current_tag(conf_name)
+        current = self.get_configurations(conf_name, tag)["properties"]
+        if properties is None:
+            properties, _ = self.apply_changes(conf_name, dict(current), kwargs)
+        return(ConfigDiff.between(conf_name, current, properties), properties)
+
     def put_new_conf(self, conf_name, **kwargs):
         """
         Make a put request to the ambari server
         to update a configuration group with new values.
+        Nothing is sent, and the response is None, if no value would change.
         """
         config_note = self.make_conf_note(**kwargs)
+        diff, properties = self.diff_conf(conf_name, **kwargs)
+        if not diff:
+            print("No change to {}, not creating a new version".format(conf_name))
+            return(config_note, None)
+
+        response = self._put_conf(conf_name, properties, config_note)
+        return(config_note, response)
+
+    def put_conf_properties(self, conf_name, properties, note=None):
+        """
+        Replace the whole property set of `conf_name` with `properties`,
+        which may add and remove keys. Nothing is sent if it would not
+        change anything.
+
+        Returns
+        -------
+        diff : ConfigDiff,
+            What the new version changes.
+        response : requests.Response,
+            The response to the PUT, or None if nothing changed.
+        """
+        diff, properties = self.diff_conf(conf_name, properties)
+        if not diff:
+            return(diff, None)
+        note = note or "{}: {} added, {} changed, {} removed".format(
+            conf_name, len(diff.added), len(diff.changed), len(diff.removed))
+        return(diff, self._put_conf(conf_name, properties, note))
+
+    def _put_conf(self, conf_name, properties, config_note):
         curr_time = int(time.time())
+        tag = "version{}".format(curr_time)
 
-        payload = json.dumps([{"Clusters": {
+        payload = [{"Clusters": {
             "desired_config": [{
-                "tag": "version{}".format(curr_time),
+                "tag": tag,
                 "type": conf_name,
-                "properties": self.modify_configurations(conf_name, **kwargs),
-                "service_config_version_note": config_note}]}}])
+                "properties": properties,
+                "service_config_version_note": config_note}]}}]
+
+        # A repeat of a PUT that went through would clash on the tag
+        response = self.put(self.endpoint, payload, idempotent=False)
+        if response.ok:
+            # The body of the new tag is exactly what was sent
+            self.config_cache.put(self.endpoint, conf_name, tag,
+                                  {"type": conf_name, "tag": tag, "properties": properties})
+        return(response)
 
-        # print(payload)
-        # response = None
-        response = requests.put(self.endpoint,
-                                headers=self.hdrs,
-                                auth=self.auth,
-                                data=payload)
+    @staticmethod
+    def blueprint_changes(index=None):
+        """
+        Look up configuration `index` of the blueprint index
+        (make_blueprint_index.py), or a random one if no index is given.
 
-        return(config_note, response)
+        Returns
+        -------
+        index : int,
+            The blueprint index of the configuration.
+        changes : dict,
+            Configuration group name to the keys and values to set,
+            as taken by put_new_confs.
+        """
+        if index is None:
+            index = random.randrange(len(BLUEPRINT_SPACE))
+        return(index, BLUEPRINT_SPACE.changes(index))
 
-    def put_hdfs_site(self):
-        """Change the replication factor of hdfs at random"""
-        conf_group = "hdfs-site"
-        replication_vals = [1, 2, 3]
-        replication = random.choice(replication_vals)
+    @staticmethod
+    def hdfs_site_changes(index=None):
+        """The hdfs replication factor of blueprint configuration `index`"""
+        return(AmbariClient.blueprint_changes(index)[1]["hdfs-site"])
 
-        to_change = {"dfs.replication": replication}
+    @staticmethod
+    def hive_site_changes(index=None):
+        """The hive vectorization settings of blueprint configuration `index`"""
+        return(AmbariClient.blueprint_changes(index)[1]["hive-site"])
 
-        note, response = self.put_new_conf(conf_group, **to_change)
+    @staticmethod
+    def yarn_site_changes(index=None):
+        """The yarn memory settings of blueprint configuration `index`"""
+        return(AmbariClient.blueprint_changes(index)[1]["yarn-site"])
+
+    def diff_confs(self, changes, processes=4):
+        """
+        Compare several configuration groups with the values in `changes`
+        without changing anything. Takes one request for the current tags
+        plus one per body not in the config cache, fetched concurrently.
+
+        Returns
+        -------
+        diffs : dict,
+            Configuration group name to (ConfigDiff, proposed properties).
+        """
+        tags = self.get_current_tags()
+        conf_names = [c for c in changes if changes[c]]
+        for conf_name in conf_names:
+            if conf_name not in tags:
+                raise(ValueError("{} is not found in configurations.".format(conf_name)))
+
+        # Bodies already in the config cache cost nothing, fetch the rest concurrently.
+        # multiprocessing is imported here, not at the top, to keep startup short
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max(1, min(processes, len(conf_names))))
+        try:
+            confs = pool.map(lambda c: self.get_configurations(c, tags[c]), conf_names)
+        finally:
+            pool.close()
+
+        diffs = {}
+        for conf_name, conf in zip(conf_names, confs):
+            properties, _ = self.apply_changes(conf_name, dict(conf["properties"]),
+                                               changes[conf_name])
+            diffs[conf_name] = (ConfigDiff.between(conf_name, conf["properties"], properties),
+                                properties)
+        return(diffs)
+
+    def put_new_confs(self, changes, processes=4):
+        """
+        Update several configuration groups with new values in a single
+        request, creating one new service config version.
+
+        Parameters
+        ----------
+        changes : dict,
+            Configuration group name to a dict of the keys and values to set,
+            e.g. {"hdfs-site": {"dfs.replication": 2}}.
+        processes : int,
+            Number of threads used to download the current configurations.
+
+        Returns
+        -------
+        config_note : string,
+            The note recorded against the new version, covering every group.
+        response : requests.Response,
+            The response to the PUT, or None if no group would change.
+        """
+        diffs = self.diff_confs(changes, processes)
+
+        curr_time = int(time.time())
+        desired, notes = [], []
+        for conf_name in changes:
+            diff, properties = diffs.get(conf_name, (None, None))
+            if not diff:
+                continue
+            notes.append("{}: {}".format(conf_name, self.make_conf_note(**changes[conf_name])))
+            desired.append({"tag": "version{}".format(curr_time),
+                            "type": conf_name,
+                            "properties": properties})
+
+        config_note = "; ".join(notes)
+        if not desired:
+            return(config_note, None)
+
+        for conf in desired:
+            conf["service_config_version_note"] = config_note
+        response = self.put(self.endpoint, [{"Clusters": {"desired_config": desired}}],
+                            idempotent=False)
+        if response.ok:
+            for conf in desired:
+                self.config_cache.put(self.endpoint, conf["type"], conf["tag"],
+                                      {"type": conf["type"], "tag": conf["tag"],
+                                       "properties": conf["properties"]})
+
+        return(config_note, response)
+
+    def put_hdfs_site(self, index=None):
+        """Set hdfs-site to blueprint configuration `index`, random if None"""
+        note, response = self.put_new_conf("hdfs-site", **self.hdfs_site_changes(index))
         print(note)
 
         return(note, response)
 
-    def put_hive_site(self):
-        """Change the hive-site configurations"""
-        conf_group = "hive-site"
-        vals = ["true", "false"]
-        hvee, hvere = random.choice(vals), random.choice(vals)
-        to_change = {"hive.vectorized.execution.enabled": hvee,
-                     "hive.vectorized.execution.reduce.enabled": hvere}
-
-        note, response = self.put_new_conf(conf_group, **to_change)
+    def put_hive_site(self, index=None):
+        """Set hive-site to blueprint configuration `index`, random if None"""
+        note, response = self.put_new_conf("hive-site", **self.hive_site_changes(index))
         print(note)
 
         return(note, response)
 
-    def put_yarn_site(self):
-        """Change the yarn-site configurations"""
-        conf_group = "yarn-site"
-        memory_vals = [("2048", "682"),
-                       ("2048", "1024"),
-                       ("2816", "1280"),
-                       ("2816", "1664")]
-        max_memory, min_memory = random.choice(memory_vals)
-        to_change = {"yarn.nodemanager.resource.memory-mb": max_memory,
-                     "yarn.scheduler.minimum-allocation-mb": min_memory}
-
-        note, response = self.put_new_conf(conf_group, **to_change)
+    def put_yarn_site(self, index=None):
+        """Set yarn-site to blueprint configuration `index`, random if None"""
+        note, response = self.put_new_conf("yarn-site", **self.yarn_site_changes(index))
         print(note)
 
         return(note, response)
@@ -546,26 +1494,139 @@ class AmbariClient(object):
     def get_blueprint(self):
         """Return the Hadoop Blueprint as a json object."""
         payload = {"format": "blueprint"}
-        response = requests.get(self.endpoint,
-                                auth=self.auth,
-                                headers=self.hdrs,
-                                params=payload)
+        response = self.get(self.endpoint, params=payload)
+
+        return(self.decode(response))
+
+    def get_alert_definitions(self, fields=ALERT_DEFINITION_FIELDS):
+        """Return the AlertDefinition dict of every alert definition, projected to `fields`."""
+        return([i["AlertDefinition"] for i in self.iter_alert_definitions(fields)])
+
+    def get_alert_definition_id(self, name):
+        """Return the id of the alert definition called `name`."""
+        path = "alert_definitions?AlertDefinition/name={}".format(name)
+        for i in self.iter_collection(path):
+            return(i["AlertDefinition"]["id"])
+        raise(ValueError("Alert definition {} not found.".format(name)))
+
+    def get_alert_definition(self, definition):
+        """Return the full AlertDefinition dict of `definition`, given by id or name."""
+        if not str(definition).isdigit():
+            definition = self.get_alert_definition_id(definition)
+        url = self.endpoint + "alert_definitions/{}".format(definition)
+        response = self.get(url)
+        response.raise_for_status()
+        return(self.decode(response)["AlertDefinition"])
+
+    def create_alert_definition(self, definition):
+        """
+        Create an alert definition.
 
-        return(response.json())
+        Parameters
+        ----------
+        definition : dict,
+            AlertDefinition properties: name, label, service_name,
+            component_name, interval (minutes), scope (ANY, HOST or SERVICE),
+            enabled and source (e.g. a SCRIPT, PORT or METRIC source).
 
-    def get_jmx(self, host=None, port=8080, params=None):
-        """Query Ambari Metrics"""
+        Returns
+        -------
+        response : requests.Response
+        """
+        return(self.post(self.endpoint + "alert_definitions", {"AlertDefinition": definition}))
+
+    def create_alert_definitions(self, definitions):
+        """Create every definition in `definitions` with a single multi-item POST."""
+        payload = [{"AlertDefinition": d} for d in definitions]
+        return(self.post(self.endpoint + "alert_definitions", payload))
+
+    def update_alert_definition(self, definition, **changes):
+        """
+        Change properties of `definition`, given by id or name,
+        e.g. update_alert_definition("datanode_process", interval=5, enabled=False).
+        """
+        if not str(definition).isdigit():
+            definition = self.get_alert_definition_id(definition)
+        url = self.endpoint + "alert_definitions/{}".format(definition)
+        return(self.put(url, {"AlertDefinition": changes}))
+
+    def get_jmx(self, host=None, port=8080, params=None, timeout=None):
+        """Query the JMX endpoint of `host` (default the namenode)."""
         host = host if host else self.namenode
         payload = {"qry": params} if params else None
         url = "http://{}:{}/jmx".format(host, port)
 
-        response = requests.get(url,
-                                auth=self.auth,
-                                headers=self.hdrs,
-                                params=payload)
+        response = self.get(url, params=payload, timeout=timeout)
 
         return(response)
 
+    def collect_jmx(self, metrics, hosts=None, port=50075, component=None,
+                    timeout=5, processes=16):
+        """
+        Scrape JMX metrics from many hosts concurrently.
+
+        Parameters
+        ----------
+        metrics : dict
+            Metric name to a (bean query, attribute) pair, e.g.
+            {"bytes_written": ("Hadoop:service=DataNode,name=DataNodeActivity-*",
+                               "BytesWritten")}.
+        hosts : list
+            Hosts to scrape. Defaults to the hosts where `component` is
+            STARTED according to the topology index, or to get_live_nodes().
+        port : int
+            The JMX port on the hosts (50075 for DataNodes, 8042 for NodeManagers).
+        component : string
+            Component whose hosts to scrape when `hosts` is not given.
+        timeout : float
+            Seconds each request may take before the host is given up on.
+        processes : int
+            Number of hosts scraped at once.
+
+        Returns
+        -------
+        table : JmxTable
+            Host x metric values. Hosts that failed are listed in table.errors.
+        """
+        if hosts is None:
+            hosts = (self.get_component_hosts(component, "STARTED") if component
+                     else self.get_live_nodes())
+        return(collect_jmx(self, metrics, hosts, port, timeout, processes))
+
+    def get_host_metrics(self, metrics, hosts, start, end, step=60, batch_size=50):
+        """
+        Fetch Ambari Metrics series for many hosts in batched requests.
+
+        Parameters
+        ----------
+        metrics : list
+            Metric paths, e.g. ["cpu/cpu_user", "memory/mem_free"].
+        hosts : list
+            The hosts to fetch them for.
+        start, end : int
+            The time range in epoch seconds.
+        step : int
+            Seconds between points on the returned time grid.
+        batch_size : int
+            Hosts per request.
+
+        Returns
+        -------
+        frame : ams_metrics.MetricFrame
+            NumPy-backed (host, metric, time) values. Requires numpy.
+        """
+        from ams_metrics import get_host_metrics
+        return(get_host_metrics(self, metrics, hosts, start, end, step, batch_size))
+
+    def get_component_metrics(self, metrics, components, start, end, step=60):
+        """
+        Fetch Ambari Metrics series for several components in one request,
+        e.g. metrics=["jvm/memHeapUsedM"], components=["NAMENODE", "RESOURCEMANAGER"].
+        Returns an ams_metrics.MetricFrame. Requires numpy.
+        """
+        from ams_metrics import get_component_metrics
+        return(get_component_metrics(self, metrics, components, start, end, step))
+
     def get_live_nodes(self):
         """
         Get the list of live Nodes from the cluster.
@@ -574,8 +1635,17 @@ class AmbariClient(object):
         payload = "Hadoop:service=NameNode,name=NameNodeInfo"
         response = self.get_jmx(port=50070, params=payload)
 
-        live_nodes = response.json()["beans"][0]["LiveNodes"]
-        return([nodename.rstrip(":50010") for nodename in json.loads(live_nodes)])
+        live_nodes = self.decode(response)["beans"][0]["LiveNodes"]
+        # LiveNodes is keyed by "host:port" (50010, or 9866 on Hadoop 3)
+        return([nodename.rsplit(":", 1)[0] for nodename in self.codec.loads(live_nodes)])
+
+    def watch(self, scopes=("services", "components", "host_components"), **kwargs):
+        """
+        Return a Watch reporting state transitions of `scopes` (services,
+        components, host_components), one request per poll.
+        kwargs (min_interval, max_interval, backoff) are passed to Watch.
+        """
+        return(Watch(self, scopes, **kwargs))
 
 
 def get_components_states(client, service):
@@ -583,45 +1653,18 @@ def get_components_states(client, service):
     List the states of each component for a given service.
     List contains tuples of component name, and state.
     """
-    states = []
-    for c in client.get_components(service):
-        states.append((c, client.get_component_state(c)))
-    return(states)
+    return(client.get_all_component_states(service))
 
 
 if __name__ == '__main__':
-    #  Insert your ambari server hostname here
-    # nnode = <hostname>
-    nnode = "dok31.northeurope.cloudapp.azure.com"
-    # Add port number for ambari
-    # p = 8080  # 8080 is default
-    p = 8080
-    # Add the name of the cluster (assigned during installation)
-    clr_name = "dokcl3"
-    # Provide the password
-    cred = ("admin", input("Ambari password: "))
-    # HEader information required by ambari
-    hdrs = {"X-Requested-By": "ambari"}
-
-    try:
-        filename = sys.argv[1]
-    except IndexError as e:
-        raise(ValueError("Usage: python ambari_client.py <filename>"))
-        sys.exit(1)
-
-    amc = AmbariClient(nnode, p, clr_name, cred, hdrs)
-
-    with open(filename, "a") as f:
-        # Change the configurations and restart the services
-        note, _ = amc.put_hive_site()
-        f.write(note + "\n")
-
-        # Changing a configuration in HDFS has the knock on affect of
-        # requiring a restart of YARN and MAPREDUCE2
-        note, _ = amc.put_yarn_site()
-        f.write(note + "\n")
-
-        note, _ = amc.put_hdfs_site()
-        f.write(note + "\n")
-
-    amc.restart_all_services()
+    # Connection settings now come from the ambari_cli config file
+    # (~/.ambari/ambari.cfg); see ambari_cli.py for pipelines of operations.
+    #
+    # Each trial changes the configurations in one request and restarts only
+    # what went stale. Changing a configuration in HDFS has the knock on
+    # affect of requiring a restart of YARN and MAPREDUCE2, so the trials are
+    # ordered to change it as rarely as possible. One JSON line per trial.
+    if len(sys.argv) < 2:
+        raise(ValueError("Usage: python ambari_client.py <log file> [index ...]"))
+    from ambari_cli import main
+    sys.exit(main(["experiment"] + sys.argv[1:]))
@@ -1,5 +1,6 @@
 from ambari_client import AmbariClient
 import getpass
+import os
 
 nnode = "dok31.northeurope.cloudapp.azure.com"
 p = 8080
@@ -8,3 +9,15 @@ cred = ("admin", getpass.getpass("Ambari password: "))
 hdrs = {"X-Requested-By": "ambari"}
 
 amc = AmbariClient(nnode, p, clr_name, cred, hdrs)
+
+# Optional: export AMBARI_SNAPSHOT=~/.ambari/dokcl3.db to reuse the cluster
+# view from the last session, fetching only what changed
+if os.environ.get("AMBARI_SNAPSHOT"):
+    import requests
+    from cluster_snapshot import ClusterSnapshot
+    snap = ClusterSnapshot(os.environ["AMBARI_SNAPSHOT"])
+    try:
+        snap.refresh(amc)
+    except requests.RequestException as e:
+        print("Ambari unreachable ({}), using the snapshot as saved".format(type(e).__name__))
+    snap.load_into(amc)
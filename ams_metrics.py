@@ -0,0 +1,215 @@
+"""
+Historical metrics from Ambari Metrics (AMS) as NumPy arrays.
+
+Ambari serves AMS series through the REST API with temporal field
+projections, e.g. `hosts?fields=metrics/cpu/cpu_user[start,end,step]`,
+answering with nested [[value, timestamp], ...] point lists. This module
+asks for many metrics of many hosts or components per request and puts
+the points on a common time grid in a MetricFrame, with vectorised
+resampling and aggregation, so runs can be compared without hand-parsing
+the JSON.
+
+Requires numpy.
+"""
+import warnings
+
+import numpy as np
+
+# Aggregations understood by MetricFrame.aggregate and MetricFrame.summary
+AGGREGATIONS = {"mean": np.nanmean,
+                "max": np.nanmax,
+                "min": np.nanmin,
+                "sum": np.nansum,
+                "p50": lambda a, axis: np.nanpercentile(a, 50, axis=axis),
+                "p95": lambda a, axis: np.nanpercentile(a, 95, axis=axis),
+                "p99": lambda a, axis: np.nanpercentile(a, 99, axis=axis)}
+
+
+def metric_path(metric):
+    """Normalise `metric` to its path below `metrics/`, e.g. cpu/cpu_user."""
+    metric = metric.strip("/")
+    return(metric[len("metrics/"):] if metric.startswith("metrics/") else metric)
+
+
+def temporal_fields(metrics, start, end, step):
+    """Return the fields= value asking for every metric over [start, end] every `step`."""
+    return(",".join("metrics/{}[{},{},{}]".format(metric_path(m), int(start), int(end), int(step))
+                    for m in metrics))
+
+
+def extract_points(item, metric):
+    """Return the [[value, timestamp], ...] list of `metric` in a response item, or []."""
+    node = item.get("metrics", {})
+    for key in metric_path(metric).split("/"):
+        if not isinstance(node, dict) or key not in node:
+            return([])
+        node = node[key]
+    return(node if isinstance(node, list) else [])
+
+
+def bucket(points, start, step, n):
+    """
+    Average the [[value, timestamp], ...] `points` into `n` buckets of `step`
+    seconds from `start`. Buckets without points are NaN.
+    """
+    out = np.full(n, np.nan)
+    if not points:
+        return(out)
+    arr = np.asarray(points, dtype=float)
+    values, stamps = arr[:, 0], arr[:, 1]
+    # AMS returns seconds from the REST API, milliseconds from the collector
+    if stamps.max() > 1e11:
+        stamps = stamps / 1000.0
+    idx = np.floor((stamps - start) / step).astype(int)
+    keep = (idx >= 0) & (idx < n) & ~np.isnan(values)
+    idx, values = idx[keep], values[keep]
+    counts = np.bincount(idx, minlength=n)
+    sums = np.bincount(idx, weights=values, minlength=n)
+    filled = counts > 0
+    out[filled] = sums[filled] / counts[filled]
+    return(out)
+
+
+class MetricFrame(object):
+    """ Metrics of several entities (hosts or components) on a common time grid.
+
+        Attributes:
+            entities: The host or component names, first axis of `values`.
+            metrics: The metric paths, second axis of `values`.
+            timestamps: Start of each time bucket in epoch seconds, third axis.
+            step: Seconds between two buckets.
+            values: float array of shape (entities, metrics, timestamps),
+                NaN where there was no data.
+    """
+
+    def __init__(self, entities, metrics, timestamps, values, step):
+        super(MetricFrame, self).__init__()
+        self.entities = list(entities)
+        self.metrics = [metric_path(m) for m in metrics]
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self.step = step
+
+    @classmethod
+    def from_items(cls, items, key, metrics, start, end, step):
+        """
+        Build a frame from response `items`, naming each entity with
+        key(item), and bucketing every metric onto the [start, end) grid.
+        """
+        timestamps = np.arange(start, end, step, dtype=float)
+        n = len(timestamps)
+        entities, rows = [], []
+        for item in items:
+            entities.append(key(item))
+            rows.append([bucket(extract_points(item, m), start, step, n) for m in metrics])
+        values = np.array(rows).reshape(len(entities), len(metrics), n)
+        return(cls(entities, metrics, timestamps, values, step))
+
+    def series(self, entity, metric):
+        """Return the values of `metric` for `entity` over time."""
+        return(self.values[self.entities.index(entity), self.metrics.index(metric_path(metric))])
+
+    def resample(self, step, how="mean"):
+        """
+        Return a new frame with buckets of `step` seconds (a multiple of the
+        current step), combining the old buckets with `how`.
+        """
+        factor = int(step // self.step)
+        if factor < 1 or step % self.step:
+            raise(ValueError("step must be a multiple of {}".format(self.step)))
+        n = len(self.timestamps) // factor
+        trimmed = self.values[:, :, :n * factor]
+        shaped = trimmed.reshape(len(self.entities), len(self.metrics), n, factor)
+        values = _aggregate(shaped, how, axis=3)
+        return(MetricFrame(self.entities, self.metrics, self.timestamps[:n * factor:factor],
+                           values, step))
+
+    def aggregate(self, how="mean", over="time"):
+        """
+        Aggregate with `how` (mean, p50, p95, p99, max, min, sum) over
+        "time", giving an (entities, metrics) array, or over "entities",
+        giving a (metrics, timestamps) array.
+        """
+        axis = {"time": 2, "entities": 0}[over]
+        return(_aggregate(self.values, how, axis=axis))
+
+    def summary(self, hows=("mean", "p95", "max")):
+        """Return {entity: {metric: {how: value}}} aggregated over time."""
+        stats = dict((how, self.aggregate(how)) for how in hows)
+        out = {}
+        for i, entity in enumerate(self.entities):
+            out[entity] = dict((m, dict((how, float(stats[how][i, j])) for how in hows))
+                               for j, m in enumerate(self.metrics))
+        return(out)
+
+    def align(self, other):
+        """
+        Return (self, other) restricted to their shared entities and metrics,
+        with `other` shifted onto this frame's relative time axis, so runs
+        at different times can be compared bucket for bucket.
+        """
+        mine, theirs = self, other
+        if self.step > other.step:
+            theirs = other.resample(self.step)
+        elif other.step > self.step:
+            mine = self.resample(other.step)
+        entities = [e for e in mine.entities if e in theirs.entities]
+        metrics = [m for m in mine.metrics if m in theirs.metrics]
+        n = min(len(mine.timestamps), len(theirs.timestamps))
+
+        def pick(frame):
+            ei = [frame.entities.index(e) for e in entities]
+            mi = [frame.metrics.index(m) for m in metrics]
+            values = frame.values[np.ix_(ei, mi, np.arange(n))]
+            return(MetricFrame(entities, metrics, mine.timestamps[:n], values, mine.step))
+        return(pick(mine), pick(theirs))
+
+    def __len__(self):
+        return(len(self.entities))
+
+
+def _aggregate(values, how, axis):
+    if how not in AGGREGATIONS:
+        raise(ValueError("Unknown aggregation {}, use one of {}".format(
+            how, ", ".join(sorted(AGGREGATIONS)))))
+    with warnings.catch_warnings():
+        # All-NaN slices are expected for gaps and just give NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return(AGGREGATIONS[how](values, axis=axis))
+
+
+def get_host_metrics(client, metrics, hosts, start, end, step=60, batch_size=50):
+    """
+    Fetch `metrics` (e.g. cpu/cpu_user, memory/mem_free) for `hosts` over
+    [start, end) in epoch seconds, `batch_size` hosts per request.
+
+    Returns
+    -------
+    frame : MetricFrame
+    """
+    fields = "Hosts/host_name," + temporal_fields(metrics, start, end, step)
+    items = []
+    hosts = sorted(hosts)
+    for i in range(0, len(hosts), batch_size):
+        path = "hosts?Hosts/host_name.in({})".format(",".join(hosts[i:i + batch_size]))
+        items.extend(client.iter_collection(path, {"fields": fields}))
+    return(MetricFrame.from_items(items, lambda item: item["Hosts"]["host_name"],
+                                  metrics, start, end, step))
+
+
+def get_component_metrics(client, metrics, components, start, end, step=60):
+    """
+    Fetch `metrics` (e.g. jvm/memHeapUsedM) for `components` over
+    [start, end) in epoch seconds, in a single request.
+
+    Returns
+    -------
+    frame : MetricFrame
+    """
+    fields = "ServiceComponentInfo/component_name," + temporal_fields(metrics, start, end, step)
+    path = "components?ServiceComponentInfo/component_name.in({})".format(
+        ",".join(sorted(components)))
+    items = list(client.iter_collection(path, {"fields": fields}))
+    return(MetricFrame.from_items(items,
+                                  lambda item: item["ServiceComponentInfo"]["component_name"],
+                                  metrics, start, end, step))
@@ -0,0 +1,69 @@
+"""
+Polling alerts: the whole collection every tick versus incremental polls.
+
+Simulates an on-call loop against a fake cluster. A few alerts change
+between ticks. The loop either fetches the full alerts collection each
+tick, or calls poll_alerts, which asks only for alerts with a newer
+Alert/latest_timestamp. Reports requests, bytes received and time per tick.
+
+Usage: python benchmarks/bench_alerts.py [--hosts N] [--ticks N] [--changes N]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ambari_client import AmbariClient  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+
+def full_pull(client):
+    return(list(client.iter_alerts("*")))
+
+
+def incremental(client):
+    return(client.poll_alerts())
+
+
+def run(func, n_hosts, ticks, changes, latency):
+    server = FakeAmbari(n_hosts=n_hosts, latency=latency).start()
+    rnd = random.Random(1)
+    try:
+        client = AmbariClient("127.0.0.1", server.port, server.cluster_name)
+        # Ticks here are milliseconds apart rather than a minute, so the
+        # overlap window would otherwise re-read every earlier change
+        client.alert_index.overlap = 0
+        func(client)
+        # Let the server finish counting the warm-up before resetting
+        time.sleep(0.1)
+        server.reset_stats()
+        seconds = 0.0
+        for _ in range(ticks):
+            for host in rnd.sample(server.cluster.hosts, changes):
+                server.cluster.set_alert_state("ambari_agent_disk_usage", host,
+                                               rnd.choice(["OK", "WARNING", "CRITICAL"]))
+            start = time.time()
+            func(client)
+            seconds += time.time() - start
+        time.sleep(0.1)
+        return(server.stats["requests"] / float(ticks), server.stats["bytes_out"] / 1024.0 / ticks,
+               seconds / ticks)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--hosts", type=int, default=500)
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    print("{} hosts, {} alerts changing per tick".format(args.hosts, args.changes))
+    print("{:<14} {:>14} {:>14} {:>10}".format("", "requests/tick", "KiB recv/tick", "ms/tick"))
+    for name, func in [("full pull", full_pull), ("poll_alerts", incremental)]:
+        requests_, kib, seconds = run(func, args.hosts, args.ticks, args.changes, args.latency)
+        print("{:<14} {:>14.1f} {:>14.1f} {:>10.1f}".format(name, requests_, kib, seconds * 1000))
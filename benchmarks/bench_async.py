@@ -0,0 +1,82 @@
+"""
+Compare the sync AmbariClient with AsyncAmbariClient fan-out.
+
+Runs one host_components read per host and per-service info reads
+against the in-process fake Ambari with injected latency, sequentially
+and fanned out. The single-request topology index is shown for reference.
+
+Usage: python benchmarks/bench_async.py [n_hosts] [latency_seconds]
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ambari_client import AmbariClient  # noqa: E402
+from ambari_async import AsyncAmbariClient  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return(time.time() - start, result)
+
+
+def run(n_hosts, latency):
+    server = FakeAmbari(n_hosts=n_hosts, latency=latency).start()
+    hosts = server.cluster.hosts
+
+    client = AmbariClient("127.0.0.1", server.port, server.cluster_name)
+
+    def sync_on_host(host):
+        url = client.endpoint + "hosts/{}/host_components/".format(host)
+        items = client.get(url).json()["items"]
+        return("DATANODE" in [i["HostRoles"]["component_name"] for i in items])
+
+    def sync_on_hosts():
+        return(dict((h, sync_on_host(h)) for h in hosts))
+
+    def index_on_hosts():
+        client.invalidate_topology("topology_index")
+        return(dict((h, client.component_on_host("DATANODE", h)) for h in hosts))
+
+    def sync_services_info():
+        return(dict((s, client.get_service_info(s)) for s in client.services))
+
+    async def async_workload(max_concurrency):
+        async with AsyncAmbariClient("127.0.0.1", server.port, server.cluster_name,
+                                     max_concurrency=max_concurrency) as amc:
+            await amc.services()
+            start = time.time()
+            on_hosts = await amc.components_on_hosts("DATANODE", hosts)
+            on_hosts_secs = time.time() - start
+            start = time.time()
+            await amc.get_services_info()
+            info_secs = time.time() - start
+        return(on_hosts_secs, info_secs, on_hosts)
+
+    client.services
+    sync_hosts_secs, sync_result = timed(sync_on_hosts)
+    sync_info_secs, _ = timed(sync_services_info)
+    index_hosts_secs, index_result = timed(index_on_hosts)
+    assert index_result == sync_result
+    client.close()
+
+    print("{} hosts, {:.0f} ms injected latency".format(n_hosts, latency * 1000))
+    print("{:<22} {:>16} {:>16}".format("mode", "component_on_host", "services_info"))
+    print("{:<22} {:>16.3f} {:>16.3f}".format("sync", sync_hosts_secs, sync_info_secs))
+    print("{:<22} {:>16.3f} {:>16}".format("sync topology index", index_hosts_secs, "-"))
+    for concurrency in (5, 20):
+        hosts_secs, info_secs, result = asyncio.run(async_workload(concurrency))
+        assert result == sync_result
+        name = "async (limit {})".format(concurrency)
+        print("{:<22} {:>16.3f} {:>16.3f}".format(name, hosts_secs, info_secs))
+
+    server.stop()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.01)
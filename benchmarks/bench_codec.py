@@ -0,0 +1,122 @@
+"""
+JSON codecs and gzip on blueprint-sized payloads.
+
+Grows the fake cluster's configurations until its blueprint is several
+MB, then reports:
+
+1. Decoding the blueprint and encoding a large desired_config PUT body
+   with each installed codec (json, and orjson if installed), in process.
+2. get_blueprint and get_configurations over HTTP for each codec with gzip
+   on and off. The fake server gzips like Ambari (responses over 10 KiB)
+   and carries responses over a link of --bandwidth bytes per second.
+
+Usage: python benchmarks/bench_codec.py [--hosts N] [--types N] [--properties N]
+                                        [--bandwidth B] [--repeat N]
+"""
+import os
+import sys
+import time
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ambari_client import AmbariClient  # noqa: E402
+from json_codec import get_codec, orjson  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+CODECS = ["json", "orjson"] if orjson is not None else ["json"]
+
+
+def grow_configs(cluster, n_types, n_properties):
+    """Add `n_types` config types of `n_properties` properties each, like a big stack."""
+    for t in range(n_types):
+        conf_name = "service{:02d}-site".format(t)
+        props = {}
+        for i in range(n_properties):
+            key = "service{}.component.setting.{}".format(t, i)
+            if i % 50 == 0:
+                # *-env style templates are long multi-line strings
+                props[key] = "\n".join("export VAR_{}_{}=/var/lib/service{}/{}".format(i, j, t, j)
+                                       for j in range(40))
+            elif i % 3 == 0:
+                props[key] = str(i * 1024)
+            else:
+                props[key] = "/hadoop/service{}/data{},/grid/{}/service{}".format(t, i, i % 12, t)
+        cluster.configs[(conf_name, "version1")] = props
+        cluster.desired[conf_name] = "version1"
+    return("service00-site")
+
+
+def timed(func, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        result = func()
+    return(result, (time.time() - start) / repeat)
+
+
+def in_process(server, big_conf, repeat):
+    body = json.dumps(server.blueprint()).encode("utf-8")
+    properties = server.cluster.configs[(big_conf, "version1")]
+    payload = [{"Clusters": {"desired_config": [{"type": big_conf, "tag": "version2",
+                                                 "properties": properties}]}}]
+    rows = []
+    for name in CODECS:
+        codec = get_codec(name)
+        _, decode = timed(lambda: codec.loads(body), repeat)
+        encoded, encode = timed(lambda: codec.dumps(payload), repeat)
+        rows.append((name, decode, encode))
+    return(len(body), len(codec.dumps(payload)), rows)
+
+
+def over_http(server, big_conf, repeat):
+    rows = []
+    for name in CODECS:
+        for compress in (False, True):
+            client = AmbariClient("127.0.0.1", server.port, server.cluster_name,
+                                  codec=name, compress=compress)
+            client.get_blueprint()
+            time.sleep(0.05)
+            server.reset_stats()
+            _, blueprint = timed(client.get_blueprint, repeat)
+            time.sleep(0.05)
+            received = server.stats["bytes_out"] / float(repeat)
+
+            def get_conf():
+                client.config_cache.clear()
+                return(client.get_configurations(big_conf, "version1"))
+            _, conf = timed(get_conf, repeat)
+            rows.append((name, "on" if compress else "off", received, blueprint, conf))
+            client.close()
+    return(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--hosts", type=int, default=500)
+    parser.add_argument("--types", type=int, default=20)
+    parser.add_argument("--properties", type=int, default=1000)
+    parser.add_argument("--bandwidth", type=float, default=12.5e6,
+                        help="bytes per second of the link to Ambari (default 100 Mbit/s)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    server = FakeAmbari(n_hosts=args.hosts, gzip_min_size=10240,
+                        bandwidth=args.bandwidth).start()
+    try:
+        big_conf = grow_configs(server.cluster, args.types, args.properties)
+        size, put_size, rows = in_process(server, big_conf, args.repeat)
+        print("Blueprint of {:.1f} MB, {} PUT body of {:.0f} KB".format(
+            size / 1e6, big_conf, put_size / 1e3))
+        print("{:<8} {:>14} {:>14}".format("codec", "decode ms", "encode PUT ms"))
+        for name, decode, encode in rows:
+            print("{:<8} {:>14.1f} {:>14.2f}".format(name, decode * 1000, encode * 1000))
+
+        print("")
+        print("Over a {:.0f} Mbit/s link".format(args.bandwidth * 8 / 1e6))
+        print("{:<8} {:>5} {:>14} {:>16} {:>20}".format(
+            "codec", "gzip", "KB received", "get_blueprint ms", "get_configurations ms"))
+        for name, gzip, received, blueprint, conf in over_http(server, big_conf, args.repeat):
+            print("{:<8} {:>5} {:>14.0f} {:>16.1f} {:>20.1f}".format(
+                name, gzip, received / 1e3, blueprint * 1000, conf * 1000))
+    finally:
+        server.stop()
@@ -0,0 +1,69 @@
+"""
+Compare trial orderings of the experiment runner.
+
+Runs the same blueprint configurations against the fake Ambari in the
+order given, in Gray code order and in the scheduled (auto) order, and
+reports the configuration groups changed, host components restarted and
+trials per hour. Restart requests take request_duration per service
+restarted, so restart scope shows up in the timings.
+
+Usage: python benchmarks/bench_experiment.py [--trials N] [--hosts N]
+                                             [--request-duration S] [--seed N]
+"""
+import os
+import sys
+import random
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ambari_client import AmbariClient  # noqa: E402
+from experiment import ExperimentRunner, order_trials, schedule_cost  # noqa: E402
+from make_blueprint_index import BLUEPRINT_SPACE  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+POLL = {"poll_interval": 0.02, "max_interval": 0.2}
+
+
+def run_order(indices, n_hosts, request_duration):
+    server = FakeAmbari(n_hosts=n_hosts, request_duration=request_duration).start()
+    try:
+        client = AmbariClient("127.0.0.1", server.port, server.cluster_name)
+        runner = ExperimentRunner(client)
+        for index in indices:
+            runner.run_trial(index, **POLL)
+        client.close()
+        result = runner.summary()
+        result["restarted"] = server.cluster.restarted
+        result["cost"] = schedule_cost(BLUEPRINT_SPACE, indices)
+        return(result)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--trials", type=int, default=16)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--request-duration", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    indices = BLUEPRINT_SPACE.sample(args.trials, seed=args.seed)
+    # A shuffled order is what picking configurations at random gives
+    shuffled = list(indices)
+    random.Random(args.seed).shuffle(shuffled)
+    orders = [("random", shuffled),
+              ("gray", order_trials(BLUEPRINT_SPACE, indices, "gray")),
+              ("auto", order_trials(BLUEPRINT_SPACE, indices))]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = [(name, run_order(order, args.hosts, args.request_duration))
+                   for name, order in orders]
+
+    print("{} trials, {} hosts, {:.2f} s per service restarted".format(
+        args.trials, args.hosts, args.request_duration))
+    print("{:<8} {:>14} {:>10} {:>10} {:>14}".format(
+        "order", "groups changed", "restarted", "seconds", "trials/hour"))
+    for name, r in results:
+        print("{:<8} {:>14} {:>10} {:>10.2f} {:>14.0f}".format(
+            name, r["cost"], r["restarted"], r["seconds"], r["trials_per_hour"]))
@@ -0,0 +1,78 @@
+"""
+Fleet-wide status checks, one cluster at a time versus through a Fleet.
+
+Starts several fake Ambari servers with different latencies (one of
+them slow) plus one endpoint nothing listens on, and reads every
+cluster's service states sequentially with separate clients and then
+concurrently with a Fleet. The Fleet should take about as long as the
+slowest cluster, and the dead one should only fail its own entry.
+
+Usage: python benchmarks/bench_fleet.py [--clusters N] [--latency S] [--slow S]
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ambari_client import AmbariClient  # noqa: E402
+from fleet import Fleet  # noqa: E402
+from resilience import RetryPolicy  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return(port)
+
+
+def sequential(clusters):
+    start = time.time()
+    ok, failed = 0, 0
+    for c in clusters:
+        client = AmbariClient(c["namenode"], c["port"], c["cluster_name"],
+                              timeout=2, retry=RetryPolicy(max_attempts=1))
+        try:
+            client.get_all_service_states()
+            ok += 1
+        except Exception:
+            failed += 1
+        client.close()
+    return(ok, failed, time.time() - start)
+
+
+def with_fleet(clusters):
+    start = time.time()
+    with Fleet(clusters, timeout=2, retry=RetryPolicy(max_attempts=1)) as fleet:
+        results = fleet.get_service_states()
+    failed = len(Fleet.errors(results))
+    return(len(results) - failed, failed, time.time() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--clusters", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow", type=float, default=0.5)
+    args = parser.parse_args()
+
+    servers = [FakeAmbari(cluster_name="c{:02d}".format(i), n_hosts=10,
+                          latency=args.slow if i == 0 else args.latency).start()
+               for i in range(args.clusters)]
+    clusters = [{"namenode": "127.0.0.1", "port": s.port, "cluster_name": s.cluster_name}
+                for s in servers]
+    clusters.append({"namenode": "127.0.0.1", "port": free_port(), "cluster_name": "down"})
+    try:
+        print("{} clusters ({:.0f} ms latency, one at {:.0f} ms) and one down".format(
+            args.clusters, args.latency * 1000, args.slow * 1000))
+        print("{:<12} {:>4} {:>7} {:>9}".format("", "ok", "failed", "seconds"))
+        for name, func in [("sequential", sequential), ("fleet", with_fleet)]:
+            ok, failed, seconds = func(clusters)
+            print("{:<12} {:>4} {:>7} {:>9.3f}".format(name, ok, failed, seconds))
+    finally:
+        for s in servers:
+            s.stop()
@@ -0,0 +1,68 @@
+"""
+Peak client memory of reading a large collection in one response versus
+walking it with AmbariClient.iter_collection.
+
+The fake Ambari runs in a child process with a synthetic 5,000-host
+cluster so only the client's allocations are traced.
+
+Usage: python benchmarks/bench_memory.py [n_hosts] [page_size]
+"""
+import os
+import sys
+import time
+import tracemalloc
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ambari_client  # noqa: E402
+from ambari_client import AmbariClient, HOST_INDEX_FIELDS  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+
+def serve(n_hosts, queue):
+    server = FakeAmbari(n_hosts=n_hosts)
+    queue.put(server.port)
+    server.serve_forever()
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.time()
+    count = func()
+    secs = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return(count, secs, peak / 1024.0 / 1024.0)
+
+
+def run(n_hosts, page_size):
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=serve, args=(n_hosts, queue))
+    proc.daemon = True
+    proc.start()
+    port = queue.get()
+
+    client = AmbariClient("127.0.0.1", port, "fake", page_size=page_size)
+    params = {"fields": HOST_INDEX_FIELDS}
+
+    def whole():
+        items = client.get(client.endpoint + "hosts", params=params).json()["items"]
+        return(sum(len(i["host_components"]) for i in items))
+
+    def paged():
+        return(sum(len(i["host_components"]) for i in client.iter_hosts(HOST_INDEX_FIELDS)))
+
+    print("{} hosts, page_size {}, ijson {}".format(
+        n_hosts, page_size, "installed" if ambari_client.ijson else "not installed"))
+    print("{:<20} {:>16} {:>10} {:>14}".format("mode", "host_components", "seconds", "peak MiB"))
+    for name, func in [("single response", whole), ("iter_collection", paged)]:
+        count, secs, peak = measure(func)
+        print("{:<20} {:>16} {:>10.3f} {:>14.2f}".format(name, count, secs, peak))
+
+    client.close()
+    proc.terminate()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 250)
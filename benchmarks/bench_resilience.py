@@ -0,0 +1,112 @@
+"""
+Retries and adaptive concurrency against a fault-injecting fake Ambari.
+
+1. Runs a config change + restart workflow many times against a server
+   failing a share of requests with 500/503, with retrying off and on,
+   and reports how many runs got through.
+2. Fires reads from many threads at a server with limited capacity,
+   unthrottled and through an AdaptiveLimiter, and reports throughput,
+   overload errors and latency.
+
+Usage: python benchmarks/bench_resilience.py [--error-rate R] [--runs N]
+                                             [--threads N] [--capacity N]
+"""
+import os
+import sys
+import time
+import argparse
+import contextlib
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ambari_client import AmbariClient  # noqa: E402
+from resilience import RetryPolicy, AdaptiveLimiter  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+POLL = {"poll_interval": 0.02, "max_interval": 0.1}
+
+
+def workflow(client, n):
+    value = "false" if n % 2 else "true"
+    note, response = client.put_new_confs({"hive-site": {"hive.vectorized.execution.enabled": value}})
+    if response is not None:
+        response.raise_for_status()
+    client.restart_stale(**POLL)
+    client.restart_all_services(**POLL)
+
+
+def run_faults(error_rate, runs, retry):
+    server = FakeAmbari(n_hosts=5, request_duration=0.02, error_rate=error_rate, seed=1).start()
+    ok = 0
+    try:
+        client = AmbariClient("127.0.0.1", server.port, server.cluster_name, retry=retry)
+        for n in range(runs):
+            try:
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    workflow(client, n)
+                ok += 1
+            except Exception:
+                pass
+        return({"ok": ok, "runs": runs, "requests": server.stats["requests"],
+                "faults": server.stats["faults"], "retries": client.retry.retries})
+    finally:
+        server.stop()
+
+
+def run_load(threads, capacity, calls, limiter):
+    server = FakeAmbari(n_hosts=5, latency=0.01, capacity=capacity).start()
+    try:
+        client = AmbariClient("127.0.0.1", server.port, server.cluster_name,
+                              pool_maxsize=threads, retry=RetryPolicy(max_attempts=1),
+                              limiter=limiter)
+
+        def call(_):
+            start = time.time()
+            response = client.get(client.endpoint + "services")
+            return(response.status_code, time.time() - start)
+
+        pool = ThreadPool(threads)
+        start = time.time()
+        try:
+            results = pool.map(call, range(calls))
+        finally:
+            pool.close()
+        seconds = time.time() - start
+        latencies = sorted(r[1] for r in results if r[0] == 200)
+        return({"ok": len(latencies), "overloaded": sum(1 for r in results if r[0] == 503),
+                "seconds": seconds, "ok_per_second": len(latencies) / seconds,
+                "p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+                "max_inflight": server.max_inflight,
+                "limit": limiter.summary()["limit"] if limiter else None})
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--calls", type=int, default=400)
+    args = parser.parse_args()
+
+    print("Workflow runs with {:.0%} of requests failing".format(args.error_rate))
+    print("{:<10} {:>8} {:>10} {:>8} {:>8}".format("retry", "ok runs", "requests", "faults",
+                                                  "retries"))
+    for name, retry in [("off", RetryPolicy(max_attempts=1)),
+                        ("on", RetryPolicy(max_attempts=5, backoff=0.01))]:
+        r = run_faults(args.error_rate, args.runs, retry)
+        print("{:<10} {:>8} {:>10} {:>8} {:>8}".format(
+            name, "{}/{}".format(r["ok"], r["runs"]), r["requests"], r["faults"], r["retries"]))
+
+    print("")
+    print("{} reads from {} threads, server capacity {}".format(
+        args.calls, args.threads, args.capacity))
+    print("{:<10} {:>6} {:>10} {:>10} {:>10} {:>12} {:>8}".format(
+        "limiter", "ok", "503s", "ok/s", "p95 ms", "max inflight", "limit"))
+    for name, limiter in [("none", None), ("adaptive", AdaptiveLimiter(initial=4))]:
+        r = run_load(args.threads, args.capacity, args.calls, limiter)
+        print("{:<10} {:>6} {:>10} {:>10.1f} {:>10.1f} {:>12} {:>8}".format(
+            name, r["ok"], r["overloaded"], r["ok_per_second"], r["p95"] * 1000,
+            r["max_inflight"], r["limit"] if r["limit"] is not None else "-"))
@@ -0,0 +1,49 @@
+"""
+Benchmark connection reuse of the pooled AmbariClient session.
+
+Compares one-connection-per-call requests against the client's shared
+session on the fake Ambari server, counting the TCP connections each opens.
+
+Usage: python benchmarks/bench_session.py [n_calls]
+"""
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ambari_client import AmbariClient  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+
+def run(n_calls):
+    server = FakeAmbari().start()
+    hdrs = {"X-Requested-By": "ambari"}
+    auth = ("admin", "admin")
+
+    client = AmbariClient("127.0.0.1", server.port, server.cluster_name, auth, hdrs)
+    url = client.endpoint + "services/"
+
+    server.reset_stats()
+    start = time.time()
+    for _ in range(n_calls):
+        requests.get(url, auth=auth, headers=hdrs).json()
+    unpooled = (time.time() - start, server.stats["connections"], server.stats["requests"])
+
+    server.reset_stats()
+    start = time.time()
+    for _ in range(n_calls):
+        client.get(url).json()
+    pooled = (time.time() - start, server.stats["connections"], server.stats["requests"])
+
+    client.close()
+    server.stop()
+
+    print("{:<12} {:>10} {:>12} {:>10}".format("mode", "seconds", "connections", "requests"))
+    for name, (secs, conns, reqs) in [("unpooled", unpooled), ("session", pooled)]:
+        print("{:<12} {:>10.3f} {:>12} {:>10}".format(name, secs, conns, reqs))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
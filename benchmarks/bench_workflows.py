@@ -0,0 +1,137 @@
+"""
+End-to-end benchmarks of the main AmbariClient workflows.
+
+Each workflow runs with a fresh client against a fresh fake Ambari
+(benchmarks/fake_ambari.py) and reports the round-trips, bytes sent and
+received and wall-clock time it took, so regressions show up in numbers.
+
+Usage: python benchmarks/bench_workflows.py [--hosts N] [--latency S]
+                                            [--request-duration S] [--json FILE]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ambari_client import AmbariClient, get_components_states  # noqa: E402
+from fake_ambari import FakeAmbari  # noqa: E402
+
+POLL = {"poll_interval": 0.05, "max_interval": 0.5}
+
+
+def construct(client):
+    return(client)
+
+
+def services_states(client):
+    return(client.get_services_states())
+
+
+def components_states(client):
+    return(get_components_states(client, "HDFS"))
+
+
+def put_new_conf(client):
+    return(client.put_new_conf("hive-site", **{"hive.vectorized.execution.enabled": "false"}))
+
+
+def put_new_confs(client):
+    return(client.put_new_confs({"hive-site": {"hive.vectorized.execution.enabled": "false"},
+                                 "yarn-site": {"yarn.scheduler.minimum-allocation-mb": "1024"},
+                                 "hdfs-site": {"dfs.replication": "2"}}))
+
+
+def move_component(client):
+    return(client.move_component("WEBHCAT_SERVER", "host0000.fake", "host0001.fake", **POLL))
+
+
+def cycle_datanodes_per_host(client):
+    hosts = client.get_component_hosts("DATANODE")
+    responses = [client.stop_component("DATANODE", h) for h in hosts]
+    for response in responses:
+        client.wait_for_response(response, **POLL)
+    responses = [client.start_component("DATANODE", h) for h in hosts]
+    for response in responses:
+        client.wait_for_response(response, **POLL)
+
+
+def cycle_datanodes_bulk(client):
+    hosts = client.get_component_hosts("DATANODE")
+    client.wait_for_requests(client.stop_components("DATANODE", hosts), **POLL)
+    client.wait_for_requests(client.start_components("DATANODE", hosts), **POLL)
+
+
+def restart_all_services(client):
+    return(client.restart_all_services(**POLL))
+
+
+def change_and_restart_stale(client):
+    put_new_conf(client)
+    return(client.restart_stale(**POLL))
+
+
+WORKFLOWS = [("client construction", construct),
+             ("get_services_states", services_states),
+             ("get_components_states", components_states),
+             ("put_new_conf", put_new_conf),
+             ("put_new_confs (3 types)", put_new_confs),
+             ("move_component", move_component),
+             ("DATANODE stop/start per host", cycle_datanodes_per_host),
+             ("DATANODE stop/start bulk", cycle_datanodes_bulk),
+             ("restart_all_services", restart_all_services),
+             ("put_new_conf + restart_stale", change_and_restart_stale)]
+
+
+def run_workflow(func, n_hosts, latency, request_duration):
+    server = FakeAmbari(n_hosts=n_hosts, latency=latency,
+                        request_duration=request_duration).start()
+    try:
+        start = time.time()
+        client = AmbariClient("127.0.0.1", server.port, server.cluster_name)
+        func(client)
+        secs = time.time() - start
+        client.close()
+        result = dict(server.stats)
+        result["seconds"] = secs
+        return(result)
+    finally:
+        server.stop()
+
+
+def run(n_hosts, latency, request_duration):
+    results = []
+    for name, func in WORKFLOWS:
+        result = run_workflow(func, n_hosts, latency, request_duration)
+        result["workflow"] = name
+        results.append(result)
+    return(results)
+
+
+def report(results, n_hosts, latency, request_duration):
+    print("{} hosts, {:.0f} ms latency, {:.1f} s per Ambari request".format(
+        n_hosts, latency * 1000, request_duration))
+    print("{:<30} {:>8} {:>12} {:>12} {:>10}".format(
+        "workflow", "requests", "KiB sent", "KiB recv", "seconds"))
+    for r in results:
+        print("{:<30} {:>8} {:>12.1f} {:>12.1f} {:>10.3f}".format(
+            r["workflow"], r["requests"], r["bytes_in"] / 1024.0,
+            r["bytes_out"] / 1024.0, r["seconds"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--hosts", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--request-duration", type=float, default=0.2)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.hosts, args.latency, args.request_duration)
+    report(results, args.hosts, args.latency, args.request_duration)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"hosts": args.hosts, "latency": args.latency,
+                       "request_duration": args.request_duration,
+                       "results": results}, f, indent=2)
@@ -0,0 +1,833 @@
+"""
+An in-process stand-in for the Ambari REST API, used by the benchmarks.
+
+Serves a synthetic cluster of configurable size over keep-alive HTTP on
+localhost: services, components, hosts and host_components, configurations
+and desired_configs, requests with progress, and /jmx. Collections honour
+fields= projections and page_size/from paging like Ambari does. An optional
+per-request latency makes client-side round-trip savings show up as
+wall-clock time, and every request is counted in `stats`.
+
+Like Ambari, responses of `gzip_min_size` bytes or more are gzipped for
+clients that accept it (off by default), and `bandwidth` (bytes per
+second) adds the time a slow link would take to carry each response.
+
+Faults can be injected to exercise retries: `error_rate` answers that
+share of requests with one of `fault_statuses` before doing anything, and
+`capacity` models an overloaded server, whose latency grows with the
+requests in flight beyond it and which answers 503 past twice that.
+
+    server = FakeAmbari(n_hosts=20, latency=0.01).start()
+    client = AmbariClient("127.0.0.1", server.port, server.cluster_name)
+    ...
+    print(server.stats)
+    server.stop()
+
+It can also be run on its own to point scripts or an interactive session at:
+
+    python benchmarks/fake_ambari.py --hosts 50 --latency 0.02 --port 8080
+"""
+import re
+import json
+import math
+import time
+import random
+import zlib
+import argparse
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+SERVICES = {"HDFS": ["NAMENODE", "SECONDARY_NAMENODE", "DATANODE", "HDFS_CLIENT"],
+            "YARN": ["RESOURCEMANAGER", "NODEMANAGER", "YARN_CLIENT"],
+            "MAPREDUCE2": ["HISTORYSERVER", "MAPREDUCE2_CLIENT"],
+            "HIVE": ["HIVE_METASTORE", "HIVE_SERVER", "WEBHCAT_SERVER", "HIVE_CLIENT"],
+            "ZOOKEEPER": ["ZOOKEEPER_SERVER", "ZOOKEEPER_CLIENT"]}
+
+# Keys Ambari always returns for a resource, whatever fields= asks for
+ID_FIELDS = {"ServiceInfo": ["cluster_name", "service_name"],
+             "ServiceComponentInfo": ["cluster_name", "component_name", "service_name"],
+             "HostRoles": ["cluster_name", "component_name", "host_name"],
+             "Hosts": ["cluster_name", "host_name"],
+             "Requests": ["cluster_name", "id"],
+             "Alert": ["cluster_name", "id", "definition_id", "definition_name", "host_name"],
+             "AlertDefinition": ["cluster_name", "id", "name"],
+             "Clusters": ["cluster_name"]}
+
+# Services whose host components need a restart after a config type changes
+CONFIG_SERVICES = {"hdfs-site": ["HDFS", "YARN", "MAPREDUCE2"],
+                   "yarn-site": ["YARN", "MAPREDUCE2"],
+                   "hive-site": ["HIVE"]}
+
+# Components placed on the first host only; everything else goes on every host
+MASTERS = ["NAMENODE", "SECONDARY_NAMENODE", "RESOURCEMANAGER", "HISTORYSERVER",
+           "HIVE_METASTORE", "HIVE_SERVER", "WEBHCAT_SERVER", "ZOOKEEPER_SERVER"]
+
+CONFIGS = {"hdfs-site": {"dfs.replication": "3", "dfs.blocksize": "134217728"},
+           "yarn-site": {"yarn.nodemanager.resource.memory-mb": "2048",
+                         "yarn.scheduler.minimum-allocation-mb": "682"},
+           "hive-site": {"hive.vectorized.execution.enabled": "true",
+                         "hive.vectorized.execution.reduce.enabled": "true"}}
+
+# The service each config type belongs to, for service_config_versions
+CONFIG_OWNER = {"hdfs-site": "HDFS", "yarn-site": "YARN", "hive-site": "HIVE"}
+
+# Alert definitions of a new cluster: name, label, service, component.
+# AMBARI_AGENT alerts are on every host.
+ALERT_DEFINITIONS = [("datanode_process", "DataNode Process", "HDFS", "DATANODE"),
+                     ("namenode_cpu", "NameNode Host CPU Utilization", "HDFS", "NAMENODE"),
+                     ("nodemanager_health", "NodeManager Health", "YARN", "NODEMANAGER"),
+                     ("ambari_agent_disk_usage", "Host Disk Usage", "AMBARI", "AMBARI_AGENT")]
+
+# Query parameters that are not predicates
+RESERVED_PARAMS = ("fields", "page_size", "from", "format", "qry", "sortBy", "type", "tag")
+
+
+class FakeCluster(object):
+    """In-memory cluster state served by FakeAmbari."""
+
+    def __init__(self, cluster_name="fake", n_hosts=5, request_duration=0.0):
+        self.cluster_name = cluster_name
+        self.request_duration = request_duration
+        # id -> (context, time created)
+        self.requests = {}
+        self.hosts = ["host{:04d}.fake".format(i) for i in range(n_hosts)]
+        self.service_of = {}
+        for service, components in SERVICES.items():
+            for c in components:
+                self.service_of[c] = service
+        self.service_state = dict((s, "STARTED") for s in SERVICES)
+        # host -> {component: state}
+        self.host_components = {}
+        for i, host in enumerate(self.hosts):
+            self.host_components[host] = dict((c, "STARTED") for c in self.service_of
+                                              if i == 0 or c not in MASTERS)
+        # (type, tag) -> properties, and type -> current tag
+        self.configs = dict(((t, "version1"), dict(p)) for t, p in CONFIGS.items())
+        self.desired = dict((t, "version1") for t in CONFIGS)
+        # (host, component) pairs running with out of date configs
+        self.stale = set()
+        # Host components restarted by RESTART requests
+        self.restarted = 0
+        # service_config_versions items, oldest first
+        self.service_config_versions = []
+        for service in sorted(set(CONFIG_OWNER.values())):
+            self.new_service_config_version(service, "Initial configurations")
+        # id -> AlertDefinition, and id -> Alert; the initial alerts ran an hour ago
+        self.alert_definitions = {}
+        self.alerts = {}
+        for name, label, service, component in ALERT_DEFINITIONS:
+            self.add_alert_definition({"name": name, "label": label, "service_name": service,
+                                       "component_name": component, "interval": 1,
+                                       "scope": "HOST", "enabled": True,
+                                       "source": {"type": "SCRIPT"}},
+                                      int((time.time() - 3600) * 1000))
+        self.lock = threading.Lock()
+
+    def new_request(self, context, scale=1):
+        """
+        Register an asynchronous operation and return its Ambari response body.
+        It takes `scale` times request_duration to complete.
+        """
+        request_id = len(self.requests) + 1
+        self.requests[request_id] = (context, time.time(), scale)
+        return({"href": "requests/{}".format(request_id),
+                "Requests": {"id": request_id, "status": "Accepted"}})
+
+    def new_service_config_version(self, service, note):
+        """Record the current configs of `service` as its next service config version."""
+        versions = [v for v in self.service_config_versions if v["service_name"] == service]
+        for v in versions:
+            v["is_current"] = False
+        configurations = [{"type": t, "tag": self.desired[t], "version": len(versions) + 1,
+                           "properties": dict(self.configs[(t, self.desired[t])])}
+                          for t in sorted(CONFIG_OWNER) if CONFIG_OWNER[t] == service]
+        self.service_config_versions.append({
+            "cluster_name": self.cluster_name,
+            "service_name": service,
+            "service_config_version": len(versions) + 1,
+            "service_config_version_note": note,
+            "is_current": True,
+            "createtime": int(time.time() * 1000),
+            "user": "admin",
+            "configurations": configurations})
+
+    def add_alert_definition(self, definition, timestamp=None):
+        """Store an alert definition and create its alerts, in state OK, on the hosts it covers."""
+        timestamp = timestamp or int(time.time() * 1000)
+        definition_id = len(self.alert_definitions) + 1
+        definition = dict(definition, id=definition_id, cluster_name=self.cluster_name)
+        self.alert_definitions[definition_id] = definition
+        component = definition.get("component_name")
+        for host in self.hosts:
+            if component != "AMBARI_AGENT" and component not in self.host_components[host]:
+                continue
+            alert_id = len(self.alerts) + 1
+            self.alerts[alert_id] = {
+                "cluster_name": self.cluster_name, "id": alert_id,
+                "definition_id": definition_id, "definition_name": definition["name"],
+                "service_name": definition.get("service_name"), "component_name": component,
+                "host_name": host, "label": definition.get("label"), "state": "OK",
+                "text": "OK", "maintenance_state": "OFF", "scope": definition.get("scope"),
+                "instance": None, "latest_timestamp": timestamp,
+                "original_timestamp": timestamp}
+        return(definition_id)
+
+    def set_alert_state(self, definition_name, host, state, text=None):
+        """Record a run of the alert `definition_name` on `host` that found it in `state`."""
+        now = int(time.time() * 1000)
+        for alert in self.alerts.values():
+            if alert["definition_name"] == definition_name and alert["host_name"] == host:
+                if alert["state"] != state:
+                    alert["original_timestamp"] = now
+                alert.update(state=state, text=text or state, latest_timestamp=now)
+
+    def request_status(self, request_id):
+        """Return (status, progress) of a request, completing after request_duration."""
+        context, created, scale = self.requests[request_id]
+        elapsed = time.time() - created
+        duration = self.request_duration * scale
+        if elapsed >= duration:
+            return("COMPLETED", 100.0)
+        return("IN_PROGRESS", round(100.0 * elapsed / duration, 1))
+
+    def component_state(self, component):
+        states = [hc[component] for hc in self.host_components.values() if component in hc]
+        return("STARTED" if states and all(s == "STARTED" for s in states) else "INSTALLED")
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.count("connections")
+
+    def end_headers(self):
+        buffered = getattr(self, "_headers_buffer", [])
+        self.server.count("bytes_out", sum(len(b) for b in buffered) + 2)
+        BaseHTTPRequestHandler.end_headers(self)
+
+    def _reply(self, data, status=200):
+        server = self.server
+        body = json.dumps(data).encode("utf-8") if data is not None else b""
+        gzipped = server.gzip_min_size is not None and len(body) >= server.gzip_min_size and \
+            "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            body = compressor.compress(body) + compressor.flush()
+        if server.bandwidth:
+            time.sleep(len(body) / float(server.bandwidth))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count("bytes_out", len(body))
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        self.server.count("bytes_in", len(raw))
+        return(json.loads(raw.decode("utf-8")) if raw else None)
+
+    def _dispatch(self, method):
+        server = self.server
+        server.count("requests")
+        server.count("bytes_in", len(self.raw_requestline) + len(str(self.headers)))
+        body = self._body() if method in ("PUT", "POST") else None
+        inflight = server.enter()
+        try:
+            fault = server.fault(inflight)
+            if fault:
+                server.count("faults")
+                self._reply({"status": fault, "message": "Injected fault"}, fault)
+                return
+            if server.latency:
+                load = float(inflight) / server.capacity if server.capacity else 1.0
+                time.sleep(server.latency * max(1.0, load))
+            url = urlparse(self.path)
+            query = dict((k, v[0]) for k, v in
+                         parse_qs(url.query, keep_blank_values=True).items())
+            with server.cluster.lock:
+                status, data = server.route(method, url.path, query, body)
+            self._reply(data, status)
+        finally:
+            server.leave()
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class FakeAmbari(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server answering a subset of the Ambari v1 API."""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, cluster_name="fake", n_hosts=5, latency=0.0, request_duration=0.0,
+                 host="127.0.0.1", port=0, error_rate=0.0, fault_statuses=(500, 503),
+                 capacity=None, seed=None, gzip_min_size=None, bandwidth=None):
+        HTTPServer.__init__(self, (host, port), FakeHandler)
+        self.cluster = FakeCluster(cluster_name, n_hosts, request_duration)
+        self.cluster_name = cluster_name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fault_statuses = tuple(fault_statuses)
+        self.capacity = capacity
+        self.gzip_min_size = gzip_min_size
+        self.bandwidth = bandwidth
+        self.inflight = 0
+        self.max_inflight = 0
+        self._random = random.Random(seed)
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def port(self):
+        return(self.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return(self)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def href(self, *parts):
+        return("http://{}:{}/api/v1/clusters/{}/{}".format(
+            self.server_address[0], self.port, self.cluster_name, "/".join(parts)))
+
+    def reset_stats(self):
+        self.stats = {"requests": 0, "connections": 0, "bytes_in": 0, "bytes_out": 0,
+                      "faults": 0}
+
+    def enter(self):
+        """Count a request in flight and return how many there are."""
+        with self._stats_lock:
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            return(self.inflight)
+
+    def leave(self):
+        with self._stats_lock:
+            self.inflight -= 1
+
+    def fault(self, inflight):
+        """Return the status of an injected fault for this request, or None."""
+        if self.capacity and inflight > 2 * self.capacity:
+            return(503)
+        with self._stats_lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                return(self._random.choice(self.fault_statuses))
+        return(None)
+
+    def count(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    @staticmethod
+    def project(data, fields):
+        """
+        Keep only the `fields` paths (e.g. ServiceInfo/state) of `data`,
+        plus the href and the identifying keys of each resource.
+        Nested lists such as host_components are projected item by item.
+        """
+        if not isinstance(data, dict):
+            return(data)
+        out = {}
+        if "href" in data:
+            out["href"] = data["href"]
+        for category, keys in ID_FIELDS.items():
+            if isinstance(data.get(category), dict):
+                out[category] = dict((k, data[category][k]) for k in keys
+                                     if k in data[category])
+        heads = {}
+        for field in fields:
+            head, _, rest = field.partition("/")
+            heads.setdefault(head, []).append(rest)
+        for head, rests in heads.items():
+            if head not in data:
+                continue
+            value = data[head]
+            if "" in rests or head == "*":
+                out[head] = value
+            elif isinstance(value, list):
+                out[head] = [FakeAmbari.project(v, rests) for v in value]
+            else:
+                projected = FakeAmbari.project(value, rests)
+                if isinstance(out.get(head), dict):
+                    projected.update(out[head])
+                out[head] = projected
+        return(out)
+
+    @staticmethod
+    def matches(item, query):
+        """
+        Check `item` against the Category/key.in(a,b) and key=value
+        predicates in `query`. Keys the item does not have are ignored.
+        """
+        def lookup(path):
+            node = item
+            for key in path.split("/"):
+                if not isinstance(node, dict) or key not in node:
+                    return(None)
+                node = node[key]
+            # Compare as they appear in the JSON, e.g. true rather than True
+            return(json.dumps(node) if isinstance(node, bool) else node)
+
+        for key, value in query.items():
+            match = re.match(r"^([\w/]+)\.in\((.*)\)$", key)
+            # Requests/id>5 has no value; Requests/id>=5 splits at the =
+            compare = re.match(r"^([\w/]+)(<|>)(\d*)$", key)
+            if match:
+                path, values = match.groups()
+                if str(lookup(path)) not in values.split(","):
+                    return(False)
+            elif compare:
+                path, op, number = compare.groups()
+                inclusive = not number
+                number = float(number or value)
+                found = lookup(path)
+                if found is None or (inclusive and found == number):
+                    if found is None:
+                        return(False)
+                    continue
+                if (found > number) != (op == ">") or found == number:
+                    return(False)
+            elif key not in RESERVED_PARAMS and value and lookup(key) is not None:
+                if str(lookup(key)) != value:
+                    return(False)
+        return(True)
+
+    @staticmethod
+    def add_metrics(item, fields):
+        """
+        Fill in synthetic AMS series for temporal fields such as
+        metrics/cpu/cpu_user[start,end,step], as [[value, timestamp], ...].
+        """
+        name = ""
+        for category in ("Hosts", "ServiceComponentInfo", "ServiceInfo"):
+            if isinstance(item.get(category), dict):
+                name = str(sorted(item[category].items()))
+                break
+        for field in fields:
+            match = re.match(r"^metrics/(.+)\[(\d+),(\d+),(\d+)\]$", field)
+            if not match:
+                continue
+            path, start, end, step = match.groups()
+            seed = zlib.crc32((name + path).encode("utf-8")) % 1000
+            points = [[round(50 + 25 * math.sin(ts / 600.0 + seed) + seed % 7, 3), ts]
+                      for ts in range(int(start), int(end), int(step))]
+            node = item.setdefault("metrics", {})
+            keys = path.split("/")
+            for key in keys[:-1]:
+                node = node.setdefault(key, {})
+            node[keys[-1]] = points
+
+    def route(self, method, path, query, body):
+        """
+        Return (status, payload) for a request. Collections are paged on
+        page_size/from, and like Ambari they return only identifying keys
+        unless fields= asks for more.
+        """
+        status, data = self._route(method, path, query, body)
+        if not isinstance(data, dict):
+            return(status, data)
+        if "items" in data:
+            data["items"] = [i for i in data["items"] if self.matches(i, query)]
+        fields = query.get("fields")
+        if fields and fields != "*":
+            # Split on commas outside the [start,end,step] of temporal metrics
+            fields = re.findall(r"[^,\[]+(?:\[[^\]]*\])?", fields)
+            for item in data.get("items", [data]):
+                self.add_metrics(item, fields)
+            fields = [f.split("[")[0] for f in fields]
+        if fields and fields != "*" and "items" not in data:
+            data = self.project(data, fields)
+        if "items" in data:
+            if fields == "*":
+                pass
+            elif fields:
+                data["items"] = [self.project(i, fields) for i in data["items"]]
+            elif path.rstrip("/").split("/")[-1] not in ("configurations",
+                                                         "service_config_versions"):
+                data["items"] = [self.project(i, []) for i in data["items"]]
+            if "sortBy" in query:
+                # e.g. sortBy=Requests/id.desc
+                key, _, order = query["sortBy"].rpartition(".")
+                if order not in ("asc", "desc"):
+                    key, order = query["sortBy"], "asc"
+                def sort_key(item):
+                    for part in key.split("/"):
+                        item = item.get(part) if isinstance(item, dict) else None
+                    return((item is not None, item))
+                data["items"].sort(key=sort_key, reverse=order == "desc")
+            if "page_size" in query:
+                start = int(query.get("from", 0))
+                data["itemTotalCount"] = len(data["items"])
+                data["items"] = data["items"][start:start + int(query["page_size"])]
+        return(status, data)
+
+    def _route(self, method, path, query, body):
+        c = self.cluster
+        if path == "/jmx":
+            return(200, self.jmx(query.get("qry")))
+
+        prefix = "/api/v1/clusters/{}".format(c.cluster_name)
+        if not path.startswith(prefix):
+            return(404, {"status": 404, "message": "Cluster not found"})
+        parts = [p for p in path[len(prefix):].split("/") if p]
+
+        if not parts:
+            if method == "PUT":
+                return(self.put_desired_configs(body))
+            if query.get("format") == "blueprint":
+                return(200, self.blueprint())
+            desired = dict((t, {"tag": tag}) for t, tag in c.desired.items())
+            data = {"Clusters": {"cluster_name": c.cluster_name, "desired_configs": desired}}
+            # Sub-resources are only built when fields= reaches into them
+            fields = query.get("fields", "")
+            if "services/" in fields:
+                data["services"] = self.cluster_services()
+            if "hosts/" in fields:
+                data["hosts"] = self.cluster_hosts()
+            return(200, data)
+
+        if parts[0] == "services":
+            return(self.services(method, parts[1:], body))
+        if parts[0] == "components":
+            return(self.components(parts[1:]))
+        if parts[0] == "hosts" and len(parts) == 1 and method == "POST":
+            return(self.add_host_components(body))
+        if parts[0] == "hosts" and len(parts) == 1:
+            return(self.hosts(query))
+        if parts[0] == "hosts" and len(parts) >= 3 and parts[2] == "host_components":
+            return(self.host_components(method, parts[1], parts[3:], body))
+        if parts[0] == "host_components":
+            return(self.all_host_components(method, query, body))
+        if parts[0] == "alert_definitions":
+            return(self.alert_definitions(method, parts[1:], body))
+        if parts[0] == "alerts":
+            return(200, {"items": [{"href": self.href("alerts", str(i)), "Alert": dict(a)}
+                                   for i, a in sorted(c.alerts.items())]})
+        if parts[0] == "requests" and method == "POST":
+            return(self.post_request(body))
+        if parts[0] == "requests" and len(parts) == 1:
+            items = []
+            for request_id in sorted(c.requests):
+                status, progress = c.request_status(request_id)
+                items.append({"href": self.href("requests", str(request_id)),
+                              "Requests": {"cluster_name": c.cluster_name, "id": request_id,
+                                           "request_status": status,
+                                           "progress_percent": progress}})
+            return(200, {"items": items})
+        if parts[0] == "requests" and len(parts) == 2:
+            request_id = int(parts[1])
+            if request_id not in c.requests:
+                return(404, {"status": 404, "message": "Request not found"})
+            status, progress = c.request_status(request_id)
+            return(200, {"Requests": {"id": request_id, "request_status": status,
+                                      "progress_percent": progress}})
+        if parts[:2] == ["configurations", "service_config_versions"]:
+            return(200, {"items": [dict(v, configurations=[dict(conf) for conf in
+                                                          v["configurations"]])
+                                   for v in c.service_config_versions]})
+        if parts[0] == "configurations":
+            props = c.configs.get((query.get("type"), query.get("tag")))
+            items = [] if props is None else [{"type": query["type"], "tag": query["tag"],
+                                               "properties": dict(props)}]
+            return(200, {"items": items})
+        return(404, {"status": 404, "message": "Not found"})
+
+    def alert_definitions(self, method, parts, body):
+        c = self.cluster
+        if method == "POST":
+            for item in body if isinstance(body, list) else [body]:
+                definition = item["AlertDefinition"]
+                if not definition.get("name") or any(
+                        d["name"] == definition["name"] for d in c.alert_definitions.values()):
+                    return(400, {"status": 400, "message": "Missing or duplicate name"})
+                c.add_alert_definition(definition)
+            return(201, None)
+        if parts:
+            definition = c.alert_definitions.get(int(parts[0]))
+            if definition is None:
+                return(404, {"status": 404, "message": "Alert definition not found"})
+            if method == "PUT":
+                definition.update(body["AlertDefinition"])
+                return(200, None)
+            return(200, {"href": self.href("alert_definitions", parts[0]),
+                         "AlertDefinition": dict(definition)})
+        return(200, {"items": [{"href": self.href("alert_definitions", str(i)),
+                                "AlertDefinition": dict(d)}
+                               for i, d in sorted(c.alert_definitions.items())]})
+
+    def services(self, method, parts, body):
+        c = self.cluster
+        names = parts[:1] if parts else sorted(c.service_state)
+        if any(n not in c.service_state for n in names):
+            return(404, {"status": 404, "message": "Service not found"})
+        if method == "PUT":
+            state = body["Body"]["ServiceInfo"]["state"]
+            for name in names:
+                c.service_state[name] = state
+                for host, hc in c.host_components.items():
+                    for comp in hc:
+                        if c.service_of[comp] == name:
+                            hc[comp] = state
+                            if state == "STARTED":
+                                c.stale.discard((host, comp))
+            return(202, c.new_request(body["RequestInfo"]["context"]))
+        items = [{"href": self.href("services", n),
+                  "ServiceInfo": {"cluster_name": c.cluster_name, "service_name": n,
+                                  "state": c.service_state[n],
+                                  "maintenance_state": "OFF",
+                                  "repository_state": "CURRENT",
+                                  "credential_store_enabled": False,
+                                  "credential_store_supported": False},
+                  "alerts_summary": {"CRITICAL": 0, "MAINTENANCE": 0, "OK": 4,
+                                     "UNKNOWN": 0, "WARNING": 0},
+                  "components": [{"ServiceComponentInfo": {"component_name": comp,
+                                                           "service_name": n}}
+                                 for comp in SERVICES[n]]} for n in names]
+        return(200, items[0] if parts else {"items": items})
+
+    def cluster_services(self):
+        """Services with their components, as nested under the cluster resource."""
+        c = self.cluster
+        return([{"ServiceInfo": {"cluster_name": c.cluster_name, "service_name": n,
+                                 "state": c.service_state[n]},
+                 "components": [{"ServiceComponentInfo": {
+                     "cluster_name": c.cluster_name, "component_name": comp,
+                     "service_name": n, "state": c.component_state(comp)}}
+                     for comp in SERVICES[n]]}
+                for n in sorted(c.service_state)])
+
+    def cluster_hosts(self):
+        """Hosts with their host components, as nested under the cluster resource."""
+        c = self.cluster
+        return([{"Hosts": {"cluster_name": c.cluster_name, "host_name": h},
+                 "host_components": [{"HostRoles": {"cluster_name": c.cluster_name,
+                                                    "component_name": comp,
+                                                    "host_name": h, "state": state}}
+                                     for comp, state in sorted(c.host_components[h].items())]}
+                for h in c.hosts])
+
+    def components(self, parts):
+        c = self.cluster
+        names = parts[:1] if parts else sorted(c.service_of)
+        if any(n not in c.service_of for n in names):
+            return(404, {"status": 404, "message": "Component not found"})
+        items = []
+        for n in names:
+            hosts = [h for h in c.hosts if n in c.host_components[h]]
+            started = [h for h in hosts if c.host_components[h][n] == "STARTED"]
+            items.append({"href": self.href("components", n),
+                          "ServiceComponentInfo": {
+                              "cluster_name": c.cluster_name,
+                              "component_name": n,
+                              "service_name": c.service_of[n],
+                              "state": c.component_state(n),
+                              "category": "MASTER" if n in MASTERS else "SLAVE",
+                              "total_count": len(hosts),
+                              "started_count": len(started),
+                              "installed_count": len(hosts) - len(started),
+                              "recovery_enabled": "false"},
+                          "host_components": [{"HostRoles": {"component_name": n,
+                                                             "host_name": h}}
+                                              for h in hosts]})
+        return(200, items[0] if parts else {"items": items})
+
+    def host_components(self, method, host, parts, body):
+        c = self.cluster
+        if host not in c.host_components:
+            return(404, {"status": 404, "message": "Host not found"})
+        hc = c.host_components[host]
+        if not parts:
+            items = [{"HostRoles": {"component_name": n, "host_name": host, "state": s}}
+                     for n, s in sorted(hc.items())]
+            return(200, {"items": items})
+        component = parts[0]
+        if method == "POST":
+            hc[component] = "INIT"
+            return(201, None)
+        if component not in hc:
+            return(404, {"status": 404, "message": "Host component not found"})
+        if method == "DELETE":
+            del hc[component]
+            c.stale.discard((host, component))
+            return(200, None)
+        if method == "PUT":
+            hc[component] = body["HostRoles"]["state"]
+            return(202, c.new_request(body["RequestInfo"]["context"]))
+        return(200, {"HostRoles": {"component_name": component, "host_name": host,
+                                   "state": hc[component]}})
+
+    def hosts(self, query):
+        """The hosts collection with their host_components."""
+        c = self.cluster
+        hosts = c.hosts
+        items = [{"href": self.href("hosts", h),
+                  "Hosts": {"cluster_name": c.cluster_name, "host_name": h,
+                            "cpu_count": 8, "ph_cpu_count": 8, "total_mem": 32880000,
+                            "os_type": "centos7", "os_arch": "x86_64",
+                            "host_state": "HEALTHY", "host_status": "HEALTHY",
+                            "maintenance_state": "OFF", "rack_info": "/default-rack",
+                            "ip": "10.0.{}.{}".format(i // 250, i % 250 + 1)},
+                  "host_components": [{"HostRoles": {"cluster_name": c.cluster_name,
+                                                     "component_name": n, "host_name": h,
+                                                     "state": st,
+                                                     "desired_state": st,
+                                                     "stale_configs": (h, n) in c.stale,
+                                                     "maintenance_state": "OFF"}}
+                                      for n, st in sorted(c.host_components[h].items())]}
+                 for i, h in enumerate(hosts)]
+        return(200, {"items": items})
+
+    def all_host_components(self, method, query, body):
+        """
+        The cluster-wide host_components collection, filtered by HostRoles/*
+        predicates. A PUT or DELETE acts on every host component matched.
+        """
+        c = self.cluster
+        items = []
+        for host in c.hosts:
+            for component, state in sorted(c.host_components[host].items()):
+                roles = {"cluster_name": c.cluster_name, "component_name": component,
+                         "host_name": host, "service_name": c.service_of[component],
+                         "state": state, "stale_configs": (host, component) in c.stale}
+                if self.matches({"HostRoles": roles}, query):
+                    items.append({"HostRoles": roles})
+        pairs = [(i["HostRoles"]["host_name"], i["HostRoles"]["component_name"]) for i in items]
+        if method == "DELETE":
+            for host, component in pairs:
+                del c.host_components[host][component]
+                c.stale.discard((host, component))
+            return(200, None)
+        if method == "PUT":
+            if not pairs:
+                return(200, None)
+            for host, component in pairs:
+                c.host_components[host][component] = body["Body"]["HostRoles"]["state"]
+            return(202, c.new_request(body["RequestInfo"]["context"]))
+        return(200, {"items": items})
+
+    def add_host_components(self, body):
+        """Add the body's host_components to the hosts matched by RequestInfo/query."""
+        c = self.cluster
+        query = dict(p.partition("=")[::2] for p in body["RequestInfo"]["query"].split("&"))
+        hosts = [h for h in c.hosts if self.matches({"Hosts": {"host_name": h}}, query)]
+        for item in body["Body"]["host_components"]:
+            if item["HostRoles"]["component_name"] not in c.service_of:
+                return(400, {"status": 400, "message": "Unknown component"})
+        for host in hosts:
+            for item in body["Body"]["host_components"]:
+                c.host_components[host][item["HostRoles"]["component_name"]] = "INIT"
+        return(201, None)
+
+    def post_request(self, body):
+        """Run a RESTART command against the body's resource filters."""
+        c = self.cluster
+        info = body["RequestInfo"]
+        if info.get("command") != "RESTART":
+            return(400, {"status": 400, "message": "Unsupported command"})
+        services = set()
+        for f in body.get("Requests/resource_filters", []):
+            services.add(c.service_of[f["component_name"]])
+            for host in f["hosts"].split(","):
+                c.stale.discard((host, f["component_name"]))
+                c.restarted += 1
+        # Restarting more services takes longer
+        return(202, c.new_request(info.get("context", ""), max(1, len(services))))
+
+    def put_desired_configs(self, body):
+        c = self.cluster
+        for item in body if isinstance(body, list) else [body]:
+            desired = item["Clusters"]["desired_config"]
+            owners, note = set(), ""
+            for conf in desired if isinstance(desired, list) else [desired]:
+                c.configs[(conf["type"], conf["tag"])] = dict(conf["properties"])
+                c.desired[conf["type"]] = conf["tag"]
+                note = conf.get("service_config_version_note", note)
+                if conf["type"] in CONFIG_OWNER:
+                    owners.add(CONFIG_OWNER[conf["type"]])
+                services = CONFIG_SERVICES.get(conf["type"], [])
+                for host, hc in c.host_components.items():
+                    c.stale.update((host, comp) for comp in hc
+                                   if c.service_of[comp] in services)
+            for service in sorted(owners):
+                c.new_service_config_version(service, note)
+        return(200, None)
+
+    def blueprint(self):
+        c = self.cluster
+        configurations = [{t: {"properties": dict(c.configs[(t, tag)])}}
+                          for t, tag in c.desired.items()]
+        groups = [{"name": "host_group_{}".format(i), "cardinality": "1",
+                   "components": [{"name": n} for n in sorted(c.host_components[h])]}
+                  for i, h in enumerate(c.hosts)]
+        return({"configurations": configurations, "host_groups": groups,
+                "Blueprints": {"stack_name": "HDP", "stack_version": "2.6"}})
+
+    def jmx(self, qry):
+        live = dict((h + ":50010", {"adminState": "In Service"}) for h in self.cluster.hosts)
+        now = time.time()
+        bean = {"name": qry or "Hadoop:service=NameNode,name=NameNodeInfo",
+                "LiveNodes": json.dumps(live),
+                "BytesWritten": int(now * 1000) % 1000000,
+                "BytesRead": int(now * 100) % 1000000,
+                "HeapMemoryUsage": {"used": 512 * 1024 * 1024, "max": 1024 * 1024 * 1024},
+                "ContainersRunning": len(self.cluster.requests) % 10}
+        return({"beans": [bean]})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a fake Ambari server.")
+    parser.add_argument("--cluster", default="fake", help="cluster name")
+    parser.add_argument("--hosts", type=int, default=5, help="number of hosts")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every request")
+    parser.add_argument("--request-duration", type=float, default=5.0,
+                        help="seconds an asynchronous request takes to complete")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests answered with an injected 500/503")
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="requests in flight before latency starts to grow")
+    parser.add_argument("--gzip-min-size", type=int, default=None,
+                        help="gzip responses of at least this many bytes (Ambari uses 10240)")
+    args = parser.parse_args()
+
+    server = FakeAmbari(args.cluster, args.hosts, args.latency, args.request_duration,
+                        port=args.port, error_rate=args.error_rate, capacity=args.capacity,
+                        gzip_min_size=args.gzip_min_size)
+    print("Fake Ambari for cluster {} with {} hosts on port {}".format(
+        args.cluster, args.hosts, server.port))
+    server.serve_forever()
@@ -0,0 +1,311 @@
+"""
+A persistent SQLite snapshot of a cluster's layout, states and configs.
+
+The snapshot holds services, components and host_components with their
+states, the desired config tags and the configuration bodies. A new
+process opens it without touching the network and can answer read-only
+questions offline in milliseconds. `refresh` brings it up to date with
+two cheap probes, the desired config tags and the requests newer than
+the last one seen, and only downloads what those show has changed:
+
+    snap = ClusterSnapshot("~/.ambari/dokcl3.db")
+    snap.refresh(amc)               # full download the first time only
+    snap.load_into(amc)             # seed the client's caches
+    snap.hosts_for("DATANODE")
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from topology_index import TopologyIndex
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS services (service_name TEXT PRIMARY KEY, state TEXT);
+CREATE TABLE IF NOT EXISTS components (component_name TEXT PRIMARY KEY,
+                                       service_name TEXT, state TEXT);
+CREATE TABLE IF NOT EXISTS host_components (host_name TEXT, component_name TEXT,
+                                            service_name TEXT, state TEXT,
+                                            stale_configs INTEGER,
+                                            PRIMARY KEY (host_name, component_name));
+CREATE INDEX IF NOT EXISTS host_components_by_component
+    ON host_components (component_name, state);
+CREATE TABLE IF NOT EXISTS desired_configs (type TEXT PRIMARY KEY, tag TEXT);
+CREATE TABLE IF NOT EXISTS configurations (type TEXT, tag TEXT, properties TEXT,
+                                           PRIMARY KEY (type, tag));
+"""
+
+# Request statuses after which a request can no longer change the cluster
+FINISHED_REQUEST_STATES = ("COMPLETED", "FAILED", "TIMEDOUT", "ABORTED", "SKIPPED_FAILED")
+
+# Request statuses of requests that have not finished yet
+OPEN_REQUEST_STATES = ("PENDING", "QUEUED", "IN_PROGRESS", "HOLDING", "HOLDING_FAILED",
+                       "HOLDING_TIMEDOUT")
+
+REQUEST_FIELDS = "Requests/id,Requests/request_status"
+
+HOST_COMPONENT_FIELDS = "HostRoles/service_name,HostRoles/state,HostRoles/stale_configs"
+
+
+class ClusterSnapshot(object):
+    """ Cluster state kept in a SQLite file between processes.
+
+        Attributes:
+            path: The SQLite file (":memory:" for a throwaway snapshot).
+            refreshes: Log of what each refresh fetched, newest last.
+    """
+
+    def __init__(self, path):
+        super(ClusterSnapshot, self).__init__()
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory and self.path != ":memory:" and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.refreshes = []
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _rows(self, sql, args=()):
+        with self._lock:
+            return(self._db.execute(sql, args).fetchall())
+
+    def _meta(self, key, default=None):
+        rows = self._rows("SELECT value FROM meta WHERE key = ?", (key,))
+        return(json.loads(rows[0][0]) if rows else default)
+
+    def _set_meta(self, db, key, value):
+        db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    # Refreshing
+
+    def refresh(self, client, full=False):
+        """
+        Bring the snapshot up to date from `client`.
+
+        The desired config tags and the requests since the last refresh are
+        always fetched; a first or full refresh fetches only the newest
+        request and the ones still running. Configuration bodies are downloaded only for new
+        tags. Service, component and host_component states are downloaded
+        only if the snapshot is empty, a config tag changed (stale flags
+        move) or a request started or finished since the last refresh.
+
+        Parameters
+        ----------
+        client : AmbariClient
+        full : bool,
+            Download everything regardless.
+
+        Returns
+        -------
+        fetched : list,
+            The parts that were downloaded again, e.g. ["configurations", "states"].
+        """
+        if self._meta("cluster_name") not in (None, client.cluster_name):
+            raise(ValueError("Snapshot {} is of cluster {}, not {}".format(
+                self.path, self._meta("cluster_name"), client.cluster_name)))
+        full = full or self._meta("refreshed_at") is None
+        fetched = []
+
+        tags = client.get_current_tags()
+        old_tags = self.desired_tags()
+        new_types = sorted(t for t in tags if old_tags.get(t) != tags[t])
+        missing = [(t, tags[t]) for t in sorted(tags) if not self._has_configuration(t, tags[t])]
+        bodies = [(t, tag, client.get_configurations(t, tag)["properties"]) for t, tag in missing]
+        if bodies:
+            fetched.append("configurations")
+
+        last_id = self._meta("last_request_id", 0)
+        open_ids = self._meta("open_requests", [])
+        if full:
+            # The states are downloaded anyway, so only the newest request id
+            # and the requests still running are needed, not the whole history
+            newest = next(client.iter_collection("requests", {"fields": REQUEST_FIELDS,
+                                                              "sortBy": "Requests/id.desc"},
+                                                 page_size=1), None)
+            requests = list(client.iter_collection(
+                "requests?Requests/request_status.in({})".format(",".join(OPEN_REQUEST_STATES)),
+                {"fields": REQUEST_FIELDS}))
+            if newest is not None:
+                requests.append(newest)
+        else:
+            since = min(open_ids) - 1 if open_ids else last_id
+            requests = list(client.iter_collection("requests?Requests/id>{}".format(since),
+                                                   {"fields": REQUEST_FIELDS}))
+        ids = [r["Requests"]["id"] for r in requests]
+        still_open = sorted(set(r["Requests"]["id"] for r in requests
+                                if r["Requests"].get("request_status")
+                                not in FINISHED_REQUEST_STATES))
+        # New requests, or ones that were running last time, may have changed states
+        moved = any(i > last_id for i in ids) or bool(open_ids)
+
+        states = None
+        if full or new_types or moved:
+            states = self._fetch_states(client)
+            fetched.append("states")
+
+        now = time.time()
+        with self._lock, self._db as db:
+            self._set_meta(db, "cluster_name", client.cluster_name)
+            db.execute("DELETE FROM desired_configs")
+            db.executemany("INSERT INTO desired_configs VALUES (?, ?)", sorted(tags.items()))
+            db.executemany("INSERT OR REPLACE INTO configurations VALUES (?, ?, ?)",
+                           [(t, tag, json.dumps(props)) for t, tag, props in bodies])
+            if states is not None:
+                self._write_states(db, *states)
+                self._set_meta(db, "states_at", now)
+            self._set_meta(db, "last_request_id", max(ids + [last_id]))
+            self._set_meta(db, "open_requests", still_open)
+            self._set_meta(db, "refreshed_at", now)
+
+        self.refreshes.append({"time": time.time(), "fetched": fetched,
+                               "changed_types": new_types, "requests": len(ids)})
+        return(fetched)
+
+    def _fetch_states(self, client):
+        services = [(i["ServiceInfo"]["service_name"], i["ServiceInfo"].get("state"))
+                    for i in client.iter_collection("services",
+                                                    {"fields": "ServiceInfo/state"})]
+        components = [(i["ServiceComponentInfo"]["component_name"],
+                       i["ServiceComponentInfo"].get("service_name"),
+                       i["ServiceComponentInfo"].get("state"))
+                      for i in client.iter_collection(
+                          "components",
+                          {"fields": "ServiceComponentInfo/service_name,ServiceComponentInfo/state"})]
+        host_components = [(i["HostRoles"]["host_name"], i["HostRoles"]["component_name"],
+                            i["HostRoles"].get("service_name"), i["HostRoles"].get("state"),
+                            int(bool(i["HostRoles"].get("stale_configs"))))
+                           for i in client.iter_host_components(HOST_COMPONENT_FIELDS)]
+        return(services, components, host_components)
+
+    @staticmethod
+    def _write_states(db, services, components, host_components):
+        db.execute("DELETE FROM services")
+        db.execute("DELETE FROM components")
+        db.execute("DELETE FROM host_components")
+        db.executemany("INSERT INTO services VALUES (?, ?)", services)
+        db.executemany("INSERT INTO components VALUES (?, ?, ?)", components)
+        db.executemany("INSERT INTO host_components VALUES (?, ?, ?, ?, ?)", host_components)
+
+    def _has_configuration(self, conf_name, tag):
+        return(bool(self._rows("SELECT 1 FROM configurations WHERE type = ? AND tag = ?",
+                               (conf_name, tag))))
+
+    def load_into(self, client):
+        """
+        Seed `client`'s services, components and topology index caches,
+        and its config cache with the current bodies, from the snapshot.
+        The topology caches are dated to when the states were downloaded,
+        so they expire after client.topology_ttl from then, not from now.
+        Does nothing if the snapshot was never refreshed.
+        """
+        fetched_at = self.states_at
+        if fetched_at is None:
+            return
+        client.seed_topology("services", self.services(), fetched_at)
+        client.seed_topology("components", self.components(), fetched_at)
+        client.seed_topology("topology_index", self.topology_index(), fetched_at)
+        for conf_name, tag in self.desired_tags().items():
+            properties = self.configuration(conf_name, tag)
+            if properties is not None:
+                client.config_cache.put(client.endpoint, conf_name, tag,
+                                        {"type": conf_name, "tag": tag,
+                                         "properties": properties})
+
+    # Offline queries
+
+    @property
+    def age(self):
+        """Seconds since the last refresh, or None if never refreshed."""
+        refreshed = self._meta("refreshed_at")
+        return(None if refreshed is None else time.time() - refreshed)
+
+    @property
+    def states_at(self):
+        """
+        time.time() the states were last downloaded, or None if never.
+        A refresh that finds no changes does not download them, and cannot
+        see components that went down without a request.
+        """
+        return(self._meta("states_at", self._meta("refreshed_at")))
+
+    def services(self):
+        return([r[0] for r in self._rows("SELECT service_name FROM services ORDER BY 1")])
+
+    def service_states(self):
+        """Return a dict of service name to state."""
+        return(dict(self._rows("SELECT service_name, state FROM services")))
+
+    def components(self, service=None):
+        if service is None:
+            rows = self._rows("SELECT component_name FROM components ORDER BY 1")
+        else:
+            rows = self._rows("SELECT component_name FROM components WHERE service_name = ? "
+                              "ORDER BY 1", (service,))
+        return([r[0] for r in rows])
+
+    def component_states(self, service=None):
+        """Return a list of (component, state), optionally of one service."""
+        if service is None:
+            return(self._rows("SELECT component_name, state FROM components ORDER BY 1"))
+        return(self._rows("SELECT component_name, state FROM components "
+                          "WHERE service_name = ? ORDER BY 1", (service,)))
+
+    def hosts(self):
+        return([r[0] for r in self._rows("SELECT DISTINCT host_name FROM host_components "
+                                         "ORDER BY 1")])
+
+    def hosts_for(self, component, state=None):
+        """Return the sorted hosts `component` is on, optionally only those in `state`."""
+        if state is None:
+            rows = self._rows("SELECT host_name FROM host_components "
+                              "WHERE component_name = ? ORDER BY 1", (component,))
+        else:
+            rows = self._rows("SELECT host_name FROM host_components "
+                              "WHERE component_name = ? AND state = ? ORDER BY 1",
+                              (component, state))
+        return([r[0] for r in rows])
+
+    def components_on(self, host):
+        """Return a dict of component to state for `host`."""
+        return(dict(self._rows("SELECT component_name, state FROM host_components "
+                               "WHERE host_name = ?", (host,))))
+
+    def stale(self):
+        """Return (service, component, host) for every host component with stale configs."""
+        return(self._rows("SELECT service_name, component_name, host_name FROM host_components "
+                          "WHERE stale_configs ORDER BY 1, 2, 3"))
+
+    def desired_tags(self):
+        """Return a dict of configuration group name to current tag."""
+        return(dict(self._rows("SELECT type, tag FROM desired_configs")))
+
+    def configuration(self, conf_name, tag=None):
+        """Return the properties of `conf_name` at `tag` (the current one by default), or None."""
+        if tag is None:
+            tag = self.desired_tags().get(conf_name)
+        rows = self._rows("SELECT properties FROM configurations WHERE type = ? AND tag = ?",
+                          (conf_name, tag))
+        return(json.loads(rows[0][0]) if rows else None)
+
+    def topology_index(self):
+        """Return a TopologyIndex of the snapshot's host components."""
+        index = TopologyIndex()
+        items = {}
+        for host, component, state in self._rows(
+                "SELECT host_name, component_name, state FROM host_components"):
+            items.setdefault(host, []).append({"HostRoles": {"component_name": component,
+                                                             "state": state}})
+        index.load({"Hosts": {"host_name": h}, "host_components": hc} for h, hc in items.items())
+        return(index)
@@ -0,0 +1,110 @@
+"""
+A cache of Ambari configuration bodies keyed by (cluster, type, tag).
+
+A configuration identified by a type and tag (e.g. hdfs-site, version1)
+never changes once Ambari has created it, so its body can be kept for the
+life of the cache without any invalidation. Tags are only unique within a
+cluster (every cluster starts at version1), so entries are namespaced by
+the cluster's API endpoint and one cache can be shared between clusters.
+Entries are held in memory with LRU eviction and, if a directory is
+given, written to disk, one subdirectory per cluster, so later processes
+can reuse them.
+"""
+import os
+import copy
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+
+class ConfigCache(object):
+    """ An LRU cache of configuration bodies, optionally persisted to disk.
+
+        Attributes:
+            maxsize: The maximum number of bodies held in memory.
+            cache_dir: Directory the bodies are persisted to, or None.
+            hits: Number of lookups answered from the cache.
+            misses: Number of lookups that were not in the cache.
+    """
+
+    def __init__(self, maxsize=128, cache_dir=None):
+        super(ConfigCache, self).__init__()
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _path(self, cluster, conf_name, tag):
+        name = "{}@{}.json".format(quote(conf_name, safe=""), quote(tag, safe=""))
+        return(os.path.join(self.cache_dir, quote(cluster, safe=""), name))
+
+    def get(self, cluster, conf_name, tag):
+        """
+        Return a copy of the cached body for (`conf_name`, `tag`) of
+        `cluster` (the client's endpoint), or None if it is not cached.
+        """
+        key = (cluster, conf_name, tag)
+        with self._lock:
+            conf = self._entries.pop(key, None)
+            if conf is not None:
+                self._entries[key] = conf
+                self.hits += 1
+                return(copy.deepcopy(conf))
+
+        if self.cache_dir:
+            path = self._path(cluster, conf_name, tag)
+            if os.path.exists(path):
+                with open(path) as f:
+                    conf = json.load(f)
+                self._store(key, conf)
+                with self._lock:
+                    self.hits += 1
+                return(copy.deepcopy(conf))
+
+        with self._lock:
+            self.misses += 1
+        return(None)
+
+    def put(self, cluster, conf_name, tag, conf):
+        """Cache the body `conf` of (`conf_name`, `tag`) of `cluster` (the client's endpoint)."""
+        conf = copy.deepcopy(conf)
+        self._store((cluster, conf_name, tag), conf)
+        if self.cache_dir:
+            path = self._path(cluster, conf_name, tag)
+            if not os.path.isdir(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    # Made by another thread or process in the meantime
+                    pass
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(conf, f)
+            os.rename(tmp, path)
+
+    def _store(self, key, conf):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = conf
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empty the in-memory cache. Files on disk are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        return(key in self._entries)
+
+    def __len__(self):
+        return(len(self._entries))
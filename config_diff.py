@@ -0,0 +1,110 @@
+"""
+Diffs of configuration property sets.
+
+A ConfigDiff holds the keys added, changed and removed between two
+property sets of a configuration group. Values are compared as strings,
+as Ambari stores them. Diffs of service_config_versions are computed
+locally from their embedded configurations, so a whole history can be
+compared from one paged request.
+"""
+
+
+class ConfigDiff(object):
+    """ The difference between two property sets of one configuration group.
+
+        Attributes:
+            conf_name: The configuration group, e.g. hdfs-site.
+            added: dict of key to new value for keys only in the new set.
+            changed: dict of key to (old value, new value).
+            removed: dict of key to old value for keys only in the old set.
+    """
+
+    def __init__(self, conf_name, added=None, changed=None, removed=None):
+        super(ConfigDiff, self).__init__()
+        self.conf_name = conf_name
+        self.added = added or {}
+        self.changed = changed or {}
+        self.removed = removed or {}
+
+    @classmethod
+    def between(cls, conf_name, old, new):
+        """Diff the property dicts `old` and `new`."""
+        old, new = old or {}, new or {}
+        added = dict((k, new[k]) for k in new if k not in old)
+        removed = dict((k, old[k]) for k in old if k not in new)
+        changed = dict((k, (old[k], new[k])) for k in new
+                       if k in old and str(old[k]) != str(new[k]))
+        return(cls(conf_name, added, changed, removed))
+
+    @property
+    def keys(self):
+        return(sorted(set(self.added) | set(self.changed) | set(self.removed)))
+
+    def __bool__(self):
+        return(bool(self.added or self.changed or self.removed))
+
+    __nonzero__ = __bool__
+
+    def __len__(self):
+        return(len(self.keys))
+
+    def summary(self):
+        """One line per key: `+ key = new`, `~ key: old -> new` or `- key`."""
+        lines = ["+ {} = {}".format(k, self.added[k]) for k in sorted(self.added)]
+        lines += ["~ {}: {} -> {}".format(k, *self.changed[k]) for k in sorted(self.changed)]
+        lines += ["- {}".format(k) for k in sorted(self.removed)]
+        return("\n".join("{} {}".format(self.conf_name, line) for line in lines))
+
+    def to_dict(self):
+        return({"conf_name": self.conf_name,
+                "added": dict(self.added),
+                "changed": dict((k, list(v)) for k, v in self.changed.items()),
+                "removed": dict(self.removed)})
+
+    def __repr__(self):
+        return("ConfigDiff({}, added={}, changed={}, removed={})".format(
+            self.conf_name, len(self.added), len(self.changed), len(self.removed)))
+
+
+def version_properties(version):
+    """
+    Return {conf_name: properties} of a service_config_versions item.
+    """
+    return(dict((conf["type"], conf.get("properties", {}))
+                for conf in version.get("configurations", [])))
+
+
+def diff_versions(old, new):
+    """
+    Diff two service_config_versions items group by group.
+
+    Returns
+    -------
+    diffs : dict,
+        Configuration group name to ConfigDiff, only for groups that differ.
+        A group missing from one version diffs against an empty set.
+    """
+    old_props, new_props = version_properties(old), version_properties(new)
+    diffs = {}
+    for conf_name in sorted(set(old_props) | set(new_props)):
+        diff = ConfigDiff.between(conf_name, old_props.get(conf_name), new_props.get(conf_name))
+        if diff:
+            diffs[conf_name] = diff
+    return(diffs)
+
+
+def diff_history(versions):
+    """
+    Diff each service_config_versions item against the one before it.
+    `versions` must be of one service, in any order.
+
+    Returns
+    -------
+    history : list,
+        (version number, note, {conf_name: ConfigDiff}) from the second
+        oldest version on.
+    """
+    versions = sorted(versions, key=lambda v: v["service_config_version"])
+    return([(new["service_config_version"], new.get("service_config_version_note", ""),
+             diff_versions(old, new))
+            for old, new in zip(versions, versions[1:])])
@@ -0,0 +1,232 @@
+"""
+An indexable space of cluster configurations.
+
+A ConfigSpace is declared as a list of Dimensions, each a setting (or a
+group of settings that change together) of one configuration group with
+its possible values. Every combination of values has an index, computed
+by mixed-radix rank/unrank in O(number of dimensions), so a configuration
+can be looked up from its index (and back) without listing the space.
+Exports stream row by row, and sampling never builds the full list.
+
+The last dimension varies fastest, matching itertools.product order.
+"""
+import sys
+import random
+import struct
+
+if sys.version_info.major == 2:
+    range = xrange  # noqa: F821
+
+
+class Dimension(object):
+    """ One axis of a ConfigSpace.
+
+        Attributes:
+            keys: Tuple of the configuration keys set by this dimension.
+            conf_group: The configuration group they belong to (e.g. yarn-site).
+            values: List of value tuples, one entry per key.
+    """
+
+    def __init__(self, keys, conf_group, values):
+        super(Dimension, self).__init__()
+        single = not isinstance(keys, (tuple, list))
+        self.keys = (keys,) if single else tuple(keys)
+        self.conf_group = conf_group
+        self.values = [(v,) if single else tuple(v) for v in values]
+        for v in self.values:
+            if len(v) != len(self.keys):
+                raise(ValueError("Value {} does not match keys {}".format(v, self.keys)))
+
+    @property
+    def name(self):
+        return(self.keys[0] if len(self.keys) == 1 else ",".join(self.keys))
+
+    def __len__(self):
+        return(len(self.values))
+
+
+class ConfigSpace(object):
+    """ The cartesian product of a list of Dimensions, indexed by mixed radix.
+
+        Attributes:
+            dimensions: The Dimensions, slowest varying first.
+            radices: Number of values of each dimension.
+            keys: Every configuration key, in column order.
+    """
+
+    def __init__(self, dimensions):
+        super(ConfigSpace, self).__init__()
+        self.dimensions = list(dimensions)
+        self.radices = [len(d) for d in self.dimensions]
+        self.keys = [k for d in self.dimensions for k in d.keys]
+        # Place value of each digit
+        self._weights = [1] * len(self.radices)
+        for i in reversed(range(len(self.radices) - 1)):
+            self._weights[i] = self._weights[i + 1] * self.radices[i + 1]
+        self._size = self._weights[0] * self.radices[0] if self.radices else 0
+
+    def __len__(self):
+        return(self._size)
+
+    def _check(self, index):
+        if not 0 <= index < self._size:
+            raise(IndexError("index {} out of range for a space of {}".format(index, self._size)))
+
+    def digits(self, index):
+        """Return the value position of each dimension for `index`."""
+        self._check(index)
+        return([(index // w) % r for w, r in zip(self._weights, self.radices)])
+
+    def index(self, digits):
+        """Return the index of the value positions `digits`."""
+        for d, r in zip(digits, self.radices):
+            if not 0 <= d < r:
+                raise(IndexError("digit {} out of range {}".format(d, r)))
+        return(sum(d * w for d, w in zip(digits, self._weights)))
+
+    def unrank(self, index):
+        """Return the configuration at `index` as a dict of key to value."""
+        config = {}
+        for dim, d in zip(self.dimensions, self.digits(index)):
+            config.update(zip(dim.keys, dim.values[d]))
+        return(config)
+
+    def rank(self, config):
+        """
+        Return the index of `config`, a dict of key to value covering every
+        key of the space. Values are compared as strings.
+        """
+        digits = []
+        for dim in self.dimensions:
+            value = tuple(str(config[k]) for k in dim.keys)
+            matches = [i for i, v in enumerate(dim.values)
+                       if tuple(str(x) for x in v) == value]
+            if not matches:
+                raise(ValueError("{} is not a value of {}".format(value, dim.name)))
+            digits.append(matches[0])
+        return(self.index(digits))
+
+    def changes(self, index):
+        """
+        Return the configuration at `index` grouped by configuration group,
+        {conf_group: {key: value}}, as taken by AmbariClient.put_new_confs.
+        """
+        changes = {}
+        for dim, d in zip(self.dimensions, self.digits(index)):
+            changes.setdefault(dim.conf_group, {}).update(zip(dim.keys, dim.values[d]))
+        return(changes)
+
+    def row(self, index):
+        """Return the values at `index` as a flat list in the order of self.keys."""
+        return(self._row(self.digits(index)))
+
+    def _row(self, digits):
+        return([v for dim, d in zip(self.dimensions, digits) for v in dim.values[d]])
+
+    def iter_digits(self, start=0, stop=None):
+        """Yield (index, digits) from `start` to `stop`, stepping like an odometer."""
+        stop = self._size if stop is None else min(stop, self._size)
+        if start >= stop:
+            return
+        digits = self.digits(start)
+        for index in range(start, stop):
+            yield index, digits
+            for i in reversed(range(len(digits))):
+                digits[i] += 1
+                if digits[i] < self.radices[i]:
+                    break
+                digits[i] = 0
+
+    def iter_rows(self, start=0, stop=None):
+        """Yield (index, row) from `start` to `stop` without materialising the space."""
+        for index, digits in self.iter_digits(start, stop):
+            yield index, self._row(digits)
+
+    def write_csv(self, f, start=0, stop=None, sep=","):
+        """Stream the index and values of every configuration to the file `f` as CSV."""
+        f.write("index" + sep + sep.join(self.keys) + "\n")
+        for index, row in self.iter_rows(start, stop):
+            f.write(str(index) + sep + sep.join(str(v) for v in row) + "\n")
+
+    def write_binary(self, f, start=0, stop=None, chunk=65536):
+        """
+        Stream the value positions of every configuration to the binary file
+        `f`: one unsigned byte per dimension (two if a dimension has more than
+        256 values), configurations back to back in index order.
+        """
+        fmt = "<{}{}".format(len(self.radices), "B" if max(self.radices) <= 256 else "H")
+        pack = struct.Struct(fmt).pack
+        buf = []
+        for _, digits in self.iter_digits(start, stop):
+            buf.append(pack(*digits))
+            if len(buf) >= chunk:
+                f.write(b"".join(buf))
+                buf = []
+        if buf:
+            f.write(b"".join(buf))
+
+    def gray_index(self, n):
+        """
+        Return the index of the `n`th configuration in reflected mixed-radix
+        Gray code order, where consecutive configurations differ in exactly
+        one dimension and the last dimension changes most often.
+        """
+        self._check(n)
+        digits = []
+        for w, r in zip(self._weights, self.radices):
+            d = (n // w) % r
+            # Each step of the higher dimensions reverses the direction of this one
+            digits.append(d if (n // (w * r)) % 2 == 0 else r - 1 - d)
+        return(self.index(digits))
+
+    def gray_rank(self, index):
+        """Return the position of `index` in Gray code order, the inverse of gray_index."""
+        n = 0
+        for d, r in zip(self.digits(index), self.radices):
+            n = n * r + (d if n % 2 == 0 else r - 1 - d)
+        return(n)
+
+    def changed(self, a, b):
+        """Return the Dimensions whose values differ between indices `a` and `b`."""
+        return([dim for dim, x, y in zip(self.dimensions, self.digits(a), self.digits(b))
+                if x != y])
+
+    def sample(self, k, seed=None):
+        """Return `k` distinct indices drawn uniformly without listing the space."""
+        rng = random.Random(seed)
+        return(sorted(rng.sample(range(self._size), k)))
+
+    def stratified(self, key, per_value, seed=None):
+        """
+        Return `per_value` distinct indices for every value of the dimension
+        holding `key`, so each of its values is equally represented.
+        """
+        rng = random.Random(seed)
+        pos = [i for i, d in enumerate(self.dimensions) if key in d.keys]
+        if not pos:
+            raise(ValueError("{} is not a key of the space".format(key)))
+        pos = pos[0]
+        others = self._size // self.radices[pos]
+        indices = []
+        for value in range(self.radices[pos]):
+            for rest in rng.sample(range(others), min(per_value, others)):
+                # Spread `rest` over the other dimensions, then fix this one
+                digits = []
+                for i in reversed(range(len(self.radices))):
+                    if i == pos:
+                        digits.append(value)
+                    else:
+                        digits.append(rest % self.radices[i])
+                        rest //= self.radices[i]
+                indices.append(self.index(list(reversed(digits))))
+        return(sorted(indices))
+
+    def __iter__(self):
+        for index, _ in self.iter_digits():
+            yield index
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        return(self.unrank(index))
+
@@ -0,0 +1,198 @@
+"""
+Run a series of configuration trials with as few restarts as possible.
+
+Every trial is a configuration of a ConfigSpace (the blueprint index by
+default). Trials are reordered so consecutive ones change few, and cheap,
+configuration groups: Gray code order changes one dimension at a time
+with the last dimension changing most often, so expensive settings (e.g.
+hdfs-site, which restarts HDFS, YARN and MapReduce2) go first in the
+space. Each trial is applied in one batched config update and only the
+host components Ambari flags as stale are restarted. One JSON line per
+trial goes to the log with its timings.
+
+    runner = ExperimentRunner(amc, log="trials.jsonl")
+    runner.run(BLUEPRINT_SPACE.sample(10), workload=run_benchmark)
+"""
+import time
+import json
+
+from make_blueprint_index import BLUEPRINT_SPACE
+
+
+def transition_cost(space, a, b, weights=None):
+    """
+    Cost of going from configuration `a` to `b`: the summed weight of the
+    configuration groups that change, each group weighing 1 unless given
+    in `weights`.
+    """
+    groups = set(dim.conf_group for dim in space.changed(a, b))
+    weights = weights or {}
+    return(sum(weights.get(g, 1) for g in groups))
+
+
+def order_trials(space, indices, method="auto", weights=None, start=None):
+    """
+    Order the configuration `indices` to keep the changes between
+    consecutive trials small.
+
+    Parameters
+    ----------
+    space : ConfigSpace
+    indices : list,
+        The configurations to run. Duplicates are dropped.
+    method : string,
+        "gray" sorts by position in the space's Gray code order.
+        "greedy" starts from `start` (or the first of the Gray order) and
+        repeatedly picks the cheapest next trial by transition_cost.
+        "auto" runs both and keeps the cheaper by schedule_cost.
+    weights : dict,
+        Configuration group to cost, for "greedy".
+    start : int,
+        The configuration the cluster is currently in, for "greedy".
+
+    Returns
+    -------
+    indices : list
+    """
+    if method not in ("auto", "gray", "greedy"):
+        raise(ValueError("Unknown method {}, use auto, gray or greedy".format(method)))
+    ordered = sorted(set(indices), key=space.gray_rank)
+    if method == "gray" or len(ordered) < 2:
+        return(ordered)
+    if method == "auto":
+        greedy = order_trials(space, ordered, "greedy", weights, start)
+        if schedule_cost(space, greedy, weights, start) < schedule_cost(space, ordered, weights, start):
+            return(greedy)
+        return(ordered)
+
+    remaining = list(ordered)
+    current = remaining.pop(0) if start is None else start
+    result = [] if start is not None else [current]
+    while remaining:
+        # min keeps the first of equal costs, so ties follow the Gray order
+        nxt = min(remaining, key=lambda i: transition_cost(space, current, i, weights))
+        remaining.remove(nxt)
+        result.append(nxt)
+        current = nxt
+    return(result)
+
+
+def schedule_cost(space, indices, weights=None, start=None):
+    """Total transition_cost of running `indices` in order, from `start` if given."""
+    path = ([start] if start is not None else []) + list(indices)
+    return(sum(transition_cost(space, a, b, weights) for a, b in zip(path, path[1:])))
+
+
+class ExperimentRunner(object):
+    """ Applies configuration trials to a cluster and logs the results.
+
+        Attributes:
+            client: The AmbariClient the trials are run through.
+            space: The ConfigSpace the trial indices refer to.
+            log: Path of the JSON lines log, or None to only return records.
+            records: The records of the trials run so far.
+    """
+
+    def __init__(self, client, space=BLUEPRINT_SPACE, log=None):
+        super(ExperimentRunner, self).__init__()
+        self.client = client
+        self.space = space
+        self.log = log
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+        if self.log is not None:
+            with open(self.log, "a") as f:
+                f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def run_trial(self, index, previous=None, workload=None, **kwargs):
+        """
+        Apply configuration `index`, restart what went stale and run
+        workload(index, config) if given.
+
+        kwargs are passed to restart_stale (e.g. batch_size, timeout).
+        Returns the trial's record.
+        """
+        config = self.space.unrank(index)
+        record = {"index": index,
+                  "config": config,
+                  "changed_groups": sorted(self.space.changes(index)) if previous is None else
+                  sorted(set(d.conf_group for d in self.space.changed(previous, index))),
+                  "started": time.time(),
+                  "cluster": self.client.cluster_name,
+                  "error": None}
+        try:
+            start = time.time()
+            note, response = self.client.put_new_confs(self.space.changes(index))
+            if response is not None:
+                response.raise_for_status()
+            record["note"] = note
+            record["config_seconds"] = time.time() - start
+
+            start = time.time()
+            responses = self.client.restart_stale(**kwargs)
+            record["restart_requests"] = [self.client.get_request_id(r) for r in responses]
+            record["restart_seconds"] = time.time() - start
+
+            if workload is not None:
+                start = time.time()
+                record["result"] = workload(index, config)
+                record["workload_seconds"] = time.time() - start
+        except Exception as e:
+            record["error"] = "{}: {}".format(type(e).__name__, e)
+        record["seconds"] = time.time() - record["started"]
+        self.write(record)
+        return(record)
+
+    def run(self, indices, method="auto", weights=None, current=None, workload=None,
+            stop_on_error=True, **kwargs):
+        """
+        Run the trials `indices` in the order given by order_trials.
+
+        Parameters
+        ----------
+        indices : list,
+            Indices of the configurations to try.
+        method, weights :
+            Passed to order_trials.
+        current : int,
+            Index of the configuration the cluster is in now, if known.
+        workload : callable,
+            Called as workload(index, config) once the trial's restarts are
+            done; its return value is logged as the trial's result.
+        stop_on_error : bool,
+            Stop at the first trial that fails instead of carrying on.
+        kwargs :
+            Passed to restart_stale.
+
+        Returns
+        -------
+        records : list,
+            One record per trial run.
+        """
+        order = order_trials(self.space, indices, method, weights, current)
+        records = []
+        previous = current
+        for index in order:
+            record = self.run_trial(index, previous, workload, **kwargs)
+            records.append(record)
+            print("Trial {} of {}: configuration {} in {:.1f} s{}".format(
+                len(records), len(order), index, record["seconds"],
+                "" if record["error"] is None else " failed, " + record["error"]))
+            if record["error"] is not None and stop_on_error:
+                break
+            previous = index
+        return(records)
+
+    def summary(self, records=None):
+        """Return trial counts, timings and trials per hour of `records` (all so far by default)."""
+        records = self.records if records is None else records
+        seconds = sum(r["seconds"] for r in records)
+        return({"trials": len(records),
+                "failed": sum(1 for r in records if r["error"] is not None),
+                "seconds": seconds,
+                "config_seconds": sum(r.get("config_seconds", 0) for r in records),
+                "restart_seconds": sum(r.get("restart_seconds", 0) for r in records),
+                "restart_requests": sum(len(r.get("restart_requests", [])) for r in records),
+                "trials_per_hour": 3600.0 * len(records) / seconds if seconds else 0.0})
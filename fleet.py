@@ -0,0 +1,162 @@
+"""
+Run the same operation against many Ambari clusters at once.
+
+A Fleet holds one AmbariClient per cluster. All of them share a single
+pooled session and a single worker pool. Building the fleet makes no
+requests. An operation, given as a client method name or a callable
+taking the client, runs on every cluster concurrently. Each cluster's
+result comes back as soon as that cluster finishes. A failure on one
+cluster is captured in its result and does not affect the others, so a
+fleet-wide check takes about as long as the slowest cluster.
+
+    fleet = Fleet([{"name": "prod", "namenode": "nn1", "port": 8080, "cluster_name": "prod"},
+                   {"name": "dev", "namenode": "nn2", "port": 8080, "cluster_name": "dev"}],
+                  auth=cred, headers=hdrs)
+    for result in fleet.imap("get_all_service_states"):
+        print(result.name, result.error or result.value)
+"""
+import time
+from collections import OrderedDict, namedtuple
+from multiprocessing.pool import ThreadPool
+
+from ambari_client import AmbariClient
+
+# The outcome of an operation on one cluster; `error` is None on success
+FleetResult = namedtuple("FleetResult", ["name", "value", "error", "seconds"])
+
+
+class Fleet(object):
+    """ Many AmbariClients sharing one connection pool and worker pool.
+
+        Attributes:
+            clients: OrderedDict of cluster name to AmbariClient.
+            session: The requests.Session shared by every client.
+            processes: Number of clusters worked on at once.
+    """
+
+    def __init__(self, clusters, auth=None, headers=None, processes=16, pool_maxsize=4,
+                 keep_alive=True, compress=True, **client_kwargs):
+        """
+        Parameters
+        ----------
+        clusters : list,
+            One dict per cluster with namenode, port and cluster_name, and
+            optionally name (defaults to cluster_name), auth and headers
+            overriding the fleet-wide ones.
+        auth, headers :
+            Defaults for every cluster.
+        processes : int,
+            Size of the worker pool.
+        pool_maxsize : int,
+            Connections kept open per Ambari server.
+        keep_alive, compress : bool,
+            Passed to AmbariClient.make_session for the shared session.
+        client_kwargs :
+            Passed to every AmbariClient (e.g. timeout, retry, page_size).
+        """
+        super(Fleet, self).__init__()
+        clusters = list(clusters)
+        self.processes = processes
+        self.session = AmbariClient.make_session(pool_connections=max(1, len(clusters)),
+                                                 pool_maxsize=pool_maxsize,
+                                                 keep_alive=keep_alive, compress=compress)
+        self.clients = OrderedDict()
+        for cluster in clusters:
+            name = cluster.get("name", cluster["cluster_name"])
+            if name in self.clients:
+                raise(ValueError("Duplicate cluster name {}".format(name)))
+            self.clients[name] = AmbariClient(cluster["namenode"], cluster["port"],
+                                              cluster["cluster_name"],
+                                              cluster.get("auth", auth),
+                                              cluster.get("headers", headers),
+                                              session=self.session, **client_kwargs)
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(max(1, min(self.processes, len(self.clients))))
+        return(self._pool)
+
+    def __len__(self):
+        return(len(self.clients))
+
+    def __getitem__(self, name):
+        return(self.clients[name])
+
+    def close(self):
+        """Stop the worker pool and close the shared session."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self.session.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _call(self, name, operation, args, kwargs):
+        client = self.clients[name]
+        start = time.time()
+        try:
+            if callable(operation):
+                value = operation(client, *args, **kwargs)
+            else:
+                value = getattr(client, operation)(*args, **kwargs)
+            return(FleetResult(name, value, None, time.time() - start))
+        except Exception as e:
+            return(FleetResult(name, None, e, time.time() - start))
+
+    def imap(self, operation, *args, **kwargs):
+        """
+        Run `operation` on every cluster concurrently and yield a
+        FleetResult per cluster in the order they finish.
+
+        Parameters
+        ----------
+        operation : string or callable,
+            The name of an AmbariClient method, called with *args and
+            **kwargs, or a callable called as operation(client, *args, **kwargs).
+        names : list,
+            Keyword-only: run on these clusters only.
+        """
+        names = kwargs.pop("names", None) or list(self.clients)
+        for name in names:
+            if name not in self.clients:
+                raise(KeyError("Unknown cluster {}".format(name)))
+        return(self.pool.imap_unordered(lambda n: self._call(n, operation, args, kwargs),
+                                        names))
+
+    def map(self, operation, *args, **kwargs):
+        """Like imap, but wait for every cluster and return an OrderedDict of name to FleetResult."""
+        results = dict((r.name, r) for r in self.imap(operation, *args, **kwargs))
+        return(OrderedDict((n, results[n]) for n in self.clients if n in results))
+
+    # Common fleet-wide operations
+
+    def get_service_states(self):
+        """Return {cluster: FleetResult} of each cluster's {service: state}."""
+        return(self.map("get_all_service_states"))
+
+    def get_current_tags(self):
+        """Return {cluster: FleetResult} of each cluster's {config type: tag}."""
+        return(self.map("get_current_tags"))
+
+    def get_blueprints(self):
+        """Return {cluster: FleetResult} of each cluster's blueprint."""
+        return(self.map("get_blueprint"))
+
+    def put_new_confs(self, changes, names=None):
+        """
+        Push the same configuration `changes` to every cluster (or `names`),
+        returning {cluster: FleetResult} of (note, response).
+        """
+        return(self.map("put_new_confs", changes, names=names))
+
+    @staticmethod
+    def errors(results):
+        """Return {cluster: error} of the failed entries of a map() result."""
+        return(dict((n, r.error) for n, r in results.items() if r.error is not None))
@@ -0,0 +1,325 @@
+"""
+Per-call instrumentation for the AmbariClient request path.
+
+An Instrumentation object records every HTTP call the client makes:
+call counts and status codes, latency histograms and payload sizes per
+endpoint, and a tree of which client operation issued which calls.
+Pre and post hooks can be registered for tracing. The results can be
+exported as Prometheus text or as a structured summary.
+
+    inst = Instrumentation()
+    amc = AmbariClient(nnode, 8080, clr_name, cred, hdrs, instrumentation=inst)
+    amc.restart_stale()
+    print(inst.to_prometheus())
+"""
+import re
+import time
+import json
+import inspect
+import functools
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_CLUSTER_PATH = re.compile(r"^https?://[^/]+/api/v1/clusters/[^/?]+/?([^?]*)")
+_OTHER_PATH = re.compile(r"^https?://[^/]+(/[^?]*)?")
+
+
+def endpoint_name(url):
+    """
+    Reduce `url` to an endpoint label with resource ids replaced by `*`,
+    e.g. .../clusters/c1/hosts/h1/host_components/NAMENODE becomes
+    hosts/*/host_components/*. The cluster resource itself is `cluster`.
+    """
+    match = _CLUSTER_PATH.match(url)
+    if match is None:
+        match = _OTHER_PATH.match(url)
+        return((match.group(1) or "/") if match else url)
+
+    parts = [p for p in match.group(1).split("/") if p]
+    if not parts:
+        return("cluster")
+    # Collections and ids alternate: hosts/<id>/host_components/<id>
+    parts = [p if i % 2 == 0 else "*" for i, p in enumerate(parts)]
+    return("/".join(parts))
+
+
+class Histogram(object):
+    """A cumulative latency histogram with Prometheus-style buckets."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q):
+        """Estimate the `q` quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return(0.0)
+        rank = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return(bound)
+        return(self.max)
+
+
+class EndpointStats(object):
+    """Counters for one (method, endpoint) pair."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.calls = 0
+        self.statuses = {}
+        self.latency = Histogram(buckets)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def summary(self):
+        return({"calls": self.calls,
+                "statuses": dict((str(k), v) for k, v in self.statuses.items()),
+                "seconds_total": round(self.latency.sum, 6),
+                "seconds_max": round(self.latency.max, 6),
+                "seconds_p50": self.latency.quantile(0.5),
+                "seconds_p95": self.latency.quantile(0.95),
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received})
+
+
+class OperationNode(object):
+    """A node of the operation call tree."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.requests = 0
+        self.endpoints = {}
+        self.children = {}
+
+    def child(self, name):
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = OperationNode(name)
+        return(node)
+
+    def summary(self):
+        return({"name": self.name,
+                "calls": self.calls,
+                "seconds": round(self.seconds, 6),
+                "requests": self.requests,
+                "endpoints": dict(self.endpoints),
+                "children": [c.summary() for c in self.children.values()]})
+
+
+class Instrumentation(object):
+    """ Collects metrics for every HTTP call made through an AmbariClient.
+
+        Attributes:
+            buckets: Upper bounds of the latency histogram buckets.
+            endpoints: dict of (method, endpoint) to EndpointStats.
+            root: The OperationNode every top-level client operation hangs off.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        super(Instrumentation, self).__init__()
+        self.buckets = buckets
+        self._pre_hooks = []
+        self._post_hooks = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far. Hooks are kept."""
+        with self._lock:
+            self.endpoints = {}
+            self.root = OperationNode("root")
+
+    def add_hook(self, pre=None, post=None):
+        """
+        Register tracing hooks.
+
+        Parameters
+        ----------
+        pre : callable
+            Called as pre(method, url, kwargs) before each request.
+        post : callable
+            Called as post(method, url, response, seconds, error) after each
+            request; response is None and error the exception if it failed.
+        """
+        if pre is not None:
+            self._pre_hooks.append(pre)
+        if post is not None:
+            self._post_hooks.append(post)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = [self.root]
+        return(stack)
+
+    def operation(self, name, func, *args, **kwargs):
+        """Run func(*args, **kwargs) as operation `name` in the call tree."""
+        stack = self._stack()
+        with self._lock:
+            node = stack[-1].child(name)
+            node.calls += 1
+        stack.append(node)
+        start = time.time()
+        try:
+            return(func(*args, **kwargs))
+        finally:
+            stack.pop()
+            with self._lock:
+                node.seconds += time.time() - start
+
+    def call(self, send, method, url, **kwargs):
+        """Send a request with send(method, url, **kwargs) and record it."""
+        for hook in self._pre_hooks:
+            hook(method, url, kwargs)
+
+        response, error = None, None
+        start = time.time()
+        try:
+            response = send(method, url, **kwargs)
+            return(response)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            seconds = time.time() - start
+            self.record(method, url, response, seconds, kwargs.get("data"), error,
+                        kwargs.get("stream", False))
+            for hook in self._post_hooks:
+                hook(method, url, response, seconds, error)
+
+    def record(self, method, url, response, seconds, data=None, error=None, stream=False):
+        endpoint = endpoint_name(url)
+        if response is None:
+            status = type(error).__name__ if error is not None else "error"
+            received = 0
+        else:
+            status = response.status_code
+            if stream:
+                # The body has not been read yet, go by what the server announced
+                received = int(response.headers.get("Content-Length") or 0)
+            else:
+                received = len(response.content or b"")
+        sent = len(data) if data else 0
+
+        with self._lock:
+            stats = self.endpoints.get((method, endpoint))
+            if stats is None:
+                stats = self.endpoints[(method, endpoint)] = EndpointStats(self.buckets)
+            stats.calls += 1
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.latency.observe(seconds)
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+
+            node = self._stack()[-1]
+            node.requests += 1
+            key = "{} {}".format(method, endpoint)
+            node.endpoints[key] = node.endpoints.get(key, 0) + 1
+
+    def summary(self):
+        """Return a structured, JSON-serialisable summary of the run."""
+        with self._lock:
+            endpoints = []
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                entry = {"method": method, "endpoint": endpoint}
+                entry.update(stats.summary())
+                endpoints.append(entry)
+            return({"requests": sum(e["calls"] for e in endpoints),
+                    "seconds": round(sum(e["seconds_total"] for e in endpoints), 6),
+                    "endpoints": endpoints,
+                    "operations": [c.summary() for c in self.root.children.values()]})
+
+    def to_json(self, **kwargs):
+        return(json.dumps(self.summary(), **kwargs))
+
+    def to_prometheus(self, prefix="ambari_client"):
+        """Return the endpoint metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help_text))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+
+        def labels(**kw):
+            return(",".join('{}="{}"'.format(k, str(kw[k]).replace('"', '\\"'))
+                            for k in sorted(kw)))
+
+        with self._lock:
+            items = sorted(self.endpoints.items())
+
+            metric("requests_total", "counter", "HTTP requests made to Ambari.")
+            for (method, endpoint), stats in items:
+                for status, count in sorted(stats.statuses.items(), key=lambda s: str(s[0])):
+                    lines.append("{}_requests_total{{{}}} {}".format(
+                        prefix, labels(method=method, endpoint=endpoint, status=status), count))
+
+            metric("request_duration_seconds", "histogram", "Latency of Ambari requests.")
+            for (method, endpoint), stats in items:
+                hist = stats.latency
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append("{}_request_duration_seconds_bucket{{{}}} {}".format(
+                        prefix, labels(method=method, endpoint=endpoint, le=bound), count))
+                lines.append("{}_request_duration_seconds_bucket{{{}}} {}".format(
+                    prefix, labels(method=method, endpoint=endpoint, le="+Inf"), hist.count))
+                lines.append("{}_request_duration_seconds_sum{{{}}} {}".format(
+                    prefix, labels(method=method, endpoint=endpoint), hist.sum))
+                lines.append("{}_request_duration_seconds_count{{{}}} {}".format(
+                    prefix, labels(method=method, endpoint=endpoint), hist.count))
+
+            metric("request_bytes_total", "counter", "Request body bytes sent to Ambari.")
+            for (method, endpoint), stats in items:
+                lines.append("{}_request_bytes_total{{{}}} {}".format(
+                    prefix, labels(method=method, endpoint=endpoint), stats.bytes_sent))
+
+            metric("response_bytes_total", "counter", "Response body bytes received from Ambari.")
+            for (method, endpoint), stats in items:
+                lines.append("{}_response_bytes_total{{{}}} {}".format(
+                    prefix, labels(method=method, endpoint=endpoint), stats.bytes_received))
+
+        return("\n".join(lines) + "\n")
+
+
+# Request path and response parsing methods, not recorded as operations
+TRANSPORT_METHODS = ("query", "get", "put", "post", "delete", "close", "decode",
+                     "get_request_id")
+
+
+def instrument_operations(cls, skip=TRANSPORT_METHODS):
+    """
+    Class decorator wrapping the public methods of `cls` so that, when the
+    instance has an `instrumentation` object, each call is recorded as an
+    operation in its call tree. Generator functions and names in `skip`
+    are left alone. Calls made from worker threads hang off the root.
+    """
+    def wrap(name, func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            inst = getattr(self, "instrumentation", None)
+            if inst is None:
+                return(func(self, *args, **kwargs))
+            return(inst.operation(name, func, self, *args, **kwargs))
+        return(wrapper)
+
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or name in skip:
+            continue
+        if not inspect.isfunction(attr) or inspect.isgeneratorfunction(attr):
+            continue
+        setattr(cls, name, wrap(name, attr))
+    return(cls)
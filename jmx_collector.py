@@ -0,0 +1,129 @@
+"""
+Cluster-wide JMX scraping.
+
+Scrapes the same JMX beans from many hosts concurrently, each with its own
+timeout, and gathers the values into a JmxTable: one column per metric with
+one row per host. Hosts that are slow or down end up in `errors` with empty
+values instead of holding up the rest of the sweep.
+"""
+import time
+
+
+class JmxTable(object):
+    """ Columnar host x metric results of a JMX sweep.
+
+        Attributes:
+            hosts: The hosts scraped, in row order.
+            metrics: The metric names, in column order.
+            columns: dict of metric name to a list of values aligned with hosts.
+                Missing values are None.
+            errors: dict of host to the error that stopped it being scraped.
+            seconds: dict of host to how long scraping it took.
+    """
+
+    def __init__(self, hosts, metrics):
+        super(JmxTable, self).__init__()
+        self.hosts = list(hosts)
+        self.metrics = list(metrics)
+        self.columns = dict((m, [None] * len(self.hosts)) for m in self.metrics)
+        self.errors = {}
+        self.seconds = {}
+
+    def column(self, metric):
+        """Return the values of `metric`, one per host."""
+        return(self.columns[metric])
+
+    def row(self, host):
+        """Return a dict of metric name to value for `host`."""
+        i = self.hosts.index(host)
+        return(dict((m, self.columns[m][i]) for m in self.metrics))
+
+    @property
+    def ok_hosts(self):
+        return([h for h in self.hosts if h not in self.errors])
+
+    def to_csv(self, sep=","):
+        """Return the table as CSV text with a header row."""
+        lines = [sep.join(["host"] + self.metrics)]
+        for i, host in enumerate(self.hosts):
+            values = ["" if self.columns[m][i] is None else str(self.columns[m][i])
+                      for m in self.metrics]
+            lines.append(sep.join([host] + values))
+        return("\n".join(lines) + "\n")
+
+    def __len__(self):
+        return(len(self.hosts))
+
+
+def scrape_host(client, host, port, queries, timeout):
+    """
+    Fetch every bean query in `queries` from `host`.
+    Returns a dict of query to the list of beans it matched.
+    """
+    beans = {}
+    for qry in queries:
+        response = client.get_jmx(host=host, port=port, params=qry, timeout=timeout)
+        response.raise_for_status()
+        beans[qry] = client.decode(response).get("beans", [])
+    return(beans)
+
+
+def collect_jmx(client, metrics, hosts, port, timeout=5, processes=16):
+    """
+    Scrape `metrics` from every host in `hosts` concurrently.
+
+    Parameters
+    ----------
+    client : AmbariClient
+        The client whose session and instrumentation the requests go through.
+    metrics : dict
+        Metric name to a (bean query, attribute) pair, e.g.
+        {"bytes_written": ("Hadoop:service=DataNode,name=DataNodeActivity-*",
+                           "BytesWritten")}.
+        Each distinct bean query costs one request per host.
+    hosts : list
+        The hosts to scrape.
+    port : int
+        The JMX port on the hosts (50075 for DataNodes, 8042 for NodeManagers).
+    timeout : float
+        Seconds each request may take before the host is given up on.
+    processes : int
+        Number of hosts scraped at once.
+
+    Returns
+    -------
+    table : JmxTable
+    """
+    names = sorted(metrics)
+    table = JmxTable(hosts, names)
+    queries = sorted(set(metrics[m][0] for m in names))
+
+    def scrape(host):
+        start = time.time()
+        try:
+            beans = scrape_host(client, host, port, queries, timeout)
+            return(host, beans, None, time.time() - start)
+        except Exception as e:
+            return(host, None, e, time.time() - start)
+
+    if not table.hosts:
+        return(table)
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(max(1, min(processes, len(table.hosts))))
+    try:
+        results = pool.map(scrape, table.hosts)
+    finally:
+        pool.close()
+
+    for i, (host, beans, error, seconds) in enumerate(results):
+        table.seconds[host] = seconds
+        if error is not None:
+            table.errors[host] = "{}: {}".format(type(error).__name__, error)
+            continue
+        for m in names:
+            qry, attribute = metrics[m]
+            for bean in beans[qry]:
+                if attribute in bean:
+                    table.columns[m][i] = bean[attribute]
+                    break
+    return(table)
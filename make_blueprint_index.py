@@ -2,35 +2,37 @@
 """
 Make an index file for the blueprints
 Converts each unique configuration to a number
-"""
-
-import itertools
-
-settings = [("dfs.replication", "hdfs-site"),
-            ("yarn.nodemanager.resource.memory-mb", "yarn-site"),
-            ("yarn.scheduler.minimum-allocation-mb", "yarn-site"),
-            ("hive.vectorized.execution.enabled", "hive-site"),
-            ("hive.vectorized.execution.reduce.enabled", "hive-site")]
-
-dfs = ["1", "2", "3", "4", "5"]
-yarn = [("2048", "682"),
-        ("2048", "1024"),
-        ("2816", "1280"),
-        ("2816", "1664")]
-hive1 = ["true", "false"]
-hive2 = ["true", "false"]
 
-combs = itertools.product(dfs, yarn, hive1, hive2)
-
-with open("./blueprint_index.txt", "w") as f:
-    f.write("index," + ",".join([i[0] for i in settings]) + "\n")
-    for idx, obj in enumerate(combs):
-        idx, obj = str(idx), list(obj)
-
-        yarn_max, yarn_min = obj.pop(1)
-        obj.insert(1, yarn_min)
-        obj.insert(1, yarn_max)
-
-        line = idx + "," + ",".join(obj)
-        f.write(line + "\n")
+The index is computed from BLUEPRINT_SPACE, so BLUEPRINT_SPACE.unrank(i)
+gives configuration i (and rank goes back) without reading the file.
+"""
 
+import sys
+
+from config_space import Dimension, ConfigSpace
+
+BLUEPRINT_SPACE = ConfigSpace([
+    Dimension("dfs.replication", "hdfs-site",
+              ["1", "2", "3", "4", "5"]),
+    Dimension(("yarn.nodemanager.resource.memory-mb",
+               "yarn.scheduler.minimum-allocation-mb"), "yarn-site",
+              [("2048", "682"),
+               ("2048", "1024"),
+               ("2816", "1280"),
+               ("2816", "1664")]),
+    Dimension("hive.vectorized.execution.enabled", "hive-site",
+              ["true", "false"]),
+    Dimension("hive.vectorized.execution.reduce.enabled", "hive-site",
+              ["true", "false"])])
+
+
+if __name__ == '__main__':
+    # python make_blueprint_index.py [blueprint_index.txt | blueprint_index.bin]
+    filename = sys.argv[1] if len(sys.argv) > 1 else "./blueprint_index.txt"
+
+    if filename.endswith(".bin"):
+        with open(filename, "wb") as f:
+            BLUEPRINT_SPACE.write_binary(f)
+    else:
+        with open(filename, "w") as f:
+            BLUEPRINT_SPACE.write_csv(f)
@@ -0,0 +1,205 @@
+"""
+Retries and adaptive concurrency limiting for requests to Ambari.
+
+A RetryPolicy re-sends requests that failed for a transient reason
+(a 5xx or 409 answer, a timeout, a dropped connection), sleeping an
+exponentially growing, jittered delay between attempts. Only requests
+that are safe to repeat are retried after they may have reached the
+server: GET, PUT and DELETE are idempotent, while a POST (which starts
+a new Ambari request) is only retried when it certainly was not
+processed, i.e. the connection could not be made or Ambari answered
+503/429.
+
+An AdaptiveLimiter caps the number of requests in flight. Like TCP
+congestion control it grows the cap by one per round trip while the
+server keeps up (additive increase), and halves it when latency rises
+well above the best seen or the server answers with overload errors
+(multiplicative decrease), so parallel callers run as fast as the
+server allows without knocking it over.
+
+    amc = AmbariClient(nnode, 8080, clr_name, cred, hdrs,
+                       retry=RetryPolicy(max_attempts=5), limiter=AdaptiveLimiter())
+"""
+import time
+import random
+import threading
+
+import requests
+
+# Methods that can be repeated without changing the outcome
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+class RetryPolicy(object):
+    """ When and how long to wait before re-sending a failed request.
+
+        Attributes:
+            max_attempts: Total tries per request, 1 disables retrying.
+            backoff: Upper bound of the first delay in seconds; it doubles
+                on every further attempt.
+            max_backoff: Cap on a single delay in seconds.
+            retry_statuses: Statuses retried for idempotent requests.
+            unprocessed_statuses: Statuses meaning the server did not act on
+                the request, retried for any method.
+            deadline: If set, no retry starts later than this many seconds
+                after the first attempt.
+            retries: Number of retries made so far, for reporting.
+    """
+
+    def __init__(self, max_attempts=4, backoff=0.5, max_backoff=30.0,
+                 retry_statuses=(409, 500, 502, 503, 504),
+                 unprocessed_statuses=(429, 503), deadline=None, seed=None):
+        super(RetryPolicy, self).__init__()
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = tuple(retry_statuses)
+        self.unprocessed_statuses = tuple(unprocessed_statuses)
+        self.deadline = deadline
+        self.retries = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, attempt, response=None):
+        """
+        Seconds to wait before attempt number `attempt` + 1: a Retry-After
+        header if the server sent one, otherwise "full jitter", a uniform
+        draw up to backoff * 2 ** (attempt - 1) so that callers retrying
+        together spread out.
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return(min(float(retry_after), self.max_backoff))
+        with self._lock:
+            return(self._random.uniform(0, min(self.max_backoff,
+                                               self.backoff * 2 ** (attempt - 1))))
+
+    def should_retry(self, method, idempotent, response=None, error=None):
+        """Decide whether a request that got `response` or raised `error` is worth re-sending."""
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        if error is not None:
+            # Nothing was sent when the connection could not be made
+            if isinstance(error, requests.exceptions.ConnectTimeout):
+                return(True)
+            if isinstance(error, (requests.exceptions.Timeout,
+                                  requests.exceptions.ConnectionError)):
+                return(idempotent)
+            return(False)
+        if response.status_code in self.unprocessed_statuses:
+            return(True)
+        return(idempotent and response.status_code in self.retry_statuses)
+
+    def call(self, send, method, url, idempotent=None, **kwargs):
+        """
+        Send the request with send(method, url, **kwargs), retrying as the
+        policy allows. Returns the last response; if every attempt raised,
+        the last error is raised.
+
+        `idempotent` overrides the method's default, e.g. False for a PUT
+        that must not be repeated or True for a POST that is safe to.
+        """
+        start = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            response, error = None, None
+            try:
+                response = send(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = e
+
+            if attempt >= self.max_attempts or \
+                    not self.should_retry(method, idempotent, response, error):
+                break
+            wait = self.delay(attempt, response)
+            if self.deadline is not None and time.time() + wait - start > self.deadline:
+                break
+            if response is not None:
+                # Hand the connection back to the pool before sleeping
+                response.close()
+            with self._lock:
+                self.retries += 1
+            time.sleep(wait)
+
+        if error is not None:
+            raise error
+        return(response)
+
+
+class AdaptiveLimiter(object):
+    """ AIMD limit on concurrent requests, driven by observed latency.
+
+        Attributes:
+            limit: The current cap on requests in flight (may be fractional,
+                the whole part is enforced).
+            min_limit, max_limit: Bounds of the cap.
+            tolerance: A request is "slow" when it takes longer than
+                tolerance times the baseline latency.
+            decrease: Factor the cap is multiplied by on a slow or failed request.
+            overload_statuses: Statuses treated as the server being overloaded.
+            baseline: Estimate of the server's latency when not loaded.
+            inflight: Requests currently running.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, tolerance=2.0, decrease=0.5,
+                 overload_statuses=(429, 500, 502, 503, 504)):
+        super(AdaptiveLimiter, self).__init__()
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.decrease = decrease
+        self.overload_statuses = tuple(overload_statuses)
+        self.baseline = None
+        self.inflight = 0
+        # Requests started since the last decrease; one decrease per round trip
+        self._since_decrease = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a slot is free and take it."""
+        with self._cond:
+            while self.inflight >= max(1, int(self.limit)):
+                self._cond.wait()
+            self.inflight += 1
+            self._since_decrease += 1
+
+    def release(self, seconds, ok=True):
+        """Give the slot back, adjusting the limit on how the request went."""
+        with self._cond:
+            self.inflight -= 1
+            if ok:
+                if self.baseline is None or seconds < self.baseline:
+                    self.baseline = seconds
+                else:
+                    # Let the baseline drift up slowly in case the server got slower for good
+                    self.baseline += (seconds - self.baseline) * 0.01
+            congested = not ok or seconds > self.tolerance * max(self.baseline, 0.001)
+            if congested:
+                if self._since_decrease >= int(self.limit):
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._since_decrease = 0
+            else:
+                # Grows by about one per limit's worth of requests, i.e. per round trip
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def wrap(self, send):
+        """Return `send` running inside a slot of the limiter."""
+        def limited(method, url, **kwargs):
+            self.acquire()
+            start = time.time()
+            ok = False
+            try:
+                response = send(method, url, **kwargs)
+                ok = response.status_code not in self.overload_statuses
+                return(response)
+            finally:
+                self.release(time.time() - start, ok)
+        return(limited)
+
+    def summary(self):
+        return({"limit": round(self.limit, 2), "inflight": self.inflight,
+                "baseline_seconds": self.baseline})
@@ -0,0 +1,96 @@
+"""
+An in-memory index of which components run on which hosts.
+
+Built from a single `hosts?fields=host_components/HostRoles/...` request,
+it answers component -> hosts, host -> components and per-host state
+lookups without going back to Ambari. Hosts can be marked dirty after a
+change so only they are fetched again on the next refresh.
+"""
+import threading
+
+
+class TopologyIndex(object):
+    """ Host <-> component lookups with per-host component states.
+
+        Attributes:
+            host_components: dict of host name to a dict of component name to state.
+            component_hosts: dict of component name to the set of hosts it is on.
+            dirty: set of hosts whose entries need to be fetched again.
+    """
+
+    def __init__(self, items=None):
+        super(TopologyIndex, self).__init__()
+        self.host_components = {}
+        self.component_hosts = {}
+        self.dirty = set()
+        self._lock = threading.Lock()
+        if items is not None:
+            self.load(items)
+
+    @staticmethod
+    def parse(items):
+        """
+        Turn the items of a `hosts` response into a dict of
+        host name to a dict of component name to state.
+        """
+        hosts = {}
+        for i in items:
+            host = i["Hosts"]["host_name"]
+            hosts[host] = dict((hc["HostRoles"]["component_name"], hc["HostRoles"].get("state"))
+                               for hc in i.get("host_components", []))
+        return(hosts)
+
+    def load(self, items, hosts=None):
+        """
+        Replace the entries for the hosts in `items`. If `hosts` is given,
+        those hosts are also dropped when missing from `items`
+        (e.g. removed from the cluster).
+        """
+        parsed = self.parse(items)
+        with self._lock:
+            for host in set(parsed) | set(hosts or []):
+                self._drop_host(host)
+                self.dirty.discard(host)
+            for host, components in parsed.items():
+                self.host_components[host] = components
+                for component in components:
+                    self.component_hosts.setdefault(component, set()).add(host)
+
+    def _drop_host(self, host):
+        for component in self.host_components.pop(host, {}):
+            hosts = self.component_hosts.get(component)
+            if hosts is not None:
+                hosts.discard(host)
+                if not hosts:
+                    del self.component_hosts[component]
+
+    def mark_dirty(self, host):
+        """Flag `host` to be fetched again on the next refresh."""
+        with self._lock:
+            self.dirty.add(host)
+
+    @property
+    def hosts(self):
+        return(sorted(self.host_components))
+
+    def hosts_for(self, component, state=None):
+        """Return the sorted hosts `component` is on, optionally only those in `state`."""
+        hosts = self.component_hosts.get(component, ())
+        if state is not None:
+            hosts = [h for h in hosts if self.host_components[h].get(component) == state]
+        return(sorted(hosts))
+
+    def components_on(self, host):
+        """Return the sorted components on `host`."""
+        return(sorted(self.host_components.get(host, {})))
+
+    def state(self, host, component):
+        """Return the state of `component` on `host`, or None if it is not there."""
+        return(self.host_components.get(host, {}).get(component))
+
+    def has(self, component, host):
+        """Check is `component` on `host`."""
+        return(component in self.host_components.get(host, {}))
+
+    def __len__(self):
+        return(len(self.host_components))
@@ -0,0 +1,156 @@
+"""
+Watch a cluster for service, component and host component state changes.
+
+Each tick is a single request for the cluster resource, projected with
+fields= down to just the states being watched (e.g.
+services/ServiceInfo/state), so its cost does not grow with the number
+of entities watched. The last known states are kept in memory and only
+transitions are reported, as StateChange events, through a callback or
+an iterator. The interval shrinks back to `min_interval` when something
+changes and backs off towards `max_interval` while the cluster is quiet.
+
+    watch = amc.watch(scopes=("services", "host_components"))
+    for event in watch.events(timeout=600):
+        print(event)
+"""
+import time
+import threading
+from collections import namedtuple
+
+# fields= projection of the cluster resource for each scope
+SCOPE_FIELDS = {"services": "services/ServiceInfo/state",
+                "components": "services/components/ServiceComponentInfo/state",
+                "host_components": "hosts/host_components/HostRoles/state"}
+
+# A state transition. `key` is the service or component name, or a
+# (host, component) pair for host components. `old` is None for an entity
+# that appeared and `new` is None for one that disappeared.
+StateChange = namedtuple("StateChange", ["scope", "key", "old", "new", "time"])
+
+
+def parse_states(cluster, scopes):
+    """
+    Turn a projected cluster resource into {scope: {key: state}}
+    for each scope in `scopes`.
+    """
+    states = dict((scope, {}) for scope in scopes)
+    for service in cluster.get("services", []):
+        if "services" in states:
+            info = service["ServiceInfo"]
+            states["services"][info["service_name"]] = info.get("state")
+        if "components" in states:
+            for component in service.get("components", []):
+                info = component["ServiceComponentInfo"]
+                states["components"][info["component_name"]] = info.get("state")
+    if "host_components" in states:
+        for host in cluster.get("hosts", []):
+            for hc in host.get("host_components", []):
+                roles = hc["HostRoles"]
+                states["host_components"][(roles["host_name"], roles["component_name"])] = \
+                    roles.get("state")
+    return(states)
+
+
+def diff_states(scope, old, new, now=None):
+    """Return the StateChange events between two {key: state} dicts of `scope`."""
+    now = time.time() if now is None else now
+    return([StateChange(scope, key, old.get(key), new.get(key), now)
+            for key in sorted(set(old) | set(new), key=str)
+            if old.get(key) != new.get(key) or (key in old) != (key in new)])
+
+
+class Watch(object):
+    """ Polls the states of a cluster and reports what changed.
+
+        Attributes:
+            client: The AmbariClient polled through.
+            scopes: The kinds of entity watched, keys of SCOPE_FIELDS.
+            interval: Seconds until the next poll.
+            min_interval, max_interval: Bounds of the interval.
+            backoff: Factor the interval grows by after a poll with no change.
+            states: dict of scope to {key: last known state}, None before
+                the first poll.
+            polls: Number of polls made.
+    """
+
+    def __init__(self, client, scopes=("services", "components", "host_components"),
+                 min_interval=1.0, max_interval=30.0, backoff=1.5):
+        super(Watch, self).__init__()
+        for scope in scopes:
+            if scope not in SCOPE_FIELDS:
+                raise(ValueError("Unknown scope {}, use one of {}".format(
+                    scope, ", ".join(sorted(SCOPE_FIELDS)))))
+        self.client = client
+        self.scopes = tuple(scopes)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.states = None
+        self.polls = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def fields(self):
+        return(",".join(SCOPE_FIELDS[scope] for scope in self.scopes))
+
+    def poll(self):
+        """
+        Fetch the current states in one request, update self.states and
+        return the StateChange events since the previous poll. The first
+        poll only records the states and returns no events.
+        """
+        response = self.client.get(self.client.endpoint, params={"fields": self.fields})
+        response.raise_for_status()
+        now = time.time()
+        states = parse_states(self.client.decode(response), self.scopes)
+        self.polls += 1
+
+        events = []
+        if self.states is not None:
+            for scope in self.scopes:
+                events.extend(diff_states(scope, self.states[scope], states[scope], now))
+        self.states = states
+
+        if events:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return(events)
+
+    def events(self, timeout=None):
+        """
+        Yield StateChange events as they are seen, polling at the adaptive
+        interval, until `timeout` seconds have passed or stop() is called.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._stopped.is_set():
+            for event in self.poll():
+                yield event
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    return
+            self._stopped.wait(wait)
+
+    def run(self, callback, timeout=None):
+        """Call callback(event) for every StateChange until timeout or stop()."""
+        for event in self.events(timeout):
+            callback(event)
+
+    def start(self, callback):
+        """Run the watch with `callback` in a background daemon thread."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.run, args=(callback,))
+        self._thread.daemon = True
+        self._thread.start()
+        return(self)
+
+    def stop(self):
+        """Stop polling; a background thread finishes its current poll."""
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None